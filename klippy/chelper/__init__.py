@@ -41,7 +41,10 @@ defs_stepcompress = """
         , int32_t queue_step_msgtag, int32_t set_next_step_dir_msgtag);
     void stepcompress_set_invert_sdir(struct stepcompress *sc
         , uint32_t invert_sdir);
+    void stepcompress_set_compress_mode(struct stepcompress *sc, int mode);
     void stepcompress_free(struct stepcompress *sc);
+    int stepcompress_append_clocks(struct stepcompress *sc, int sdir
+        , uint64_t *clocks, int count);
     int stepcompress_reset(struct stepcompress *sc, uint64_t last_step_clock);
     int stepcompress_set_last_position(struct stepcompress *sc
         , uint64_t clock, int64_t last_position);
@@ -70,6 +73,8 @@ defs_itersolve = """
     double itersolve_check_active(struct stepper_kinematics *sk
         , double flush_time);
     int32_t itersolve_is_active_axis(struct stepper_kinematics *sk, char axis);
+    void itersolve_set_linear(struct stepper_kinematics *sk
+        , double x, double y, double z);
     void itersolve_set_trapq(struct stepper_kinematics *sk, struct trapq *tq);
     void itersolve_set_stepcompress(struct stepper_kinematics *sk
         , struct stepcompress *sc, double step_dist);
@@ -182,6 +187,12 @@ defs_serialqueue = """
     void serialqueue_send(struct serialqueue *sq, struct command_queue *cq
         , uint8_t *msg, int len, uint64_t min_clock, uint64_t req_clock
         , uint64_t notify_id);
+    int serialqueue_encode_and_send(struct serialqueue *sq
+        , struct command_queue *cq, uint32_t msgid, int64_t *data, int len
+        , uint64_t min_clock, uint64_t req_clock);
+    void serialqueue_send_multi(struct serialqueue *sq
+        , struct command_queue *cq, uint8_t *msgs, int *lens
+        , uint64_t *min_clocks, uint64_t *req_clocks, int count);
     void serialqueue_pull(struct serialqueue *sq
         , struct pull_queue_message *pqm);
     void serialqueue_set_wire_frequency(struct serialqueue *sq
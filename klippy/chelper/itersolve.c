@@ -4,7 +4,7 @@
 //
 // This file may be distributed under the terms of the GNU GPLv3 license.
 
-#include <math.h> // fabs
+#include <math.h> // fabs, sqrt
 #include <stddef.h> // offsetof
 #include <string.h> // memset
 #include "compiler.h" // __visible
@@ -128,6 +128,87 @@ itersolve_gen_steps_range(struct stepper_kinematics *sk, struct move *m
 }
 
 
+
+/****************************************************************
+ * Closed form solver for linear kinematics
+ ****************************************************************/
+
+// Generate step times for a portion of a move when the stepper
+// position is a linear combination of the toolhead axes.  The stepper
+// position is then quadratic in time and each step time can be
+// calculated directly.
+static int32_t
+itersolve_gen_steps_linear(struct stepper_kinematics *sk, struct move *m
+                           , double abs_start, double abs_end)
+{
+    double half_step = .5 * sk->step_dist;
+    double start = abs_start - m->print_time, end = abs_end - m->print_time;
+    if (start < 0.)
+        start = 0.;
+    if (end > m->move_t)
+        end = m->move_t;
+    double ratio = (sk->linear_x * m->axes_r.x + sk->linear_y * m->axes_r.y
+                    + sk->linear_z * m->axes_r.z);
+    double base = (sk->linear_x * m->start_pos.x
+                   + sk->linear_y * m->start_pos.y
+                   + sk->linear_z * m->start_pos.z);
+    double start_v = m->start_v, half_accel = m->half_accel;
+    double end_pos = base + ratio * (start_v + half_accel * end) * end;
+    if (start_v < 0. || (!start_v && half_accel < 0.)) {
+        // Travel in negative direction (eg, extruder retract)
+        ratio = -ratio;
+        start_v = -start_v;
+        half_accel = -half_accel;
+    }
+    int sdir = stepcompress_get_step_dir(sk->sc);
+    double commanded_pos = sk->commanded_pos;
+    int dir = ratio > 0.;
+    if (ratio && (dir == sdir || (fabs(end_pos - commanded_pos)
+                                  > half_step + .000000010))) {
+        // Steps occur as the position passes each half step boundary
+        double step_dist = dir ? sk->step_dist : -sk->step_dist;
+        double target = commanded_pos + .5 * step_dist;
+        double inv_ratio = 1. / ratio;
+        while (dir ? end_pos >= target : end_pos <= target) {
+            // Solve "half_accel*t^2 + start_v*t = dist" for t
+            double dist = (target - base) * inv_ratio, step_time = 0.;
+            if (dist > 0.) {
+                double disc = start_v * start_v + 4. * half_accel * dist;
+                if (disc < 0.)
+                    disc = 0.;
+                step_time = (dist + dist) / (start_v + sqrt(disc));
+            }
+            if (step_time < start)
+                step_time = start;
+            int ret = stepcompress_append(sk->sc, dir, m->print_time
+                                          , step_time);
+            if (ret)
+                return ret;
+            target += step_dist;
+            sdir = dir;
+        }
+        commanded_pos = target - .5 * step_dist;
+        sk->commanded_pos = commanded_pos;
+    }
+    if (sdir ? end_pos >= commanded_pos : end_pos <= commanded_pos)
+        // Avoid rollback if stepper fully reaches step position
+        stepcompress_commit(sk->sc);
+    if (sk->post_cb)
+        sk->post_cb(sk);
+    return 0;
+}
+
+// Generate step times for a portion of a move using the best solver
+static int32_t
+gen_steps_range(struct stepper_kinematics *sk, struct move *m
+                , double abs_start, double abs_end)
+{
+    if (sk->is_linear)
+        return itersolve_gen_steps_linear(sk, m, abs_start, abs_end);
+    return itersolve_gen_steps_range(sk, m, abs_start, abs_end);
+}
+
+
 /****************************************************************
  * Interface functions
  ****************************************************************/
@@ -170,16 +251,16 @@ itersolve_generate_steps(struct stepper_kinematics *sk, double flush_time)
                 while (--skip_count && pm->print_time > abs_start)
                     pm = list_prev_entry(pm, node);
                 do {
-                    int32_t ret = itersolve_gen_steps_range(sk, pm, abs_start
-                                                            , flush_time);
+                    int32_t ret = gen_steps_range(sk, pm, abs_start
+                                                  , flush_time);
                     if (ret)
                         return ret;
                     pm = list_next_entry(pm, node);
                 } while (pm != m);
             }
             // Generate steps for this move
-            int32_t ret = itersolve_gen_steps_range(sk, m, last_flush_time
-                                                    , flush_time);
+            int32_t ret = gen_steps_range(sk, m, last_flush_time
+                                          , flush_time);
             if (ret)
                 return ret;
             if (move_end >= flush_time) {
@@ -195,8 +276,8 @@ itersolve_generate_steps(struct stepper_kinematics *sk, double flush_time)
                 double abs_end = force_steps_time;
                 if (abs_end > flush_time)
                     abs_end = flush_time;
-                int32_t ret = itersolve_gen_steps_range(sk, m, last_flush_time
-                                                        , abs_end);
+                int32_t ret = gen_steps_range(sk, m, last_flush_time
+                                              , abs_end);
                 if (ret)
                     return ret;
                 skip_count = 1;
@@ -245,6 +326,18 @@ itersolve_set_trapq(struct stepper_kinematics *sk, struct trapq *tq)
     sk->tq = tq;
 }
 
+// Note that the stepper position is a linear combination of the
+// toolhead axes (which allows step times to be calculated directly)
+void __visible
+itersolve_set_linear(struct stepper_kinematics *sk
+                     , double x, double y, double z)
+{
+    sk->linear_x = x;
+    sk->linear_y = y;
+    sk->linear_z = z;
+    sk->is_linear = x || y || z;
+}
+
 void __visible
 itersolve_set_stepcompress(struct stepper_kinematics *sk
                            , struct stepcompress *sc, double step_dist)
@@ -40,12 +40,15 @@ cartesian_stepper_alloc(char axis)
     if (axis == 'x') {
         sk->calc_position_cb = cart_stepper_x_calc_position;
         sk->active_flags = AF_X;
+        itersolve_set_linear(sk, 1., 0., 0.);
     } else if (axis == 'y') {
         sk->calc_position_cb = cart_stepper_y_calc_position;
         sk->active_flags = AF_Y;
+        itersolve_set_linear(sk, 0., 1., 0.);
     } else if (axis == 'z') {
         sk->calc_position_cb = cart_stepper_z_calc_position;
         sk->active_flags = AF_Z;
+        itersolve_set_linear(sk, 0., 0., 1.);
     }
     return sk;
 }
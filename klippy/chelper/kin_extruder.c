@@ -128,8 +128,11 @@ extruder_set_pressure_advance(struct stepper_kinematics *sk
     double hst = smooth_time * .5;
     es->half_smooth_time = hst;
     es->sk.gen_steps_pre_active = es->sk.gen_steps_post_active = hst;
-    if (! hst)
+    if (! hst) {
+        itersolve_set_linear(&es->sk, 1., 0., 0.);
         return;
+    }
+    itersolve_set_linear(&es->sk, 0., 0., 0.);
     es->inv_half_smooth_time2 = 1. / (hst * hst);
     es->pressure_advance = pressure_advance;
 }
@@ -141,5 +144,6 @@ extruder_stepper_alloc(void)
     memset(es, 0, sizeof(*es));
     es->sk.calc_position_cb = extruder_calc_position;
     es->sk.active_flags = AF_X;
+    itersolve_set_linear(&es->sk, 1., 0., 0.);
     return &es->sk;
 }
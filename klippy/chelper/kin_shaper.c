@@ -156,6 +156,20 @@ shaper_xy_calc_position(struct stepper_kinematics *sk, struct move *m
     return is->orig_sk->calc_position_cb(is->orig_sk, &is->m, DUMMY_T);
 }
 
+// Use the closed form step solver if the original kinematics support
+// it and no shaping is applied
+static void
+shaper_note_linear(struct input_shaper *is)
+{
+    struct stepper_kinematics *osk = is->orig_sk;
+    if ((osk->linear_x && is->sx.num_pulses)
+        || (osk->linear_y && is->sy.num_pulses))
+        itersolve_set_linear(&is->sk, 0., 0., 0.);
+    else
+        itersolve_set_linear(&is->sk, osk->linear_x, osk->linear_y
+                             , osk->linear_z);
+}
+
 int __visible
 input_shaper_set_sk(struct stepper_kinematics *sk
                     , struct stepper_kinematics *orig_sk)
@@ -174,6 +188,7 @@ input_shaper_set_sk(struct stepper_kinematics *sk
     is->sk.commanded_pos = orig_sk->commanded_pos;
     is->sk.last_flush_time = orig_sk->last_flush_time;
     is->sk.last_move_time = orig_sk->last_move_time;
+    shaper_note_linear(is);
     return 0;
 }
 
@@ -208,6 +223,7 @@ input_shaper_set_shaper_params(struct stepper_kinematics *sk, char axis
     if (is->orig_sk->active_flags & (axis == 'x' ? AF_X : AF_Y)) {
         status = init_shaper(n, a, t, sp);
         shaper_note_generation_time(is);
+        shaper_note_linear(is);
     }
     return status;
 }
@@ -163,6 +163,26 @@ fail:
     return qm;
 }
 
+// Allocate a queue_message with a command id byte followed by a
+// series of encoded vlq integers (returns NULL if it does not fit)
+struct queue_message *
+message_alloc_and_encode_cmd(uint8_t msgid, uint32_t *data, int len)
+{
+    struct queue_message *qm = message_alloc();
+    uint8_t *p = qm->msg;
+    *p++ = msgid;
+    int i;
+    for (i=0; i<len; i++) {
+        p = encode_int(p, data[i]);
+        if (p > &qm->msg[MESSAGE_PAYLOAD_MAX]) {
+            message_free(qm);
+            return NULL;
+        }
+    }
+    qm->len = p - qm->msg;
+    return qm;
+}
+
 // Free the storage from a previous message_alloc() call
 void
 message_free(struct queue_message *qm)
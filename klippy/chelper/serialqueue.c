@@ -835,6 +835,50 @@ serialqueue_send(struct serialqueue *sq, struct command_queue *cq, uint8_t *msg
     serialqueue_send_one(sq, cq, qm);
 }
 
+// Encode a command with only integer parameters and schedule its
+// transmission (avoids the vlq encoding in the python code).  The
+// command id is sent as a single raw byte.  Returns -1 if the command
+// does not fit in a message block.
+int __visible
+serialqueue_encode_and_send(struct serialqueue *sq, struct command_queue *cq
+                            , uint32_t msgid, int64_t *data, int len
+                            , uint64_t min_clock, uint64_t req_clock)
+{
+    uint32_t idata[MESSAGE_PAYLOAD_MAX];
+    if (len > MESSAGE_PAYLOAD_MAX)
+        return -1;
+    int i;
+    for (i=0; i<len; i++)
+        idata[i] = data[i];
+    struct queue_message *qm = message_alloc_and_encode_cmd(msgid, idata, len);
+    if (!qm)
+        return -1;
+    qm->min_clock = min_clock;
+    qm->req_clock = req_clock;
+    serialqueue_send_one(sq, cq, qm);
+    return 0;
+}
+
+// Schedule the transmission of a series of messages stored back to
+// back in a single buffer (message 'i' is 'lens[i]' bytes long).
+void __visible
+serialqueue_send_multi(struct serialqueue *sq, struct command_queue *cq
+                       , uint8_t *msgs, int *lens, uint64_t *min_clocks
+                       , uint64_t *req_clocks, int count)
+{
+    struct list_head list;
+    list_init(&list);
+    int i;
+    for (i=0; i<count; i++) {
+        struct queue_message *qm = message_fill(msgs, lens[i]);
+        qm->min_clock = min_clocks[i];
+        qm->req_clock = req_clocks[i];
+        list_add_tail(&qm->node, &list);
+        msgs += lens[i];
+    }
+    serialqueue_send_batch(sq, cq, &list);
+}
+
 // Return a message read from the serial port (or wait for one if none
 // available)
 void __visible
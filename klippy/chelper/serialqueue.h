@@ -41,6 +41,13 @@ void serialqueue_send_one(struct serialqueue *sq, struct command_queue *cq
 void serialqueue_send(struct serialqueue *sq, struct command_queue *cq
                       , uint8_t *msg, int len, uint64_t min_clock
                       , uint64_t req_clock, uint64_t notify_id);
+int serialqueue_encode_and_send(struct serialqueue *sq
+                                , struct command_queue *cq, uint32_t msgid
+                                , int64_t *data, int len, uint64_t min_clock
+                                , uint64_t req_clock);
+void serialqueue_send_multi(struct serialqueue *sq, struct command_queue *cq
+                            , uint8_t *msgs, int *lens, uint64_t *min_clocks
+                            , uint64_t *req_clocks, int count);
 void serialqueue_pull(struct serialqueue *sq, struct pull_queue_message *pqm);
 void serialqueue_set_wire_frequency(struct serialqueue *sq, double frequency);
 void serialqueue_set_receive_window(struct serialqueue *sq, int receive_window);
@@ -33,6 +33,7 @@ struct stepcompress {
     uint32_t *queue, *queue_end, *queue_pos, *queue_next;
     // Internal tracking
     uint32_t max_error;
+    int compress_mode;
     double mcu_time_offset, mcu_freq, last_step_print_time;
     // Message generation
     uint64_t last_step_clock;
@@ -101,9 +102,68 @@ minmax_point(struct stepcompress *sc, uint32_t *pos)
 // using 11 works well in practice.
 #define QUADRATIC_DEV 11
 
-// Find a 'step_move' that covers a series of step times
+// Return the number of bytes needed to encode a value in a message
+static inline int
+encoded_size(int32_t v)
+{
+    if (v < (3L<<5)  && v >= -(1L<<5))  return 1;
+    if (v < (3L<<12) && v >= -(1L<<12)) return 2;
+    if (v < (3L<<19) && v >= -(1L<<19)) return 3;
+    if (v < (3L<<26) && v >= -(1L<<26)) return 4;
+    return 5;
+}
+
+// Return the approximate size of a queue_step command (the msgtag
+// and oid are typically one byte each)
+static inline int32_t
+move_size(int32_t interval, int32_t count, int32_t add)
+{
+    return 2 + encoded_size(interval) + encoded_size(count) + encoded_size(add);
+}
+
+static struct step_move compress_bisect_add(struct stepcompress *sc
+                                           , int mode);
+
+// Determine the number of bytes and steps covered by a 'step_move'
+// and the sequence that would follow it
+static void
+lookahead_cost(struct stepcompress *sc, struct step_move move
+               , int32_t *bytes, int32_t *steps)
+{
+    *bytes = move_size(move.interval, move.count, move.add);
+    *steps = move.count;
+    if (sc->queue_pos + move.count >= sc->queue_next)
+        return;
+    uint32_t *pos = sc->queue_pos;
+    uint64_t lsc = sc->last_step_clock;
+    int32_t addfactor = move.count*(move.count-1)/2;
+    sc->last_step_clock = lsc + move.add*addfactor + move.interval*move.count;
+    sc->queue_pos += move.count;
+    struct step_move next = compress_bisect_add(sc, SCM_EXACT);
+    sc->queue_pos = pos;
+    sc->last_step_clock = lsc;
+    *bytes += move_size(next.interval, next.count, next.add);
+    *steps += next.count;
+}
+
+// Choose between two candidate sequences by the number of bytes per
+// step needed to transmit them and the sequence that follows
 static struct step_move
-compress_bisect_add(struct stepcompress *sc)
+compress_lookahead(struct stepcompress *sc, struct step_move m1
+                   , struct step_move m2)
+{
+    int32_t bytes1, steps1, bytes2, steps2;
+    lookahead_cost(sc, m1, &bytes1, &steps1);
+    lookahead_cost(sc, m2, &bytes2, &steps2);
+    if (bytes1 * steps2 <= bytes2 * steps1)
+        return m1;
+    return m2;
+}
+
+// Find a 'step_move' that covers a series of step times (using the
+// SCM_EXACT or SCM_COMPACT search)
+static struct step_move
+compress_bisect_add(struct stepcompress *sc, int mode)
 {
     uint32_t *qlast = sc->queue_next;
     if (qlast > sc->queue_pos + 65535)
@@ -190,12 +250,70 @@ compress_bisect_add(struct stepcompress *sc)
             break;
         add = maxadd - (maxadd - minadd) / 4;
     }
+    if (mode == SCM_COMPACT && zerocount && bestadd
+        && zerocount < bestcount) {
+        struct step_move zmove = { zerointerval, zerocount, 0 };
+        struct step_move bmove = { bestinterval, bestcount, bestadd };
+        return compress_lookahead(sc, zmove, bmove);
+    }
     if (zerocount + zerocount/16 >= bestcount)
         // Prefer add=0 if it's similar to the best found sequence
         return (struct step_move){ zerointerval, zerocount, 0 };
     return (struct step_move){ bestinterval, bestcount, bestadd };
 }
 
+// Find the longest sequence with the given 'add'
+static struct step_move
+compress_extend(struct stepcompress *sc, uint32_t *qlast, int32_t add)
+{
+    struct points point = minmax_point(sc, sc->queue_pos);
+    int32_t mininterval = point.minp, maxinterval = point.maxp;
+    int32_t interval = maxinterval, count = 1;
+    while (&sc->queue_pos[count] < qlast) {
+        struct points nextpoint = minmax_point(sc, sc->queue_pos + count);
+        int32_t nextcount = count + 1, c = add*(nextcount*count/2);
+        if (mininterval*nextcount < nextpoint.minp - c)
+            mininterval = idiv_up(nextpoint.minp - c, nextcount);
+        if (maxinterval*nextcount > nextpoint.maxp - c)
+            maxinterval = idiv_down(nextpoint.maxp - c, nextcount);
+        if (mininterval > maxinterval)
+            break;
+        interval = maxinterval;
+        count = nextcount;
+    }
+    return (struct step_move){ interval, count, add };
+}
+
+// Find a 'step_move' using a single estimate of 'add' (instead of
+// searching for the best 'add' as compress_bisect_add() does)
+static struct step_move
+compress_greedy(struct stepcompress *sc)
+{
+    uint32_t *qlast = sc->queue_next;
+    if (qlast > sc->queue_pos + 65535)
+        qlast = sc->queue_pos + 65535;
+    struct step_move zmove = compress_extend(sc, qlast, 0);
+    int32_t avail = qlast - sc->queue_pos;
+    int32_t m = zmove.count + 1;
+    if (m > avail / 2)
+        m = avail / 2;
+    if (zmove.count >= avail || zmove.count > 0x200 || m < 1)
+        return zmove;
+
+    // The position after j steps is "j*interval + add*j*(j-1)/2", so
+    // "add" can be estimated from the positions after m and 2*m steps
+    uint32_t lsc = sc->last_step_clock;
+    int32_t p1 = sc->queue_pos[m-1] - lsc, p2 = sc->queue_pos[2*m-1] - lsc;
+    int32_t delta = p2 - 2*p1, add = idiv_down(delta + m*m/2, m*m);
+    if (!add || add < -0x8000 || add > 0x7fff)
+        return zmove;
+    struct step_move move = compress_extend(sc, qlast, add);
+    if (zmove.count + zmove.count/16 >= move.count)
+        // Prefer add=0 if it's similar to the estimated sequence
+        return zmove;
+    return move;
+}
+
 
 /****************************************************************
  * Step compress checking
@@ -264,6 +382,14 @@ stepcompress_fill(struct stepcompress *sc, uint32_t max_error
     sc->set_next_step_dir_msgtag = set_next_step_dir_msgtag;
 }
 
+// Set the strategy used to find step sequences (one of SCM_EXACT,
+// SCM_FAST, or SCM_COMPACT)
+void __visible
+stepcompress_set_compress_mode(struct stepcompress *sc, int mode)
+{
+    sc->compress_mode = mode;
+}
+
 // Set the inverted stepper direction flag
 void __visible
 stepcompress_set_invert_sdir(struct stepcompress *sc, uint32_t invert_sdir)
@@ -380,7 +506,9 @@ queue_flush(struct stepcompress *sc, uint64_t move_clock)
     if (sc->queue_pos >= sc->queue_next)
         return 0;
     while (sc->last_step_clock < move_clock) {
-        struct step_move move = compress_bisect_add(sc);
+        int mode = sc->compress_mode;
+        struct step_move move = (mode == SCM_FAST ? compress_greedy(sc)
+                                 : compress_bisect_add(sc, mode));
         int ret = check_line(sc, move);
         if (ret)
             return ret;
@@ -538,6 +666,24 @@ stepcompress_commit(struct stepcompress *sc)
     return 0;
 }
 
+// Add a series of step times (in mcu clock ticks) in one direction
+int __visible
+stepcompress_append_clocks(struct stepcompress *sc, int sdir
+                           , uint64_t *clocks, int count)
+{
+    int i;
+    for (i=0; i<count; i++) {
+        if (sc->next_step_clock) {
+            int ret = queue_append(sc);
+            if (ret)
+                return ret;
+        }
+        sc->next_step_clock = clocks[i];
+        sc->next_step_dir = sdir;
+    }
+    return stepcompress_commit(sc);
+}
+
 // Flush pending steps
 static int
 stepcompress_flush(struct stepcompress *sc, uint64_t move_clock)
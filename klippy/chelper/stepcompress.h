@@ -5,6 +5,8 @@
 
 #define ERROR_RET -989898989
 
+enum { SCM_EXACT, SCM_FAST, SCM_COMPACT };
+
 struct pull_history_steps {
     uint64_t first_clock, last_clock;
     int64_t start_position;
@@ -15,6 +17,7 @@ struct stepcompress *stepcompress_alloc(uint32_t oid);
 void stepcompress_fill(struct stepcompress *sc, uint32_t max_error
                        , int32_t queue_step_msgtag
                        , int32_t set_next_step_dir_msgtag);
+void stepcompress_set_compress_mode(struct stepcompress *sc, int mode);
 void stepcompress_set_invert_sdir(struct stepcompress *sc
                                   , uint32_t invert_sdir);
 void stepcompress_free(struct stepcompress *sc);
@@ -23,6 +26,8 @@ int stepcompress_get_step_dir(struct stepcompress *sc);
 int stepcompress_append(struct stepcompress *sc, int sdir
                         , double print_time, double step_time);
 int stepcompress_commit(struct stepcompress *sc);
+int stepcompress_append_clocks(struct stepcompress *sc, int sdir
+                               , uint64_t *clocks, int count);
 int stepcompress_reset(struct stepcompress *sc, uint64_t last_step_clock);
 int stepcompress_set_last_position(struct stepcompress *sc, uint64_t clock
                                    , int64_t last_position);
@@ -132,6 +132,27 @@ class ConfigWrapper:
         pconfig = self.printer.lookup_object("configfile")
         pconfig.deprecate(self.section, option, value, msg)
 
+# Cache of parsed config sections (keyed by the text of each section).
+# The cache is kept across restarts so that unchanged sections are not
+# parsed again.
+class ConfigParseCache:
+    def __init__(self):
+        self.sections = self.prev_sections = {}
+    def start_load(self):
+        # Entries not used during a load are dropped on the next load
+        self.prev_sections, self.sections = self.sections, {}
+    def lookup_section(self, data):
+        sections = self.sections.get(data)
+        if sections is None:
+            sections = self.prev_sections.get(data)
+            if sections is not None:
+                self.sections[data] = sections
+        return sections
+    def store_section(self, data, sections):
+        self.sections[data] = sections
+
+parse_cache = ConfigParseCache()
+
 AUTOSAVE_HEADER = """
 #*# <---------------------- SAVE_CONFIG ---------------------->
 #*# DO NOT EDIT THIS BLOCK OR BELOW. The contents are auto-generated.
@@ -150,9 +171,13 @@ class PrinterConfig:
         self.status_settings = {}
         self.status_warnings = []
         self.save_config_pending = False
+        self.access_tracking = {}
+        self.reload_handlers = {}
         gcode = self.printer.lookup_object('gcode')
         gcode.register_command("SAVE_CONFIG", self.cmd_SAVE_CONFIG,
                                desc=self.cmd_SAVE_CONFIG_help)
+        gcode.register_command("RELOAD_CONFIG", self.cmd_RELOAD_CONFIG,
+                               desc=self.cmd_RELOAD_CONFIG_help)
     def get_printer(self):
         return self.printer
     def _read_config_file(self, filename):
@@ -223,6 +248,59 @@ class PrinterConfig:
             fileconfig.read_file(sbuffer, filename)
         else:
             fileconfig.readfp(sbuffer, filename)
+    def _get_block_sections(self, pconfig):
+        sections = [(name, pconfig.items(name))
+                    for name in pconfig.sections()]
+        if pconfig.defaults():
+            sections.insert(0, (configparser.DEFAULTSECT,
+                                list(pconfig.defaults().items())))
+        return sections
+    def _add_block_sections(self, sections, fileconfig):
+        for section, options in sections:
+            if (section != configparser.DEFAULTSECT
+                and not fileconfig.has_section(section)):
+                fileconfig.add_section(section)
+            for option, value in options:
+                fileconfig.set(section, option, value)
+    def _parse_config_blocks(self, blocks, filename, fileconfig):
+        # Every block (other than the first) starts with a section header so
+        # that unchanged sections can be reused from the parse cache
+        block_data = ['\n'.join(block) for block in blocks]
+        block_sections = [parse_cache.lookup_section(data)
+                          for data in block_data]
+        missing = [i for i, sections in enumerate(block_sections)
+                   if sections is None]
+        try:
+            if missing:
+                # Parse all new sections with a single parser pass
+                pconfig = self._create_fileconfig()
+                self._parse_config_buffer([block_data[i] for i in missing],
+                                          filename, pconfig)
+                headers = [i for i in missing if i]
+                names = pconfig.sections()
+                if pconfig.defaults() or len(names) != len(headers):
+                    # Default or duplicate sections - parse each separately
+                    for i in missing:
+                        pconfig = self._create_fileconfig()
+                        self._parse_config_buffer([block_data[i]], filename,
+                                                  pconfig)
+                        block_sections[i] = self._get_block_sections(pconfig)
+                else:
+                    for i in missing:
+                        block_sections[i] = []
+                    for i, name in zip(headers, names):
+                        block_sections[i] = [(name, pconfig.items(name))]
+                for i in missing:
+                    parse_cache.store_section(block_data[i], block_sections[i])
+        except error as e:
+            # Report the error relative to the full buffer
+            lines = [l for block in blocks for l in block]
+            self._parse_config_buffer(lines, filename,
+                                      self._create_fileconfig())
+            raise
+        for sections in block_sections:
+            self._add_block_sections(sections, fileconfig)
+        del blocks[:]
     def _resolve_include(self, source_filename, include_spec, fileconfig,
                          visited):
         dirname = os.path.dirname(source_filename)
@@ -246,7 +324,7 @@ class PrinterConfig:
         lines = data.split('\n')
         # Buffer lines between includes and parse as a unit so that overrides
         # in includes apply linearly as they do within a single file
-        buffer = []
+        blocks = [[]]
         for line in lines:
             # Strip trailing comment
             pos = line.find('#')
@@ -256,20 +334,24 @@ class PrinterConfig:
             mo = configparser.RawConfigParser.SECTCRE.match(line)
             header = mo and mo.group('header')
             if header and header.startswith('include '):
-                self._parse_config_buffer(buffer, filename, fileconfig)
+                self._parse_config_blocks(blocks, filename, fileconfig)
+                blocks.append([])
                 include_spec = header[8:].strip()
                 self._resolve_include(filename, include_spec, fileconfig,
                                       visited)
             else:
-                buffer.append(line)
-        self._parse_config_buffer(buffer, filename, fileconfig)
+                if header:
+                    blocks.append([])
+                blocks[-1].append(line)
+        self._parse_config_blocks(blocks, filename, fileconfig)
         visited.remove(path)
-    def _build_config_wrapper(self, data, filename):
+    def _create_fileconfig(self):
         if sys.version_info.major >= 3:
-            fileconfig = configparser.RawConfigParser(
+            return configparser.RawConfigParser(
                 strict=False, inline_comment_prefixes=(';', '#'))
-        else:
-            fileconfig = configparser.RawConfigParser()
+        return configparser.RawConfigParser()
+    def _build_config_wrapper(self, data, filename):
+        fileconfig = self._create_fileconfig()
         self._parse_config(data, filename, fileconfig, set())
         return ConfigWrapper(self.printer, fileconfig, {}, 'printer')
     def _build_config_string(self, config):
@@ -281,6 +363,7 @@ class PrinterConfig:
                                           filename)
     def read_main_config(self):
         filename = self.printer.get_start_args()['config_file']
+        parse_cache.start_load()
         data = self._read_config_file(filename)
         regular_data, autosave_data = self._find_autosave_data(data)
         regular_config = self._build_config_wrapper(regular_data, filename)
@@ -289,27 +372,36 @@ class PrinterConfig:
         cfg = self._build_config_wrapper(regular_data + autosave_data, filename)
         return cfg
     def check_unused_options(self, config):
+        raw_config = self.validate_unused_options(config)
+        self.build_status(config, raw_config)
+    def validate_unused_options(self, config):
         fileconfig = config.fileconfig
         objects = dict(self.printer.lookup_objects())
         # Determine all the fields that have been accessed
-        access_tracking = dict(config.access_tracking)
+        access_tracking = config.access_tracking
+        autosave_options = {}
         for section in self.autosave.fileconfig.sections():
             for option in self.autosave.fileconfig.options(section):
-                access_tracking[(section.lower(), option.lower())] = 1
-        # Validate that there are no undefined parameters in the config file
+                autosave_options[(section.lower(), option.lower())] = 1
         valid_sections = { s: 1 for s, o in access_tracking }
+        valid_sections.update({ s: 1 for s, o in autosave_options })
+        # Validate that there are no undefined parameters in the config file
+        # (and gather the raw config for get_status() in the same pass)
+        raw_config = {}
         for section_name in fileconfig.sections():
             section = section_name.lower()
             if section not in valid_sections and section not in objects:
                 raise error("Section '%s' is not a valid config section"
                             % (section,))
-            for option in fileconfig.options(section_name):
-                option = option.lower()
-                if (section, option) not in access_tracking:
+            raw_config[section_name] = options = dict(
+                fileconfig.items(section_name))
+            for option in options:
+                acc_id = (section, option.lower())
+                if (acc_id not in access_tracking
+                    and acc_id not in autosave_options):
                     raise error("Option '%s' is not valid in section '%s'"
-                                % (option, section))
-        # Setup get_status()
-        self._build_status(config)
+                                % (acc_id[1], section))
+        return raw_config
     def log_config(self, config):
         lines = ["===== Config file =====",
                  self._build_config_string(config),
@@ -323,12 +415,10 @@ class PrinterConfig:
         self.status_warnings = self.runtime_warnings + self.deprecate_warnings
     def deprecate(self, section, option, value=None, msg=None):
         self.deprecated[(section, option, value)] = msg
-    def _build_status(self, config):
+    def build_status(self, config, raw_config):
+        self.access_tracking = config.access_tracking
         self.status_raw_config.clear()
-        for section in config.get_prefix_sections(''):
-            self.status_raw_config[section.get_name()] = section_status = {}
-            for option in section.get_prefix_options(''):
-                section_status[option] = section.get(option, note_valid=False)
+        self.status_raw_config.update(raw_config)
         self.status_settings = {}
         for (section, option), value in config.access_tracking.items():
             self.status_settings.setdefault(section, {})[option] = value
@@ -349,6 +439,50 @@ class PrinterConfig:
                 'warnings': self.status_warnings,
                 'save_config_pending': self.save_config_pending,
                 'save_config_pending_items': self.status_save_pending}
+    # Config reloading
+    def register_reload_handler(self, section, callback):
+        if section in self.reload_handlers:
+            raise error("Reload handler for '%s' already registered"
+                        % (section,))
+        self.reload_handlers[section] = callback
+    def lookup_reload_handler(self, section):
+        handler = self.reload_handlers.get(section)
+        if handler is None:
+            # Handlers may also be registered for a section prefix
+            handler = self.reload_handlers.get(section.split()[0] + ' ')
+        return handler
+    def read_reload_config(self):
+        config = self.read_main_config()
+        # Options accepted by the current config remain valid
+        config.access_tracking.update(self.access_tracking)
+        fileconfig = config.fileconfig
+        old_config = self.status_raw_config
+        changed = [s for s in fileconfig.sections()
+                   if dict(fileconfig.items(s)) != old_config.get(s)]
+        removed = [s for s in old_config if not fileconfig.has_section(s)]
+        return config, changed, removed
+    def check_reload_options(self, config, options):
+        section = config.get_name()
+        old_options = self.status_raw_config.get(section, {})
+        new_options = dict(config.fileconfig.items(section))
+        for option in sorted(set(old_options) | set(new_options)):
+            if (option not in options
+                and old_options.get(option) != new_options.get(option)):
+                raise error("Option '%s' in section '%s' can not be reloaded"
+                            " (use RESTART)" % (option, section))
+    cmd_RELOAD_CONFIG_help = "Reload changed config sections without a restart"
+    def cmd_RELOAD_CONFIG(self, gcmd):
+        if self.save_config_pending:
+            raise gcmd.error("Unable to reload config with SAVE_CONFIG pending")
+        try:
+            changed = self.printer.reload_config()
+        except error as e:
+            raise gcmd.error(str(e))
+        if not changed:
+            gcmd.respond_info("No config changes found")
+            return
+        gcmd.respond_info("Reloaded config sections: %s"
+                          % (", ".join(changed),))
     # Autosave functions
     def set(self, section, option, value):
         if not self.autosave.fileconfig.has_section(section):
@@ -14,11 +14,59 @@ SAMPLE_TIME = 0.001
 SAMPLE_COUNT = 8
 REPORT_TIME = 0.300
 RANGE_CHECK_COUNT = 4
+LOOKUP_MIN_SIZE = 1024
+LOOKUP_MAX_SIZE = 16384
+LOOKUP_TOLERANCE = 0.005
+LOOKUP_CHECK_STEPS = 8
+
+# Lookup table for fast conversion of adc values to temperatures
+class ADCLookupTable:
+    def __init__(self, calc_temp, min_adc, max_adc):
+        self.calc_temp = calc_temp
+        self.min_adc = min_adc
+        self.size = 0
+        self.scale = 0.
+        self.slopes = []
+        # Double the table size until the interpolation error is within
+        # tolerance (the table is not used if that is never reached)
+        size = LOOKUP_MIN_SIZE
+        while size <= LOOKUP_MAX_SIZE:
+            step = (max_adc - min_adc) / size
+            temps = [calc_temp(min_adc + i * step) for i in range(size + 1)]
+            slopes = [(t0, t1 - t0) for t0, t1 in zip(temps, temps[1:])]
+            if self._check_error(slopes, min_adc, step):
+                self.size = size
+                self.scale = 1. / step
+                self.slopes = slopes
+                return
+            size *= 2
+    def _check_error(self, slopes, min_adc, step):
+        # Compare with the exact conversion at several points within
+        # each table entry
+        calc_temp = self.calc_temp
+        fracs = [float(j) / LOOKUP_CHECK_STEPS
+                 for j in range(1, LOOKUP_CHECK_STEPS)]
+        for i, (temp, delta) in enumerate(slopes):
+            for frac in fracs:
+                t = calc_temp(min_adc + (i + frac) * step)
+                if abs(t - (temp + delta * frac)) > LOOKUP_TOLERANCE:
+                    return False
+        return True
+    def is_valid(self):
+        return self.size > 0
+    def lookup(self, adc):
+        pos = (adc - self.min_adc) * self.scale
+        if pos < 0. or pos >= self.size:
+            return self.calc_temp(adc)
+        index = int(pos)
+        temp, delta = self.slopes[index]
+        return temp + delta * (pos - index)
 
 # Interface between ADC and heater temperature callbacks
 class PrinterADCtoTemperature:
     def __init__(self, config, adc_convert):
         self.adc_convert = adc_convert
+        self.calc_temp = adc_convert.calc_temp
         ppins = config.get_printer().lookup_object('pins')
         self.mcu_adc = ppins.setup_pin('adc', config.get('sensor_pin'))
         self.mcu_adc.setup_adc_callback(REPORT_TIME, self.adc_callback)
@@ -29,13 +77,20 @@ class PrinterADCtoTemperature:
     def get_report_time_delta(self):
         return REPORT_TIME
     def adc_callback(self, read_time, read_value):
-        temp = self.adc_convert.calc_temp(read_value)
+        temp = self.calc_temp(read_value)
         self.temperature_callback(read_time + SAMPLE_COUNT * SAMPLE_TIME, temp)
     def setup_minmax(self, min_temp, max_temp):
         adc_range = [self.adc_convert.calc_adc(t) for t in [min_temp, max_temp]]
+        min_adc, max_adc = min(adc_range), max(adc_range)
         self.mcu_adc.setup_minmax(SAMPLE_TIME, SAMPLE_COUNT,
-                                  minval=min(adc_range), maxval=max(adc_range),
+                                  minval=min_adc, maxval=max_adc,
                                   range_check_count=RANGE_CHECK_COUNT)
+        # The table spans the same adc range as the mcu range check
+        if min_adc < max_adc:
+            table = ADCLookupTable(self.adc_convert.calc_temp,
+                                   min_adc, max_adc)
+            if table.is_valid():
+                self.calc_temp = table.lookup
 
 
 ######################################################################
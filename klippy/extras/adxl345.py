@@ -30,6 +30,16 @@ SCALE_Z  = 0.003906 * FREEFALL_ACCEL # 1 / 256 (at 3.3V) mg/LSB
 Accel_Measurement = collections.namedtuple(
     'Accel_Measurement', ('time', 'accel_x', 'accel_y', 'accel_z'))
 
+# Supported formats of raw accelerometer data files
+RAW_DATA_FORMATS = ['csv', 'npy']
+
+def get_raw_data_format(gcmd):
+    raw_format = gcmd.get("FORMAT", RAW_DATA_FORMATS[0]).lower()
+    if raw_format not in RAW_DATA_FORMATS:
+        raise gcmd.error("Unsupported FORMAT '%s', must be one of: %s"
+                         % (raw_format, ', '.join(RAW_DATA_FORMATS)))
+    return raw_format
+
 # Helper class to obtain measurements
 class AccelQueryHelper:
     def __init__(self, printer):
@@ -39,20 +49,46 @@ class AccelQueryHelper:
         self.request_start_time = self.request_end_time = print_time
         self.msgs = []
         self.samples = []
+        self.sample_handler = None
+        self.keep_samples = True
+        self.end_time_known = False
+        self.streamed_count = 0
+    def set_sample_handler(self, handler, keep_samples=True):
+        # Forward measurements within the requested time range to the
+        # handler as soon as they arrive
+        self.sample_handler = handler
+        self.keep_samples = keep_samples
     def finish_measurements(self):
         toolhead = self.printer.lookup_object('toolhead')
         self.request_end_time = toolhead.get_last_move_time()
+        self.end_time_known = True
         toolhead.wait_moves()
         self.is_finished = True
+    def _stream_samples(self, data):
+        start_time = self.request_start_time
+        if self.end_time_known:
+            end_time = self.request_end_time
+            samples = [s for s in data if start_time <= s[0] <= end_time]
+        else:
+            samples = [s for s in data if s[0] >= start_time]
+        if samples:
+            self.streamed_count += len(samples)
+            self.sample_handler(samples)
     def handle_batch(self, msg):
         if self.is_finished:
             return False
+        if self.sample_handler is not None:
+            self._stream_samples(msg['data'])
+            if not self.keep_samples:
+                return True
         if len(self.msgs) >= 10000:
             # Avoid filling up memory with too many samples
             return False
         self.msgs.append(msg)
         return True
     def has_valid_samples(self):
+        if not self.keep_samples:
+            return self.streamed_count > 0
         for msg in self.msgs:
             data = msg['data']
             first_sample_time = data[0][0]
@@ -92,9 +128,13 @@ class AccelQueryHelper:
                 os.nice(20)
             except:
                 pass
+            samples = self.samples or self.get_samples()
+            if filename.endswith('.npy'):
+                bulk_sensor.write_capture_file(
+                        filename, Accel_Measurement._fields, samples)
+                return
             f = open(filename, "w")
             f.write("#time,accel_x,accel_y,accel_z\n")
-            samples = self.samples or self.get_samples()
             for t, accel_x, accel_y, accel_z in samples:
                 f.write("%.6f,%.6f,%.6f,%.6f\n" % (
                     t, accel_x, accel_y, accel_z))
@@ -142,14 +182,16 @@ class AccelCommandHelper:
         name = gcmd.get("NAME", time.strftime("%Y%m%d_%H%M%S"))
         if not name.replace('-', '').replace('_', '').isalnum():
             raise gcmd.error("Invalid NAME parameter")
+        raw_format = get_raw_data_format(gcmd)
         bg_client = self.bg_client
         self.bg_client = None
         bg_client.finish_measurements()
         # Write data to file
         if self.base_name == self.name:
-            filename = "/tmp/%s-%s.csv" % (self.base_name, name)
+            filename = "/tmp/%s-%s.%s" % (self.base_name, name, raw_format)
         else:
-            filename = "/tmp/%s-%s-%s.csv" % (self.base_name, self.name, name)
+            filename = "/tmp/%s-%s-%s.%s" % (self.base_name, self.name, name,
+                                             raw_format)
         bg_client.write_to_file(filename)
         gcmd.respond_info("Writing raw accelerometer data to %s file"
                           % (filename,))
@@ -3,7 +3,7 @@
 # Copyright (C) 2020-2023  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, threading
+import logging, threading, struct, sys, array, itertools
 
 # This "bulk sensor" module facilitates the processing of sensor chip
 # measurements that do not require the host to respond with low
@@ -132,6 +132,55 @@ class BulkDataQueue:
         self.pull_samples()
 
 
+######################################################################
+# Capture files
+######################################################################
+
+# Raw measurements can be stored in a compact binary "capture file".
+# The file uses the NumPy ".npy" format: a short text header that
+# describes the columns, followed by the samples stored as an array of
+# little-endian doubles.  Tools can load (or memory map) the file with
+# numpy.load() without having to parse any text.
+
+CAPTURE_MAGIC = b'\x93NUMPY\x01\x00'
+CAPTURE_ALIGN = 64
+CAPTURE_CHUNK = 10000
+
+def _build_capture_header(columns, count):
+    descr = ", ".join(["('%s', '<f8')" % (col,) for col in columns])
+    header = "{'descr': [%s], 'fortran_order': False, 'shape': (%d,), }" % (
+        descr, count)
+    # Pad the header so that the sample data is aligned
+    hlen = len(CAPTURE_MAGIC) + 2 + len(header) + 1
+    header += ' ' * (-hlen % CAPTURE_ALIGN) + '\n'
+    return CAPTURE_MAGIC + struct.pack('<H', len(header)) + header.encode()
+
+# Write a list of sample tuples to a capture file (this is slow for
+# large captures, so it should be called from a background process)
+def write_capture_file(filename, columns, samples):
+    try:
+        with open(filename, 'wb') as f:
+            f.write(_build_capture_header(columns, len(samples)))
+            for i in range(0, len(samples), CAPTURE_CHUNK):
+                chunk = samples[i:i+CAPTURE_CHUNK]
+                data = array.array('d', itertools.chain.from_iterable(chunk))
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                data.tofile(f)
+    except (IOError, OSError) as e:
+        logging.exception("Unable to write capture file '%s'", filename)
+
+def is_capture_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(CAPTURE_MAGIC) - 2) == CAPTURE_MAGIC[:-2]
+
+# Load a capture file as a 2D array (without copying the sample data)
+def load_capture_file(numpy, filename):
+    data = numpy.load(filename, mmap_mode='r')
+    columns = data.dtype.names
+    return data.view(numpy.float64).reshape(len(data), len(columns)), columns
+
+
 ######################################################################
 # Clock synchronization
 ######################################################################
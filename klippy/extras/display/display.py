@@ -6,6 +6,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging, os, ast
+from .. import gcode_macro
 from . import hd44780, hd44780_spi, st7920, uc1701, menu
 
 # Normal time between each screen redraw
@@ -66,23 +67,44 @@ class DisplayGroup:
             items.append((row, col, c.get_name()))
         # Load all templates and store sorted by display position
         configs_by_name = {c.get_name(): c for c in data_configs}
-        printer = config.get_printer()
-        gcode_macro = printer.load_object(config, 'gcode_macro')
+        self.printer = printer = config.get_printer()
+        pgcode_macro = printer.load_object(config, 'gcode_macro')
         self.data_items = []
         for row, col, name in sorted(items):
             c = configs_by_name[name]
             if c.get('text'):
-                template = gcode_macro.load_template(c, 'text')
+                template = pgcode_macro.load_template(c, 'text')
                 self.data_items.append((row, col, template))
+        # Results of the last render of each item (deps, text, draw_calls)
+        self.render_cache = [(None, None, None)] * len(self.data_items)
     def show(self, display, templates, eventtime):
         context = self.data_items[0][2].create_template_context(eventtime)
-        context['draw_progress_bar'] = display.draw_progress_bar
+        status_wrapper = gcode_macro.TrackingStatusWrapper(self.printer,
+                                                           eventtime)
+        context['printer'] = status_wrapper
+        draw_calls = []
+        def draw_progress_bar(row, col, width, value):
+            draw_calls.append((row, col, width, value))
+            return display.draw_progress_bar(row, col, width, value)
+        context['draw_progress_bar'] = draw_progress_bar
         def render(name, **kwargs):
             return templates[name].render(context, **kwargs)
         context['render'] = render
-        for row, col, template in self.data_items:
-            text = template.render(context)
-            display.draw_text(row, col, text.replace('\n', ''), eventtime)
+        # Only render items whose status inputs have changed
+        render_cache = self.render_cache
+        for i, (row, col, template) in enumerate(self.data_items):
+            deps, text, calls = render_cache[i]
+            if status_wrapper.check_changed(deps):
+                render_cache[i] = (None, None, None)
+                status_wrapper.start_render()
+                draw_calls = []
+                text = template.render(context).replace('\n', '')
+                calls = draw_calls
+                render_cache[i] = (status_wrapper.finish_render(), text, calls)
+            else:
+                for call in calls:
+                    display.draw_progress_bar(*call)
+            display.draw_text(row, col, text, eventtime)
         context.clear() # Remove circular references for better gc
 
 # Global cache of DisplayTemplate, DisplayGroup, and glyphs
@@ -93,6 +115,9 @@ class PrinterDisplayTemplate:
         self.display_data_groups = {}
         self.display_glyphs = {}
         self.load_config(config)
+        pconfig = self.printer.lookup_object('configfile')
+        for prefix in ['display_template ', 'display_data ']:
+            pconfig.register_reload_handler(prefix, self._handle_reload)
     def get_display_templates(self):
         return self.display_templates
     def get_display_data_groups(self):
@@ -111,23 +136,16 @@ class PrinterDisplayTemplate:
         if len(glyph_data) != height:
             raise config.error("Glyph %s incorrect lines" % (glyph_name,))
         return glyph_data
-    def load_config(self, config):
-        # Load default display config file
-        pconfig = self.printer.lookup_object('configfile')
-        filename = os.path.join(os.path.dirname(__file__), 'display.cfg')
-        try:
-            dconfig = pconfig.read_config(filename)
-        except Exception:
-            raise self.printer.config_error("Cannot load config '%s'"
-                                            % (filename,))
+    def _load_templates(self, config, dconfig):
         # Load display_template sections
+        templates = {}
         dt_main = config.get_prefix_sections('display_template ')
         dt_main_names = { c.get_name(): 1 for c in dt_main }
         dt_def = [c for c in dconfig.get_prefix_sections('display_template ')
                   if c.get_name() not in dt_main_names]
         for c in dt_main + dt_def:
             dt = DisplayTemplate(c)
-            self.display_templates[dt.name] = dt
+            templates[dt.name] = dt
         # Load display_data sections
         dd_main = config.get_prefix_sections('display_data ')
         dd_main_names = { c.get_name(): 1 for c in dd_main }
@@ -140,9 +158,25 @@ class PrinterDisplayTemplate:
                 raise config.error("Section name '%s' is not valid"
                                    % (c.get_name(),))
             groups.setdefault(name_parts[1], []).append(c)
+        data_groups = {}
         for group_name, data_configs in groups.items():
             dg = DisplayGroup(config, group_name, data_configs)
-            self.display_data_groups[group_name] = dg
+            data_groups[group_name] = dg
+        return templates, data_groups
+    def _read_default_config(self):
+        pconfig = self.printer.lookup_object('configfile')
+        filename = os.path.join(os.path.dirname(__file__), 'display.cfg')
+        try:
+            return pconfig.read_config(filename)
+        except Exception:
+            raise self.printer.config_error("Cannot load config '%s'"
+                                            % (filename,))
+    def load_config(self, config):
+        # Load default display config file
+        dconfig = self._read_default_config()
+        templates, data_groups = self._load_templates(config, dconfig)
+        self.display_templates.update(templates)
+        self.display_data_groups.update(data_groups)
         # Load display glyphs
         dg_prefix = 'display_glyph '
         self.display_glyphs = icons = {}
@@ -164,6 +198,17 @@ class PrinterDisplayTemplate:
                 idata = self._parse_glyph(config, glyph_name, data, 5, 8)
                 icons.setdefault(glyph_name, {})['icon5x8'] = (slot, idata)
 
+    def _handle_reload(self, config, sections):
+        dconfig = self._read_default_config()
+        templates, data_groups = self._load_templates(config, dconfig)
+        def update():
+            # Users of the templates hold references to these dictionaries
+            self.display_templates.clear()
+            self.display_templates.update(templates)
+            self.display_data_groups.clear()
+            self.display_data_groups.update(data_groups)
+        return update
+
 def lookup_display_templates(config):
     printer = config.get_printer()
     dt = printer.lookup_object("display_template", None)
@@ -194,9 +239,9 @@ class PrinterLCD:
         if self.lcd_chip.get_dimensions()[0] == 20:
             dgroup = "_default_20x4"
         dgroup = config.get('display_group', dgroup)
-        self.show_data_group = self.display_data_groups.get(dgroup)
-        if self.show_data_group is None:
+        if dgroup not in self.display_data_groups:
             raise config.error("Unknown display_data group '%s'" % (dgroup,))
+        self.show_data_group = dgroup
         # Screen updating
         self.printer.register_event_handler("klippy:ready", self.handle_ready)
         self.screen_update_timer = self.reactor.register_timer(
@@ -231,7 +276,8 @@ class PrinterLCD:
                 return eventtime + REDRAW_TIME
         # Update normal display
         try:
-            self.show_data_group.show(self, self.display_templates, eventtime)
+            data_group = self.display_data_groups[self.show_data_group]
+            data_group.show(self, self.display_templates, eventtime)
         except:
             logging.exception("Error during display screen update")
         self.lcd_chip.flush()
@@ -262,10 +308,9 @@ class PrinterLCD:
     cmd_SET_DISPLAY_GROUP_help = "Set the active display group"
     def cmd_SET_DISPLAY_GROUP(self, gcmd):
         group = gcmd.get('GROUP')
-        new_dg = self.display_data_groups.get(group)
-        if new_dg is None:
+        if group not in self.display_data_groups:
             raise gcmd.error("Unknown display_data group '%s'" % (group,))
-        self.show_data_group = new_dg
+        self.show_data_group = group
 
 def load_config(config):
     return PrinterLCD(config)
@@ -0,0 +1,30 @@
+# Helper code for transmitting the changed parts of a framebuffer
+#
+# Copyright (C) 2018-2022  Kevin O'Connor <kevin@koconnor.net>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import re, binascii
+
+changed_r = re.compile(b'[^\x00]+')
+
+# Return a list of [pos, count] regions where 'new_data' differs from
+# 'old_data'. Changes within 'merge_dist' bytes of each other are
+# batched together (as long as the batched region is still small).
+def find_changes(new_data, old_data, merge_dist):
+    if new_data == old_data:
+        return []
+    # Locate changed bytes with an xor of the framebuffers (done on
+    # python integers so that no per-byte python code is run)
+    xor = (int(binascii.hexlify(new_data), 16)
+           ^ int(binascii.hexlify(old_data), 16))
+    xor_data = binascii.unhexlify('%0*x' % (2 * len(new_data), xor))
+    diffs = [[i, 1] for m in changed_r.finditer(xor_data)
+             for i in range(m.start(), m.end())]
+    # Batch together changes that are close to each other
+    for i in range(len(diffs)-2, -1, -1):
+        pos, count = diffs[i]
+        nextpos, nextcount = diffs[i+1]
+        if pos + merge_dist >= nextpos and nextcount < 16:
+            diffs[i][1] = nextcount + (nextpos - pos)
+            del diffs[i+1]
+    return diffs
@@ -7,6 +7,7 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
 from .. import bus
+from . import framebuffer
 
 LINE_LENGTH_DEFAULT=20
 LINE_LENGTH_OPTIONS={16:16, 20:20}
@@ -63,15 +64,7 @@ class hd44780_spi:
             if new_data == old_data:
                 continue
             # Find the position of all changed bytes in this framebuffer
-            diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
-                     if n != o]
-            # Batch together changes that are close to each other
-            for i in range(len(diffs)-2, -1, -1):
-                pos, count = diffs[i]
-                nextpos, nextcount = diffs[i+1]
-                if pos + 4 >= nextpos and nextcount < 16:
-                    diffs[i][1] = nextcount + (nextpos - pos)
-                    del diffs[i+1]
+            diffs = framebuffer.find_changes(new_data, old_data, 4)
             # Transmit changes
             for pos, count in diffs:
                 chip_pos = pos
@@ -17,6 +17,15 @@ class error(Exception):
     pass
 
 
+# Stand-in for option values that do not contain any template syntax
+class StaticTemplate:
+    def __init__(self, text):
+        self.text = text
+
+    def render(self, context=None):
+        return self.text
+
+
 # Scriptable menu element abstract baseclass
 class MenuElement(object):
     def __init__(self, manager, config, **kwargs):
@@ -33,12 +42,12 @@ class MenuElement(object):
         if config is not None:
             # overwrite class attributes from config
             self._index = config.getint('index', self._index)
-            self._name_tpl = manager.gcode_macro.load_template(
+            self._name_tpl = manager.load_template(
                 config, 'name', self._name)
             try:
                 self._enable = config.getboolean('enable', self._enable)
             except config.error:
-                self._enable_tpl = manager.gcode_macro.load_template(
+                self._enable_tpl = manager.load_template(
                     config, 'enable')
             # item namespace - used in relative paths
             self._ns = str(" ".join(config.get_name().split(' ')[1:])).strip()
@@ -77,7 +86,7 @@ class MenuElement(object):
         if isinstance(config, dict):
             self._scripts[name] = config.get(option, None)
         else:
-            self._scripts[name] = self.manager.gcode_macro.load_template(
+            self._scripts[name] = self.manager.load_template(
                 config, option, '')
 
     # override
@@ -245,6 +254,7 @@ class MenuContainer(MenuElement):
         self._allitems = []
         self._names = []
         self._items = []
+        self._pending = []
 
     def init(self):
         super(MenuContainer, self).init()
@@ -285,8 +295,10 @@ class MenuContainer(MenuElement):
             index = None
             if isinstance(item, str):
                 s = item.strip()
+                self._load_items()
                 index = self._names.index(s)
             elif isinstance(item, MenuElement):
+                self._load_items()
                 index = self._items.index(item)
             return index
         except ValueError:
@@ -346,9 +358,23 @@ class MenuContainer(MenuElement):
         self.send_event('populate', self)
 
     def update_items(self):
-        _a = [(item, name) for item, name in self._allitems
-              if item.is_enabled()]
-        self._items, self._names = zip(*_a) or ([], [])
+        # The enable state of items is evaluated on demand (only items
+        # up to the last one displayed or selected need to be checked)
+        self._items = []
+        self._names = []
+        self._pending = list(reversed(self._allitems))
+
+    def _load_items(self, count=None):
+        items, pending = self._items, self._pending
+        while pending and (count is None or len(items) < count):
+            item, name = pending.pop()
+            if item.is_enabled():
+                items.append(item)
+                self._names.append(name)
+
+    def _has_item(self, index):
+        self._load_items(index + 1)
+        return 0 <= index < len(self._items)
 
     # select methods
     def init_selection(self):
@@ -373,15 +399,15 @@ class MenuContainer(MenuElement):
         return self.selected
 
     def selected_item(self):
-        if isinstance(self.selected, int) and 0 <= self.selected < len(self):
-            return self[self.selected]
+        if isinstance(self.selected, int) and self._has_item(self.selected):
+            return self._items[self.selected]
         else:
             return None
 
     def select_next(self):
         if not isinstance(self.selected, int):
-            index = 0 if len(self) else None
-        elif 0 <= self.selected < len(self) - 1:
+            index = 0 if self._has_item(0) else None
+        elif 0 <= self.selected and self._has_item(self.selected + 1):
             index = self.selected + 1
         else:
             index = self.selected
@@ -389,8 +415,8 @@ class MenuContainer(MenuElement):
 
     def select_prev(self):
         if not isinstance(self.selected, int):
-            index = 0 if len(self) else None
-        elif 0 < self.selected < len(self):
+            index = 0 if self._has_item(0) else None
+        elif 0 < self.selected and self._has_item(self.selected):
             index = self.selected - 1
         else:
             index = self.selected
@@ -401,12 +427,18 @@ class MenuContainer(MenuElement):
         pass
 
     def __iter__(self):
+        self._load_items()
         return iter(self._items)
 
     def __len__(self):
+        self._load_items()
         return len(self._items)
 
     def __getitem__(self, key):
+        if isinstance(key, int) and key >= 0:
+            self._load_items(key + 1)
+        else:
+            self._load_items()
         return self._items[key]
 
     @property
@@ -441,11 +473,11 @@ class MenuInput(MenuCommand):
         if config is not None:
             # overwrite class attributes from config
             self._realtime = config.getboolean('realtime', self._realtime)
-            self._input_tpl = manager.gcode_macro.load_template(
+            self._input_tpl = manager.load_template(
                 config, 'input')
-            self._input_min_tpl = manager.gcode_macro.load_template(
+            self._input_min_tpl = manager.load_template(
                 config, 'input_min', str(self._input_min))
-            self._input_max_tpl = manager.gcode_macro.load_template(
+            self._input_max_tpl = manager.load_template(
                 config, 'input_max', str(self._input_max))
             self._input_step = config.getfloat(
                 'input_step', self._input_step, above=0.)
@@ -610,15 +642,17 @@ class MenuList(MenuContainer):
         else:
             self._viewport_top = 0
         # clamps viewport
-        self._viewport_top = max(0, min(self._viewport_top, len(self) - nrows))
+        if not self._has_item(self._viewport_top + nrows - 1):
+            self._viewport_top = len(self) - nrows
+        self._viewport_top = max(0, self._viewport_top)
         try:
             y = 0
             for row in range(self._viewport_top, self._viewport_top + nrows):
                 text = ""
                 prefix = ""
                 suffix = ""
-                if row < len(self):
-                    current = self[row]
+                if self._has_item(row):
+                    current = self._items[row]
                     selected = (row == selected_row)
                     if selected:
                         current.heartbeat(eventtime)
@@ -982,6 +1016,16 @@ class MenuManager:
                     self.children.setdefault(parent, []).append(
                         item.get_ns())
 
+    def load_template(self, config, option, default=None):
+        if default is None:
+            script = config.get(option)
+        else:
+            script = config.get(option, default)
+        if '{' not in script:
+            # Nothing to evaluate - avoid compiling the template
+            return StaticTemplate(script)
+        return self.gcode_macro.load_template(config, option, default)
+
     def lookup_menuitem(self, name, default=sentinel):
         if name is None:
             return None
@@ -5,9 +5,12 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 
-import logging
+import logging, math
 import json
 
+# Size of the cells of the object position lookup grid (in mm)
+GRID_SIZE = 20.
+
 class ExcludeObject:
     def __init__(self, config):
         self.printer = config.get_printer()
@@ -73,9 +76,18 @@ class ExcludeObject:
             self.gcode_move.reset_last_position()
 
     def _reset_state(self):
+        # Object definitions by name and their (min_x, min_y, max_x, max_y)
+        self.object_defs = {}
+        self.object_bounds = {}
+        self.objects_version = 0
+        # Status list and position lookup grid (rebuilt on demand)
         self.objects = []
+        self.objects_list_version = 0
+        self.grid = {}
+        self.grid_version = 0
         self.excluded_objects = []
         self.current_object = None
+        self.current_excluded = False
         self.in_excluded_region = False
 
     def _reset_file(self):
@@ -166,12 +178,21 @@ class ExcludeObject:
 
     def _test_in_excluded_region(self):
         # Inside cancelled object
-        return self.current_object in self.excluded_objects \
-            and self.initial_extrusion_moves == 0
+        return self.current_excluded and self.initial_extrusion_moves == 0
+
+    def _update_current_excluded(self):
+        self.current_excluded = self.current_object in self.excluded_objects
+
+    def _get_objects(self):
+        if self.objects_list_version != self.objects_version:
+            self.objects = [self.object_defs[name]
+                            for name in sorted(self.object_defs)]
+            self.objects_list_version = self.objects_version
+        return self.objects
 
     def get_status(self, eventtime=None):
         status = {
-            "objects": self.objects,
+            "objects": self._get_objects(),
             "excluded_objects": self.excluded_objects,
             "current_object": self.current_object
         }
@@ -196,9 +217,10 @@ class ExcludeObject:
                                     " as labeled"
     def cmd_EXCLUDE_OBJECT_START(self, gcmd):
         name = gcmd.get('NAME').upper()
-        if not any(obj["name"] == name for obj in self.objects):
+        if name not in self.object_defs:
             self._add_object_definition({"name": name})
         self.current_object = name
+        self._update_current_excluded()
         self.was_excluded_at_start = self._test_in_excluded_region()
 
     cmd_EXCLUDE_OBJECT_END_help = "Marks the end the current object"
@@ -214,12 +236,14 @@ class ExcludeObject:
                               (name.upper(), self.current_object))
 
         self.current_object = None
+        self.current_excluded = False
 
     cmd_EXCLUDE_OBJECT_help = "Cancel moves inside a specified objects"
     def cmd_EXCLUDE_OBJECT(self, gcmd):
         reset = gcmd.get('RESET', None)
         current = gcmd.get('CURRENT', None)
         name = gcmd.get('NAME', '').upper()
+        region = gcmd.get('REGION', None)
 
         if reset:
             if name:
@@ -227,6 +251,7 @@ class ExcludeObject:
 
             else:
                 self.excluded_objects = []
+                self.current_excluded = False
 
         elif name:
             if name.upper() not in self.excluded_objects:
@@ -239,6 +264,9 @@ class ExcludeObject:
             else:
                 self._exclude_object(self.current_object)
 
+        elif region:
+            self._exclude_region(gcmd, region)
+
         else:
             self._list_excluded_objects(gcmd)
 
@@ -271,14 +299,73 @@ class ExcludeObject:
             self._list_objects(gcmd)
 
     def _add_object_definition(self, definition):
-        self.objects = sorted(self.objects + [definition],
-                              key=lambda o: o["name"])
+        name = definition["name"]
+        self.object_defs[name] = definition
+        self.object_bounds.pop(name, None)
+        # Note the bounding box of the object for region lookups
+        points = definition.get('polygon')
+        if not points and 'center' in definition:
+            points = [definition['center']]
+        try:
+            xs = [float(p[0]) for p in points]
+            ys = [float(p[1]) for p in points]
+            self.object_bounds[name] = (min(xs), min(ys), max(xs), max(ys))
+        except (TypeError, ValueError, IndexError, KeyError):
+            pass
+        self.objects_version += 1
+
+    def _get_grid(self):
+        if self.grid_version != self.objects_version:
+            self.grid = grid = {}
+            for name, (min_x, min_y, max_x, max_y) in sorted(
+                    self.object_bounds.items()):
+                for gx in range(int(math.floor(min_x / GRID_SIZE)),
+                                int(math.floor(max_x / GRID_SIZE)) + 1):
+                    for gy in range(int(math.floor(min_y / GRID_SIZE)),
+                                    int(math.floor(max_y / GRID_SIZE)) + 1):
+                        grid.setdefault((gx, gy), []).append(name)
+            self.grid_version = self.objects_version
+        return self.grid
+
+    def _find_objects_in_region(self, min_x, min_y, max_x, max_y):
+        # Return the objects that are entirely inside the given region
+        grid = self._get_grid()
+        gx_range = range(int(math.floor(min_x / GRID_SIZE)),
+                         int(math.floor(max_x / GRID_SIZE)) + 1)
+        gy_range = range(int(math.floor(min_y / GRID_SIZE)),
+                         int(math.floor(max_y / GRID_SIZE)) + 1)
+        if len(gx_range) * len(gy_range) > len(grid):
+            candidates = self.object_bounds
+        else:
+            candidates = set([name for gx in gx_range for gy in gy_range
+                              for name in grid.get((gx, gy), ())])
+        found = []
+        for name in candidates:
+            b = self.object_bounds[name]
+            if (b[0] >= min_x and b[1] >= min_y
+                and b[2] <= max_x and b[3] <= max_y):
+                found.append(name)
+        return sorted(found)
+
+    def _exclude_region(self, gcmd, region):
+        try:
+            x1, y1, x2, y2 = [float(v) for v in region.split(',')]
+        except ValueError:
+            raise gcmd.error("Unable to parse REGION '%s'" % (region,))
+        names = self._find_objects_in_region(min(x1, x2), min(y1, y2),
+                                             max(x1, x2), max(y1, y2))
+        if not names:
+            gcmd.respond_info("No objects found in region %s" % (region,))
+        for name in names:
+            if name not in self.excluded_objects:
+                self._exclude_object(name)
 
     def _exclude_object(self, name):
         self._register_transform()
         self.gcode.respond_info('Excluding object {}'.format(name.upper()))
         if name not in self.excluded_objects:
             self.excluded_objects = sorted(self.excluded_objects + [name])
+            self._update_current_excluded()
 
     def _unexclude_object(self, name):
         self.gcode.respond_info('Unexcluding object {}'.format(name.upper()))
@@ -286,12 +373,14 @@ class ExcludeObject:
             excluded_objects = list(self.excluded_objects)
             excluded_objects.remove(name)
             self.excluded_objects = sorted(excluded_objects)
+            self._update_current_excluded()
 
     def _list_objects(self, gcmd):
+        objects = self._get_objects()
         if gcmd.get('JSON', None) is not None:
-            object_list = json.dumps(self.objects)
+            object_list = json.dumps(objects)
         else:
-            object_list = " ".join(obj['name'] for obj in self.objects)
+            object_list = " ".join(obj['name'] for obj in objects)
         gcmd.respond_info('Known objects: {}'.format(object_list))
 
     def _list_excluded_objects(self, gcmd):
@@ -3,7 +3,7 @@
 # Copyright (C) 2018-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import traceback, logging, ast, copy, json
+import traceback, logging, ast, copy, json, hashlib, os
 import jinja2
 
 
@@ -39,6 +39,90 @@ class GetStatusWrapper:
             if self.__contains__(name):
                 yield name
 
+# Status dictionary that notes which fields a template reads
+class TrackedStatus(dict):
+    def __init__(self, status, note_field):
+        dict.__init__(self, status)
+        self._note_field = note_field
+    def __getitem__(self, key):
+        self._note_field(key)
+        return dict.__getitem__(self, key)
+    def __contains__(self, key):
+        self._note_field(key)
+        return dict.__contains__(self, key)
+    def get(self, key, default=None):
+        self._note_field(key)
+        return dict.get(self, key, default)
+    def __iter__(self):
+        self._note_field(None)
+        return dict.__iter__(self)
+    def __len__(self):
+        self._note_field(None)
+        return dict.__len__(self)
+    def keys(self):
+        self._note_field(None)
+        return dict.keys(self)
+    def values(self):
+        self._note_field(None)
+        return dict.values(self)
+    def items(self):
+        self._note_field(None)
+        return dict.items(self)
+
+MISSING = object()
+
+# Status wrapper that records the status fields used during a render
+class TrackingStatusWrapper(GetStatusWrapper):
+    def __init__(self, printer, eventtime=None):
+        GetStatusWrapper.__init__(self, printer, eventtime)
+        self.deps = {}
+        self.raw_status = {}
+    def _note_func(self, name, status):
+        def note_field(key):
+            if key is None:
+                self.deps[(name, None)] = dict(status)
+            else:
+                self.deps[(name, key)] = status.get(key, MISSING)
+        return note_field
+    def __getitem__(self, val):
+        sval = str(val).strip()
+        if sval not in self.cache:
+            res = GetStatusWrapper.__getitem__(self, val)
+            if type(res) == dict:
+                res = TrackedStatus(res, self._note_func(sval, res))
+            self.cache[sval] = res
+        res = self.cache[sval]
+        if type(res) != TrackedStatus:
+            self.deps[(sval, None)] = res
+        return res
+    def start_render(self):
+        self.deps = {}
+    def finish_render(self):
+        # Return {(object_name, field): value_at_render_time, ...} or
+        # None if no status was read (the template may still change, for
+        # example with the random filter, so it is always rendered again)
+        deps, self.deps = self.deps, {}
+        if not deps:
+            return None
+        return deps
+    def check_changed(self, deps):
+        # Check if any status field noted in 'deps' has a new value
+        if deps is None:
+            return True
+        if self.eventtime is None:
+            self.eventtime = self.printer.get_reactor().monotonic()
+        for (name, field), value in deps.items():
+            status = self.raw_status.get(name)
+            if status is None:
+                po = self.printer.lookup_object(name)
+                status = po.get_status(self.eventtime)
+                self.raw_status[name] = status
+            if field is not None:
+                status = status.get(field, MISSING)
+            if status != value:
+                return True
+        return False
+
 # Wrapper around a Jinja2 template
 class TemplateWrapper:
     def __init__(self, printer, env, name, script):
@@ -67,11 +151,92 @@ class TemplateWrapper:
     def run_gcode_from_command(self, context=None):
         self.gcode.run_script_from_command(self.render(context))
 
+# Jinja2 environment that caches compiled templates (in memory and on disk)
+class TemplateEnvironment(jinja2.Environment):
+    def __init__(self, *args, **kwargs):
+        jinja2.Environment.__init__(self, *args, **kwargs)
+        self.code_cache = {}
+    def _compile_source(self, source):
+        bcc = self.bytecode_cache
+        if bcc is None:
+            return self.compile(source)
+        # Cache entries are keyed by a hash of the template source
+        data = source
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        key = hashlib.sha1(data).hexdigest()
+        bucket = bcc.get_bucket(self, key, None, source)
+        code = bucket.code
+        if code is None:
+            code = self.compile(source)
+            bucket.code = code
+            try:
+                bcc.set_bucket(bucket)
+            except (IOError, OSError) as e:
+                logging.warning("Unable to store template cache: %s", e)
+        return code
+    def from_string(self, source, globals=None, template_class=None):
+        if isinstance(source, jinja2.nodes.Template):
+            return jinja2.Environment.from_string(self, source, globals,
+                                                  template_class)
+        # Identical template sources share the same compiled code
+        code = self.code_cache.get(source)
+        if code is None:
+            code = self.code_cache[source] = self._compile_source(source)
+        gs = self.make_globals(globals)
+        cls = template_class or self.template_class
+        return cls.from_code(self, code, gs, None)
+
 # Main gcode macro template tracking
 class PrinterGCodeMacro:
     def __init__(self, config):
         self.printer = config.get_printer()
-        self.env = jinja2.Environment('{%', '%}', '{', '}')
+        self.env = TemplateEnvironment('{%', '%}', '{', '}')
+        cache_dir = self.printer.get_start_args().get('cache_dir')
+        if cache_dir is not None:
+            self._setup_bytecode_cache(os.path.join(cache_dir, 'jinja2'))
+        pconfig = self.printer.lookup_object('configfile')
+        pconfig.register_reload_handler('gcode_macro ', self._handle_reload)
+    def _setup_bytecode_cache(self, cache_dir):
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+        except OSError as e:
+            logging.warning("Unable to create template cache directory"
+                            " '%s': %s", cache_dir, e)
+            return
+        self.env.bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+    def _handle_reload(self, config, sections):
+        updates = []
+        new_macros = []
+        gcode = self.printer.lookup_object('gcode')
+        eventtime = self.printer.get_reactor().monotonic()
+        commands = dict(gcode.get_status(eventtime)['commands'])
+        for section in sections:
+            mconfig = config.getsection(section)
+            macro = self.printer.lookup_object(section, None)
+            if macro is not None:
+                updates.append(macro.reload_config(mconfig))
+                continue
+            # New macro section - create it now so that errors are
+            # reported before any change is applied
+            macro = GCodeMacro(mconfig, register=False)
+            if macro.rename_existing is not None:
+                raise config.error("Option 'rename_existing' in section '%s'"
+                                   " can not be reloaded (use RESTART)"
+                                   % (section,))
+            if macro.alias in commands:
+                raise config.error("gcode command %s already registered"
+                                   % (macro.alias,))
+            commands[macro.alias] = {}
+            new_macros.append((section, macro))
+        def update():
+            for u in updates:
+                u()
+            for section, macro in new_macros:
+                self.printer.add_object(section, macro)
+                macro.register_commands()
+        return update
     def load_template(self, config, option, default=None):
         name = "%s:%s" % (config.get_name(), option)
         if default is None:
@@ -111,46 +276,72 @@ def load_config(config):
 # GCode macro
 ######################################################################
 
-class GCodeMacro:
-    def __init__(self, config):
-        if len(config.get_name().split()) > 2:
+# Parse a gcode_macro config section
+def parse_macro_config(config):
+    if len(config.get_name().split()) > 2:
+        raise config.error(
+                "Name of section '%s' contains illegal whitespace"
+                % (config.get_name()))
+    gcode_macro = config.get_printer().load_object(config, 'gcode_macro')
+    template = gcode_macro.load_template(config, 'gcode')
+    rename_existing = config.get("rename_existing", None)
+    cmd_desc = config.get("description", "G-Code macro")
+    variables = {}
+    prefix = 'variable_'
+    for option in config.get_prefix_options(prefix):
+        try:
+            literal = ast.literal_eval(config.get(option))
+            json.dumps(literal, separators=(',', ':'))
+            variables[option[len(prefix):]] = literal
+        except (SyntaxError, TypeError, ValueError) as e:
             raise config.error(
-                    "Name of section '%s' contains illegal whitespace"
-                    % (config.get_name()))
-        name = config.get_name().split()[1]
-        self.alias = name.upper()
+                "Option '%s' in section '%s' is not a valid literal: %s" % (
+                    option, config.get_name(), e))
+    return template, rename_existing, cmd_desc, variables
+
+class GCodeMacro:
+    def __init__(self, config, register=True):
+        (self.template, self.rename_existing, self.cmd_desc,
+         self.variables) = parse_macro_config(config)
+        self.name = config.get_name().split()[1]
+        self.alias = self.name.upper()
         self.printer = printer = config.get_printer()
-        gcode_macro = printer.load_object(config, 'gcode_macro')
-        self.template = gcode_macro.load_template(config, 'gcode')
         self.gcode = printer.lookup_object('gcode')
-        self.rename_existing = config.get("rename_existing", None)
-        self.cmd_desc = config.get("description", "G-Code macro")
         if self.rename_existing is not None:
             if (self.gcode.is_traditional_gcode(self.alias)
                 != self.gcode.is_traditional_gcode(self.rename_existing)):
                 raise config.error(
                     "G-Code macro rename of different types ('%s' vs '%s')"
                     % (self.alias, self.rename_existing))
-            printer.register_event_handler("klippy:connect",
-                                           self.handle_connect)
+        self.in_script = False
+        if register:
+            self.register_commands()
+    def register_commands(self):
+        if self.rename_existing is not None:
+            self.printer.register_event_handler("klippy:connect",
+                                                self.handle_connect)
         else:
             self.gcode.register_command(self.alias, self.cmd,
                                         desc=self.cmd_desc)
         self.gcode.register_mux_command("SET_GCODE_VARIABLE", "MACRO",
-                                        name, self.cmd_SET_GCODE_VARIABLE,
+                                        self.name, self.cmd_SET_GCODE_VARIABLE,
                                         desc=self.cmd_SET_GCODE_VARIABLE_help)
-        self.in_script = False
-        self.variables = {}
-        prefix = 'variable_'
-        for option in config.get_prefix_options(prefix):
-            try:
-                literal = ast.literal_eval(config.get(option))
-                json.dumps(literal, separators=(',', ':'))
-                self.variables[option[len(prefix):]] = literal
-            except (SyntaxError, TypeError, ValueError) as e:
-                raise config.error(
-                    "Option '%s' in section '%s' is not a valid literal: %s" % (
-                        option, config.get_name(), e))
+    def reload_config(self, config):
+        template, rename_existing, cmd_desc, variables = parse_macro_config(
+            config)
+        if rename_existing != self.rename_existing:
+            raise config.error("Option 'rename_existing' in section '%s'"
+                               " can not be reloaded (use RESTART)"
+                               % (config.get_name(),))
+        def update():
+            self.template = template
+            self.variables = variables
+            if cmd_desc != self.cmd_desc:
+                self.cmd_desc = cmd_desc
+                self.gcode.register_command(self.alias, None)
+                self.gcode.register_command(self.alias, self.cmd,
+                                            desc=cmd_desc)
+        return update
     def handle_connect(self):
         prev_cmd = self.gcode.register_command(self.alias, None)
         if prev_cmd is None:
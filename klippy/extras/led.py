@@ -5,6 +5,7 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging, ast
 from .display import display
+from . import gcode_macro
 
 # Time between each led template update
 RENDER_TIME = 0.500
@@ -81,6 +82,7 @@ class PrinterLED:
         self.printer = config.get_printer()
         self.led_helpers = {}
         self.active_templates = {}
+        self.render_cache = {}
         self.render_timer = None
         # Load templates
         dtemplates = display.lookup_display_templates(config)
@@ -101,11 +103,11 @@ class PrinterLED:
             return
         reactor = self.printer.get_reactor()
         self.render_timer = reactor.register_timer(self._render, reactor.NOW)
-    def _activate_template(self, led_helper, index, template, lparams):
+    def _activate_template(self, led_helper, index, tpl_name, lparams):
         key = (led_helper, index)
-        if template is not None:
-            uid = (template,) + tuple(sorted(lparams.items()))
-            self.active_templates[key] = (uid, template, lparams)
+        if tpl_name:
+            params_key = tuple(sorted(lparams.items()))
+            self.active_templates[key] = (tpl_name, params_key, lparams)
             return
         if key in self.active_templates:
             del self.active_templates[key]
@@ -118,28 +120,43 @@ class PrinterLED:
             return reactor.NEVER
         # Setup gcode_macro template context
         context = self.create_template_context(eventtime)
+        status_wrapper = gcode_macro.TrackingStatusWrapper(self.printer,
+                                                           eventtime)
+        context['printer'] = status_wrapper
         def render(name, **kwargs):
             return self.templates[name].render(context, **kwargs)
         context['render'] = render
-        # Render all templates
+        # Render all templates whose inputs have changed
         need_transmit = {}
         rendered = {}
+        render_cache = {}
         template_info = self.active_templates.items()
-        for (led_helper, index), (uid, template, lparams) in template_info:
+        for (led_helper, index), (name, params_key, lparams) in template_info:
+            # Templates are looked up by name as they may be reloaded
+            template = self.templates[name]
+            uid = (template,) + params_key
             color = rendered.get(uid)
             if color is None:
-                try:
-                    text = template.render(context, **lparams)
-                    parts = [max(0., min(1., float(f)))
-                             for f in text.split(',', 4)]
-                except Exception as e:
-                    logging.exception("led template render error")
-                    parts = []
-                if len(parts) < 4:
-                    parts += [0.] * (4 - len(parts))
-                rendered[uid] = color = tuple(parts)
+                deps, color = self.render_cache.get(uid, (None, None))
+                if status_wrapper.check_changed(deps):
+                    status_wrapper.start_render()
+                    try:
+                        text = template.render(context, **lparams)
+                        parts = [max(0., min(1., float(f)))
+                                 for f in text.split(',', 4)]
+                        deps = status_wrapper.finish_render()
+                    except Exception as e:
+                        logging.exception("led template render error")
+                        parts = []
+                        deps = None
+                    if len(parts) < 4:
+                        parts += [0.] * (4 - len(parts))
+                    color = tuple(parts)
+                rendered[uid] = color
+                render_cache[uid] = (deps, color)
             need_transmit[led_helper] = 1
             led_helper.set_color(index, color)
+        self.render_cache = render_cache
         context.clear() # Remove circular references for better gc
         # Transmit pending changes
         for led_helper in need_transmit.keys():
@@ -153,7 +170,6 @@ class PrinterLED:
             raise gcmd.error("Unknown LED '%s'" % (led_name,))
         led_count = led_helper.get_led_count()
         index = gcmd.get_int("INDEX", None, minval=1, maxval=led_count)
-        template = None
         lparams = {}
         tpl_name = gcmd.get("TEMPLATE")
         if tpl_name:
@@ -173,10 +189,10 @@ class PrinterLED:
                 except ValueError as e:
                     raise gcmd.error("Unable to parse '%s' as a literal" % (v,))
         if index is not None:
-            self._activate_template(led_helper, index, template, lparams)
+            self._activate_template(led_helper, index, tpl_name, lparams)
         else:
             for i in range(led_count):
-                self._activate_template(led_helper, i+1, template, lparams)
+                self._activate_template(led_helper, i+1, tpl_name, lparams)
         self._activate_timer()
 
 PIN_MIN_TIME = 0.100
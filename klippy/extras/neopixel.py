@@ -4,6 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
+from .display import framebuffer
 
 BACKGROUND_PRIORITY_CLOCK = 0x7fffffff00000000
 
@@ -62,28 +63,21 @@ class PrinterNeoPixel:
             "neopixel_send oid=%c", "neopixel_result oid=%c success=%c",
             oid=self.oid, cq=cmd_queue)
     def update_color_data(self, led_state):
-        color_data = self.color_data
-        for cdidx, (lidx, cidx) in self.color_map:
-            color_data[cdidx] = int(led_state[lidx][cidx] * 255. + .5)
+        self.color_data[:] = bytearray([
+            int(led_state[lidx][cidx] * 255. + .5)
+            for cdidx, (lidx, cidx) in self.color_map])
     def send_data(self, print_time=None):
         old_data, new_data = self.old_color_data, self.color_data
         if new_data == old_data:
             return
         # Find the position of all changed bytes in this framebuffer
-        diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
-                 if n != o]
-        # Batch together changes that are close to each other
-        for i in range(len(diffs)-2, -1, -1):
-            pos, count = diffs[i]
-            nextpos, nextcount = diffs[i+1]
-            if pos + 5 >= nextpos and nextcount < 16:
-                diffs[i][1] = nextcount + (nextpos - pos)
-                del diffs[i+1]
+        diffs = framebuffer.find_changes(new_data, old_data, 5)
         # Transmit changes
         ucmd = self.neopixel_update_cmd.send
-        for pos, count in diffs:
-            ucmd([self.oid, pos, new_data[pos:pos+count]],
-                 reqclock=BACKGROUND_PRIORITY_CLOCK)
+        with self.mcu.alloc_command_batch() as batch:
+            for pos, count in diffs:
+                ucmd([self.oid, pos, new_data[pos:pos+count]],
+                     reqclock=BACKGROUND_PRIORITY_CLOCK, batch=batch)
         old_data[:] = new_data
         # Instruct mcu to update the LEDs
         minclock = 0
@@ -4,7 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging, math, os, time
-from . import shaper_calibrate
+from . import adxl345, shaper_calibrate
 
 class TestAxis:
     def __init__(self, axis=None, vib_dir=None):
@@ -131,6 +131,8 @@ class ResonanceTester:
             if self.accel_chip_names[0][1] == self.accel_chip_names[1][1]:
                 self.accel_chip_names = [('xy', self.accel_chip_names[0][1])]
         self.max_smoothing = config.getfloat('max_smoothing', None, minval=0.05)
+        self.workers = shaper_calibrate.lookup_calibration_workers(
+            self.printer)
 
         self.gcode = self.printer.lookup_object('gcode')
         self.gcode.register_command("MEASURE_AXES_NOISE",
@@ -150,7 +152,7 @@ class ResonanceTester:
                 for chip_axis, chip_name in self.accel_chip_names]
 
     def _run_test(self, gcmd, axes, helper, raw_name_suffix=None,
-                  accel_chips=None, test_point=None):
+                  accel_chips=None, test_point=None, raw_format='csv'):
         toolhead = self.printer.lookup_object('toolhead')
         calibration_data = {axis: None for axis in axes}
 
@@ -182,6 +184,15 @@ class ResonanceTester:
                     for chip in accel_chips:
                         aclient = chip.start_internal_client()
                         raw_values.append((axis, aclient, chip.name))
+                # Calculate the frequency response while the test is running
+                accumulators = {}
+                if helper is not None:
+                    for chip_axis, aclient, chip_name in raw_values:
+                        acc = helper.create_psd_accumulator()
+                        aclient.set_sample_handler(
+                                acc.add_samples,
+                                keep_samples=raw_name_suffix is not None)
+                        accumulators[aclient] = acc
 
                 # Generate moves
                 self.test.run_test(axis, gcmd)
@@ -191,7 +202,8 @@ class ResonanceTester:
                         raw_name = self.get_filename(
                                 'raw_data', raw_name_suffix, axis,
                                 point if len(test_points) > 1 else None,
-                                chip_name if accel_chips is not None else None,)
+                                chip_name if accel_chips is not None else None,
+                                extension=raw_format)
                         aclient.write_to_file(raw_name)
                         gcmd.respond_info(
                                 "Writing raw accelerometer data to "
@@ -203,7 +215,8 @@ class ResonanceTester:
                         raise gcmd.error(
                             "accelerometer '%s' measured no data" % (
                                 chip_name,))
-                    new_data = helper.process_accelerometer_data(aclient)
+                    new_data = helper.get_accumulated_data(
+                            accumulators[aclient])
                     if calibration_data[axis] is None:
                         calibration_data[axis] = new_data
                     else:
@@ -253,17 +266,20 @@ class ResonanceTester:
             raise gcmd.error("Invalid NAME parameter")
         csv_output = 'resonances' in outputs
         raw_output = 'raw_data' in outputs
+        raw_format = adxl345.get_raw_data_format(gcmd)
 
         # Setup calculation of resonances
         if csv_output:
-            helper = shaper_calibrate.ShaperCalibrate(self.printer)
+            helper = shaper_calibrate.ShaperCalibrate(
+                    self.printer, self.workers)
         else:
             helper = None
 
         data = self._run_test(
                 gcmd, [axis], helper,
                 raw_name_suffix=name_suffix if raw_output else None,
-                accel_chips=accel_chips, test_point=test_point)[axis]
+                accel_chips=accel_chips, test_point=test_point,
+                raw_format=raw_format)[axis]
         if csv_output:
             csv_name = self.save_calibration_data(
                     'resonances', name_suffix, helper, axis, data,
@@ -294,26 +310,31 @@ class ResonanceTester:
         input_shaper = self.printer.lookup_object('input_shaper', None)
 
         # Setup shaper calibration
-        helper = shaper_calibrate.ShaperCalibrate(self.printer)
+        helper = shaper_calibrate.ShaperCalibrate(self.printer, self.workers)
 
         calibration_data = self._run_test(gcmd, calibrate_axes, helper,
                                           accel_chips=accel_chips)
 
         configfile = self.printer.lookup_object('configfile')
+        systime = self.printer.get_reactor().monotonic()
+        toolhead = self.printer.lookup_object('toolhead')
+        toolhead_info = toolhead.get_status(systime)
+        scv = toolhead_info['square_corner_velocity']
+        max_freq = self._get_max_calibration_freq()
+        # Start the calculations for all axes so they run in parallel
+        shaper_fits = {}
+        for axis in calibrate_axes:
+            calibration_data[axis].normalize_to_frequencies()
+            shaper_fits[axis] = helper.submit_shaper_fits(
+                    calibration_data[axis], max_smoothing=max_smoothing,
+                    scv=scv, max_freq=max_freq)
         for axis in calibrate_axes:
             axis_name = axis.get_name()
             gcmd.respond_info(
                     "Calculating the best input shaper parameters for %s axis"
                     % (axis_name,))
-            calibration_data[axis].normalize_to_frequencies()
-            systime = self.printer.get_reactor().monotonic()
-            toolhead = self.printer.lookup_object('toolhead')
-            toolhead_info = toolhead.get_status(systime)
-            scv = toolhead_info['square_corner_velocity']
-            max_freq = self._get_max_calibration_freq()
-            best_shaper, all_shapers = helper.find_best_shaper(
-                    calibration_data[axis], max_smoothing=max_smoothing,
-                    scv=scv, max_freq=max_freq, logger=gcmd.respond_info)
+            best_shaper, all_shapers = helper.select_best_shaper(
+                    shaper_fits[axis], logger=gcmd.respond_info)
             gcmd.respond_info(
                     "Recommended shaper_type_%s = %s, shaper_freq_%s = %.1f Hz"
                     % (axis_name, best_shaper.name,
@@ -335,18 +356,23 @@ class ResonanceTester:
         "Measures noise of all enabled accelerometer chips")
     def cmd_MEASURE_AXES_NOISE(self, gcmd):
         meas_time = gcmd.get_float("MEAS_TIME", 2.)
-        raw_values = [(chip_axis, chip.start_internal_client())
-                      for chip_axis, chip in self.accel_chips]
+        helper = shaper_calibrate.ShaperCalibrate(self.printer, self.workers)
+        raw_values = []
+        for chip_axis, chip in self.accel_chips:
+            aclient = chip.start_internal_client()
+            accumulator = helper.create_psd_accumulator()
+            aclient.set_sample_handler(accumulator.add_samples,
+                                       keep_samples=False)
+            raw_values.append((chip_axis, aclient, accumulator))
         self.printer.lookup_object('toolhead').dwell(meas_time)
-        for chip_axis, aclient in raw_values:
+        for chip_axis, aclient, accumulator in raw_values:
             aclient.finish_measurements()
-        helper = shaper_calibrate.ShaperCalibrate(self.printer)
-        for chip_axis, aclient in raw_values:
+        for chip_axis, aclient, accumulator in raw_values:
             if not aclient.has_valid_samples():
                 raise gcmd.error(
                         "%s-axis accelerometer measured no data" % (
                             chip_axis,))
-            data = helper.process_accelerometer_data(aclient)
+            data = helper.get_accumulated_data(accumulator)
             vx = data.psd_x.mean()
             vy = data.psd_y.mean()
             vz = data.psd_z.mean()
@@ -358,7 +384,7 @@ class ResonanceTester:
         return name_suffix.replace('-', '').replace('_', '').isalnum()
 
     def get_filename(self, base, name_suffix, axis=None,
-                     point=None, chip_name=None):
+                     point=None, chip_name=None, extension='csv'):
         name = base
         if axis:
             name += '_' + axis.get_name()
@@ -367,7 +393,7 @@ class ResonanceTester:
         if point:
             name += "_%.3f_%.3f_%.3f" % (point[0], point[1], point[2])
         name += '_' + name_suffix
-        return os.path.join("/tmp", name + ".csv")
+        return os.path.join("/tmp", name + "." + extension)
 
     def save_calibration_data(self, base_name, name_suffix, shaper_calibrate,
                               axis, calibration_data,
@@ -4,22 +4,40 @@
 # Copyright (C) 2016-2020  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, logging, ast, configparser
+import os, logging, ast, configparser, threading, queue
+
+JOURNAL_COMPACT_SIZE = 100
 
 class SaveVariables:
     def __init__(self, config):
         self.printer = config.get_printer()
         self.filename = os.path.expanduser(config.get('filename'))
+        self.journal_filename = self.filename + ".journal"
         self.allVariables = {}
+        self.journal_entries = 0
         try:
             if not os.path.exists(self.filename):
                 open(self.filename, "w").close()
             self.loadVariables()
         except self.printer.command_error as e:
             raise config.error(str(e))
+        # Variable changes are written to disk from a background thread
+        self.write_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.lost_variables = []
+        self.write_thread = threading.Thread(target=self._write_thread)
+        self.write_thread.daemon = True
+        self.write_thread.start()
+        if self.journal_entries:
+            self.write_queue.put_nowait(('compact', self.allVariables))
+            self.journal_entries = 0
+        self.printer.register_event_handler("klippy:disconnect",
+                                            self._handle_disconnect)
         gcode = self.printer.lookup_object('gcode')
         gcode.register_command('SAVE_VARIABLE', self.cmd_SAVE_VARIABLE,
                                desc=self.cmd_SAVE_VARIABLE_help)
+        gcode.register_command('SAVE_VARIABLES', self.cmd_SAVE_VARIABLES,
+                               desc=self.cmd_SAVE_VARIABLES_help)
     def loadVariables(self):
         allvars = {}
         varfile = configparser.ConfigParser()
@@ -32,31 +50,114 @@ class SaveVariables:
             msg = "Unable to parse existing variable file"
             logging.exception(msg)
             raise self.printer.command_error(msg)
+        # Apply any changes not yet compacted into the main file
+        self.journal_entries = 0
+        try:
+            with open(self.journal_filename, "r") as f:
+                lines = f.readlines()
+        except IOError:
+            lines = []
+        for line in lines:
+            try:
+                name, val = ast.literal_eval(line)
+            except:
+                # An incomplete write - ignore it
+                logging.info("Ignoring invalid entry in %s",
+                             self.journal_filename)
+                continue
+            allvars[name] = val
+            self.journal_entries += 1
         self.allVariables = allvars
-    cmd_SAVE_VARIABLE_help = "Save arbitrary variables to disk"
-    def cmd_SAVE_VARIABLE(self, gcmd):
-        varname = gcmd.get('VARIABLE')
-        value = gcmd.get('VALUE')
+    # Background writing
+    def _write_thread(self):
+        while 1:
+            updates = [self.write_queue.get(True)]
+            # Write all pending updates with a single fsync
+            while not self.write_queue.empty():
+                updates.append(self.write_queue.get_nowait())
+            if updates[-1] is None:
+                updates.pop()
+                self._write_updates(updates)
+                break
+            self._write_updates(updates)
+    def _write_updates(self, updates):
+        entries = []
+        for utype, data in updates:
+            if utype == 'compact':
+                try:
+                    self._compact(data)
+                except:
+                    # The journal is kept, so no changes are lost
+                    logging.exception("Unable to compact variables file")
+                    continue
+                # The snapshot already contains all earlier entries
+                entries = []
+            else:
+                entries.extend(data)
+        if not entries:
+            return
         try:
-            value = ast.literal_eval(value)
-        except ValueError as e:
-            raise gcmd.error("Unable to parse '%s' as a literal" % (value,))
-        newvars = dict(self.allVariables)
-        newvars[varname] = value
-        # Write file
+            data = "".join(["%s\n" % (repr(e),) for e in entries])
+            with open(self.journal_filename, "a") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except:
+            logging.exception("Unable to save variables")
+            with self.lock:
+                self.lost_variables.extend([name for name, val in entries])
+    def _compact(self, allvars):
+        # Atomically replace the main file and then remove the journal
         varfile = configparser.ConfigParser()
         varfile.add_section('Variables')
-        for name, val in sorted(newvars.items()):
+        for name, val in sorted(allvars.items()):
             varfile.set('Variables', name, repr(val))
-        try:
-            f = open(self.filename, "w")
+        tmpname = self.filename + ".tmp"
+        with open(tmpname, "w") as f:
             varfile.write(f)
-            f.close()
-        except:
-            msg = "Unable to save variable"
-            logging.exception(msg)
-            raise gcmd.error(msg)
-        self.loadVariables()
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmpname, self.filename)
+        if os.path.exists(self.journal_filename):
+            os.remove(self.journal_filename)
+    def _handle_disconnect(self):
+        self.write_queue.put_nowait(None)
+        self.write_thread.join()
+    def _save_changes(self, gcmd, changes):
+        newvars = dict(self.allVariables)
+        newvars.update(changes)
+        self.allVariables = newvars
+        self.write_queue.put_nowait(('journal', list(changes.items())))
+        self.journal_entries += len(changes)
+        if self.journal_entries >= JOURNAL_COMPACT_SIZE:
+            self.journal_entries = 0
+            self.write_queue.put_nowait(('compact', newvars))
+        # Report any earlier changes that could not be written to disk
+        with self.lock:
+            lost = self.lost_variables
+            self.lost_variables = []
+        if lost:
+            gcmd.respond_info("Unable to save variables to disk - the"
+                              " change to %s was lost"
+                              % (", ".join(sorted(set(lost))),))
+    def _parse_value(self, gcmd, value):
+        try:
+            return ast.literal_eval(value)
+        except ValueError as e:
+            raise gcmd.error("Unable to parse '%s' as a literal" % (value,))
+    cmd_SAVE_VARIABLE_help = "Save arbitrary variables to disk"
+    def cmd_SAVE_VARIABLE(self, gcmd):
+        varname = gcmd.get('VARIABLE')
+        value = self._parse_value(gcmd, gcmd.get('VALUE'))
+        self._save_changes(gcmd, {varname.lower(): value})
+    cmd_SAVE_VARIABLES_help = "Save several variables to disk"
+    def cmd_SAVE_VARIABLES(self, gcmd):
+        changes = {}
+        for name, value in gcmd.get_command_parameters().items():
+            changes[name.lower()] = self._parse_value(gcmd, value)
+        if not changes:
+            raise gcmd.error("No variables specified")
+        self._save_changes(gcmd, changes)
     def get_status(self, eventtime):
         return {'variables': self.allVariables}
 
@@ -3,7 +3,8 @@
 # Copyright (C) 2020-2024  Dmitry Butyugin <dmbutyugin@google.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import collections, importlib, logging, math, multiprocessing, traceback
+import collections, importlib, logging, math, multiprocessing, os, tempfile
+import threading, traceback
 shaper_defs = importlib.import_module('.shaper_defs', 'extras')
 
 MIN_FREQ = 5.
@@ -15,6 +16,217 @@ TEST_DAMPING_RATIOS=[0.075, 0.1, 0.15]
 
 AUTOTUNE_SHAPERS = ['zv', 'mzv', 'ei', '2hump_ei', '3hump_ei']
 
+RATE_ESTIMATE_TIME = 1.
+PSD_THREAD_IDLE_TIME = 1.
+
+FIT_BATCH_SIZE = 1024
+
+MAX_WORKERS = 4
+SHARED_MEM_DIR = '/dev/shm'
+SAMPLES_COPY_CHUNK = 20000
+
+######################################################################
+# Background calculation workers
+######################################################################
+
+# Sample buffer shared with the worker processes via a memory mapped file
+class SharedSamples:
+    def __init__(self, numpy, samples):
+        self.numpy = numpy
+        tmpdir = SHARED_MEM_DIR if os.path.isdir(SHARED_MEM_DIR) else None
+        fd, self.filename = tempfile.mkstemp(prefix='klipper-samples-',
+                                             dir=tmpdir)
+        os.close(fd)
+        self.shape = (len(samples), len(samples[0]))
+        self.samples = samples
+    def fill(self, reactor):
+        # Copy samples in chunks so that the reactor remains responsive
+        data = self.numpy.memmap(self.filename, dtype=self.numpy.float64,
+                                 mode='w+', shape=self.shape)
+        for i in range(0, self.shape[0], SAMPLES_COPY_CHUNK):
+            data[i:i+SAMPLES_COPY_CHUNK] = self.samples[i:i+SAMPLES_COPY_CHUNK]
+            reactor.pause(reactor.NOW)
+        data.flush()
+        del data
+        self.samples = None
+    def get_descriptor(self):
+        return (self.filename, self.shape)
+    def release(self):
+        try:
+            os.unlink(self.filename)
+        except OSError:
+            pass
+
+def _open_shared_samples(numpy, descriptor):
+    filename, shape = descriptor
+    return numpy.memmap(filename, dtype=numpy.float64, mode='r', shape=shape)
+
+def _worker_main(conn):
+    import queuelogger
+    queuelogger.clear_bg_logging()
+    helper = ShaperCalibrate(None)
+    while 1:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        job_id, method, args, shared = msg
+        try:
+            if shared is not None:
+                args = (_open_shared_samples(helper.numpy, shared),) + args
+            res = getattr(helper, method)(*args)
+        except:
+            conn.send((job_id, True, traceback.format_exc()))
+            continue
+        conn.send((job_id, False, res))
+    conn.close()
+
+# Result of a calculation submitted to the background workers
+class CalculationJob:
+    def __init__(self, workers, method, args, shared):
+        self.workers = workers
+        self.method = method
+        self.args = args
+        self.shared = shared
+        self.completion = workers.reactor.completion()
+    def wait(self):
+        reactor = self.workers.reactor
+        gcode = self.workers.printer.lookup_object("gcode")
+        eventtime = reactor.monotonic()
+        while 1:
+            res = self.completion.wait(eventtime + 5., None)
+            if res is not None:
+                break
+            gcode.respond_info("Wait for calculations..", log=False)
+            eventtime = reactor.monotonic()
+        is_err, res = res
+        if is_err:
+            raise self.workers.printer.command_error(
+                    "Error in remote calculation: %s" % (res,))
+        return res
+
+# Already calculated result (no background workers in use)
+class CalculationResult:
+    def __init__(self, result):
+        self.result = result
+    def wait(self):
+        return self.result
+
+# Persistent pool of processes performing the calibration calculations
+class CalibrationWorkers:
+    def __init__(self, printer, max_workers=None):
+        self.printer = printer
+        self.reactor = printer.get_reactor()
+        if max_workers is None:
+            max_workers = min(MAX_WORKERS,
+                              max(1, multiprocessing.cpu_count() - 1))
+        self.max_workers = max_workers
+        self.workers = []
+        self.idle_workers = []
+        self.pending_jobs = collections.deque()
+        self.active_jobs = {}
+        self.next_job_id = 0
+        printer.register_event_handler("klippy:disconnect", self.shutdown)
+    def _start_worker(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=_worker_main,
+                                       args=(child_conn,))
+        proc.daemon = True
+        proc.start()
+        child_conn.close()
+        worker = [proc, parent_conn, None]
+        worker[2] = self.reactor.register_fd(
+                parent_conn.fileno(),
+                (lambda eventtime: self._handle_result(worker)))
+        self.workers.append(worker)
+        return worker
+    def _dispatch(self):
+        while self.pending_jobs:
+            if self.idle_workers:
+                worker = self.idle_workers.pop()
+            elif len(self.workers) < self.max_workers:
+                worker = self._start_worker()
+            else:
+                return
+            job_id, job = self.pending_jobs.popleft()
+            shared = None
+            if job.shared is not None:
+                shared = job.shared.get_descriptor()
+            try:
+                worker[1].send((job_id, job.method, job.args, shared))
+            except (IOError, OSError, ValueError) as e:
+                self._finish_job(job_id, job,
+                                 (True, "Unable to start job: %s" % (e,)))
+                self._stop_worker(worker)
+                continue
+            self.active_jobs[job_id] = (job, worker)
+    def _finish_job(self, job_id, job, result):
+        if job.shared is not None:
+            job.shared.release()
+        job.completion.complete(result)
+    def _handle_result(self, worker):
+        proc, conn, fd_handle = worker
+        try:
+            job_id, is_err, res = conn.recv()
+        except (EOFError, IOError, OSError):
+            logging.error("Calibration worker process exited unexpectedly")
+            self._stop_worker(worker)
+            for job_id, (job, w) in list(self.active_jobs.items()):
+                if w is worker:
+                    del self.active_jobs[job_id]
+                    self._finish_job(job_id, job, (True, "Worker exited"))
+            self._dispatch()
+            return
+        job, w = self.active_jobs.pop(job_id)
+        self._finish_job(job_id, job, (is_err, res))
+        self.idle_workers.append(worker)
+        self._dispatch()
+    def _stop_worker(self, worker):
+        proc, conn, fd_handle = worker
+        if worker in self.workers:
+            self.workers.remove(worker)
+        if worker in self.idle_workers:
+            self.idle_workers.remove(worker)
+        self.reactor.unregister_fd(fd_handle)
+        try:
+            conn.send(None)
+        except (IOError, OSError, ValueError):
+            pass
+        conn.close()
+        proc.join(.100)
+        if proc.is_alive():
+            proc.terminate()
+    def shutdown(self):
+        for worker in list(self.workers):
+            self._stop_worker(worker)
+        for job_id, (job, worker) in self.active_jobs.items():
+            self._finish_job(job_id, job, (True, "Calculation aborted"))
+        self.active_jobs.clear()
+        while self.pending_jobs:
+            job_id, job = self.pending_jobs.popleft()
+            self._finish_job(job_id, job, (True, "Calculation aborted"))
+    def submit(self, method, args, samples=None):
+        shared = None
+        if samples is not None:
+            np = importlib.import_module('numpy')
+            shared = SharedSamples(np, samples)
+            shared.fill(self.reactor)
+        job = CalculationJob(self, method, args, shared)
+        self.pending_jobs.append((self.next_job_id, job))
+        self.next_job_id += 1
+        self._dispatch()
+        return job
+
+# Return the worker pool shared by all users on this printer
+def lookup_calibration_workers(printer):
+    workers = printer.lookup_object('calibration_workers', None)
+    if workers is None:
+        workers = CalibrationWorkers(printer)
+        printer.add_object('calibration_workers', workers)
+    return workers
+
 ######################################################################
 # Frequency response calculation and shaper auto-tuning
 ######################################################################
@@ -30,6 +242,11 @@ class CalibrationData:
         self._psd_map = {'x': self.psd_x, 'y': self.psd_y, 'z': self.psd_z,
                          'all': self.psd_sum}
         self.data_sets = 1
+    def __getstate__(self):
+        # The numpy module reference can not be sent to the workers
+        state = dict(self.__dict__)
+        state.pop('numpy', None)
+        return state
     def add_data(self, other):
         np = self.numpy
         joined_data_sets = self.data_sets + other.data_sets
@@ -53,12 +270,147 @@ class CalibrationData:
         return self._psd_map[axis]
 
 
+# Incremental power spectral density calculation (Welch's algorithm)
+# on accelerometer samples as they arrive from the sensor. The
+# calculations are done in a background thread so that the sample
+# handler only queues the incoming batches.
+class PSDAccumulator:
+    def __init__(self, helper, reactor=None):
+        self.helper = helper
+        self.reactor = reactor
+        self.numpy = np = helper.numpy
+        self.pending = np.zeros((0, 4))
+        self.nfft = self.window = None
+        self.psd_sums = None
+        self.num_windows = self.num_samples = 0
+        self.first_time = self.last_time = None
+        # Background thread state
+        self.lock = threading.Lock()
+        self.bg_cond = threading.Condition(self.lock)
+        self.bg_batches = []
+        self.bg_running = False
+        self.bg_done = None
+        self.bg_error = None
+    def _setup_windows(self):
+        np = self.numpy
+        N = self.pending.shape[0]
+        T = self.pending[-1,0] - self.pending[0,0]
+        sampling_freq = N / T
+        # Round up to the nearest power of 2 for faster FFT
+        self.nfft = 1 << int(sampling_freq * WINDOW_T_SEC - 1).bit_length()
+        self.window = np.kaiser(self.nfft, 6.)
+        self.psd_sums = np.zeros((3, self.nfft // 2 + 1))
+    def _process_windows(self):
+        np = self.numpy
+        nfft = self.nfft
+        overlap = nfft // 2
+        step = nfft - overlap
+        n_windows = (self.pending.shape[0] - overlap) // step
+        if n_windows <= 0:
+            return
+        for i in range(3):
+            x = self.helper._split_into_windows(
+                    self.pending[:n_windows*step+overlap, i+1], nfft, overlap)
+            # First detrend, then apply windowing function
+            x = self.window[:, None] * (x - np.mean(x, axis=0))
+            result = np.fft.rfft(x, n=nfft, axis=0)
+            self.psd_sums[i] += (result.real**2 + result.imag**2).sum(axis=-1)
+        self.num_windows += n_windows
+        # Keep only the samples needed for the following windows
+        self.pending = self.pending[n_windows*step:].copy()
+    def _process_samples(self, samples):
+        np = self.numpy
+        data = np.array(samples, dtype=np.float64)
+        if not data.shape[0]:
+            return
+        if self.first_time is None:
+            self.first_time = data[0,0]
+        self.last_time = data[-1,0]
+        self.num_samples += data.shape[0]
+        self.pending = np.concatenate((self.pending, data))
+        if self.nfft is None:
+            if self.last_time - self.first_time < RATE_ESTIMATE_TIME:
+                return
+            self._setup_windows()
+        self._process_windows()
+    def _bg_thread(self):
+        while 1:
+            with self.lock:
+                if not self.bg_batches and self.bg_done is None:
+                    self.bg_cond.wait(PSD_THREAD_IDLE_TIME)
+                batches = self.bg_batches
+                self.bg_batches = []
+                if not batches:
+                    # Exit when idle (a new thread is started on demand)
+                    self.bg_running = False
+                    if self.bg_done is not None:
+                        self.reactor.async_complete(self.bg_done, True)
+                    return
+            if self.bg_error is not None:
+                continue
+            try:
+                for samples in batches:
+                    self._process_samples(samples)
+            except Exception as e:
+                logging.exception("Error in PSD calculation")
+                self.bg_error = str(e)
+    def add_samples(self, samples):
+        if self.reactor is None:
+            self._process_samples(samples)
+            return
+        with self.lock:
+            self.bg_batches.append(samples)
+            if self.bg_running:
+                self.bg_cond.notify()
+                return
+            self.bg_running = True
+        bg_thread = threading.Thread(target=self._bg_thread)
+        bg_thread.daemon = True
+        bg_thread.start()
+    def _flush(self):
+        # Wait for the background thread to process all queued samples
+        with self.lock:
+            if self.bg_running:
+                self.bg_done = self.reactor.completion()
+                self.bg_cond.notify()
+            bg_done = self.bg_done
+        if bg_done is not None:
+            bg_done.wait()
+            self.bg_done = None
+        if self.bg_error is not None:
+            raise self.helper.error("Error in PSD calculation: %s"
+                                    % (self.bg_error,))
+    def get_calibration_data(self):
+        np = self.numpy
+        if self.reactor is not None:
+            self._flush()
+        if self.num_samples < 2 or self.last_time <= self.first_time:
+            return None
+        if self.nfft is None:
+            self._setup_windows()
+            self._process_windows()
+        if self.num_samples <= self.nfft or not self.num_windows:
+            return None
+        sampling_freq = self.num_samples / (self.last_time - self.first_time)
+        # Compensation for windowing loss
+        scale = 1.0 / (self.window**2).sum()
+        psd = self.psd_sums * (scale / (sampling_freq * self.num_windows))
+        # For one-sided FFT output the response must be doubled, except
+        # the last point for unpaired Nyquist frequency (assuming even nfft)
+        # and the 'DC' term (0 Hz)
+        psd[:,1:-1] *= 2.
+        freqs = np.fft.rfftfreq(self.nfft, 1. / sampling_freq)
+        px, py, pz = psd
+        calibration_data = CalibrationData(freqs, px+py+pz, px, py, pz)
+        calibration_data.set_numpy(np)
+        return calibration_data
+
 CalibrationResult = collections.namedtuple(
         'CalibrationResult',
         ('name', 'freq', 'vals', 'vibrs', 'smoothing', 'score', 'max_accel'))
 
 class ShaperCalibrate:
-    def __init__(self, printer):
+    def __init__(self, printer, workers=None):
         self.printer = printer
         self.error = printer.command_error if printer else Exception
         try:
@@ -68,42 +420,19 @@ class ShaperCalibrate:
                     "Failed to import `numpy` module, make sure it was "
                     "installed via `~/klippy-env/bin/pip install` (refer to "
                     "docs/Measuring_Resonances.md for more details).")
+        if printer is not None and workers is None:
+            workers = lookup_calibration_workers(printer)
+        self.workers = workers
+
+    def background_process_submit(self, method, args, samples=None):
+        if self.workers is None:
+            if samples is not None:
+                args = (self.numpy.array(samples),) + tuple(args)
+            return CalculationResult(method(*args))
+        return self.workers.submit(method.__name__, tuple(args), samples)
 
     def background_process_exec(self, method, args):
-        if self.printer is None:
-            return method(*args)
-        import queuelogger
-        parent_conn, child_conn = multiprocessing.Pipe()
-        def wrapper():
-            queuelogger.clear_bg_logging()
-            try:
-                res = method(*args)
-            except:
-                child_conn.send((True, traceback.format_exc()))
-                child_conn.close()
-                return
-            child_conn.send((False, res))
-            child_conn.close()
-        # Start a process to perform the calculation
-        calc_proc = multiprocessing.Process(target=wrapper)
-        calc_proc.daemon = True
-        calc_proc.start()
-        # Wait for the process to finish
-        reactor = self.printer.get_reactor()
-        gcode = self.printer.lookup_object("gcode")
-        eventtime = last_report_time = reactor.monotonic()
-        while calc_proc.is_alive():
-            if eventtime > last_report_time + 5.:
-                last_report_time = eventtime
-                gcode.respond_info("Wait for calculations..", log=False)
-            eventtime = reactor.pause(eventtime + .1)
-        # Return results
-        is_err, res = parent_conn.recv()
-        if is_err:
-            raise self.error("Error in remote calculation: %s" % (res,))
-        calc_proc.join()
-        parent_conn.close()
-        return res
+        return self.background_process_submit(method, args).wait()
 
     def _split_into_windows(self, x, window_size, overlap):
         # Memory-efficient algorithm to split an input 'x' into a series
@@ -172,15 +501,44 @@ class ShaperCalibrate:
         fz, pz = self._psd(data[:,3], SAMPLING_FREQ, M)
         return CalibrationData(fx, px+py+pz, px, py, pz)
 
-    def process_accelerometer_data(self, data):
-        calibration_data = self.background_process_exec(
-                self.calc_freq_response, (data,))
+    def create_psd_accumulator(self):
+        reactor = None
+        if self.printer is not None:
+            reactor = self.printer.get_reactor()
+        return PSDAccumulator(self, reactor)
+
+    def get_accumulated_data(self, accumulator):
+        calibration_data = accumulator.get_calibration_data()
+        if calibration_data is None:
+            raise self.error(
+                    "Internal error processing accelerometer data: "
+                    "not enough samples")
+        return calibration_data
+
+    def submit_accelerometer_data(self, data):
+        if data is None:
+            return CalculationResult(None)
+        if isinstance(data, self.numpy.ndarray):
+            return self.background_process_submit(
+                    self.calc_freq_response, (data,))
+        samples = data.get_samples()
+        if not samples:
+            return CalculationResult(None)
+        return self.background_process_submit(
+                self.calc_freq_response, (), samples)
+
+    def wait_accelerometer_data(self, job, data):
+        calibration_data = job.wait()
         if calibration_data is None:
             raise self.error(
                     "Internal error processing accelerometer data %s" % (data,))
         calibration_data.set_numpy(self.numpy)
         return calibration_data
 
+    def process_accelerometer_data(self, data):
+        return self.wait_accelerometer_data(
+                self.submit_accelerometer_data(data), data)
+
     def _estimate_shaper(self, shaper, test_damping_ratio, test_freqs):
         np = self.numpy
 
@@ -227,14 +585,8 @@ class ShaperCalibrate:
         offset_180 *= inv_D
         return max(offset_90, offset_180)
 
-    def fit_shaper(self, shaper_cfg, calibration_data, shaper_freqs,
-                   damping_ratio, scv, max_smoothing, test_damping_ratios,
-                   max_freq):
+    def _get_test_freqs(self, shaper_cfg, shaper_freqs):
         np = self.numpy
-
-        damping_ratio = damping_ratio or shaper_defs.DEFAULT_DAMPING_RATIO
-        test_damping_ratios = test_damping_ratios or TEST_DAMPING_RATIOS
-
         if not shaper_freqs:
             shaper_freqs = (None, None, None)
         if isinstance(shaper_freqs, tuple):
@@ -242,10 +594,18 @@ class ShaperCalibrate:
             freq_start = min(shaper_freqs[0] or shaper_cfg.min_freq,
                              freq_end - 1e-7)
             freq_step = shaper_freqs[2] or .2
-            test_freqs = np.arange(freq_start, freq_end, freq_step)
-        else:
-            test_freqs = np.array(shaper_freqs)
+            return np.arange(freq_start, freq_end, freq_step)
+        return np.array(shaper_freqs)
+
+    def fit_shaper(self, shaper_cfg, calibration_data, shaper_freqs,
+                   damping_ratio, scv, max_smoothing, test_damping_ratios,
+                   max_freq):
+        np = self.numpy
+
+        damping_ratio = damping_ratio or shaper_defs.DEFAULT_DAMPING_RATIO
+        test_damping_ratios = test_damping_ratios or TEST_DAMPING_RATIOS
 
+        test_freqs = self._get_test_freqs(shaper_cfg, shaper_freqs)
         max_freq = max(max_freq or MAX_FREQ, test_freqs.max())
 
         freq_bins = calibration_data.freq_bins
@@ -291,6 +651,140 @@ class ShaperCalibrate:
                 selected = res
         return selected
 
+    def _estimate_shapers(self, A, T, test_damping_ratio, test_freqs):
+        # Batched _estimate_shaper(): A and T have shape (shapers, impulses)
+        np = self.numpy
+        inv_D = 1. / A.sum(axis=-1)
+
+        omega = 2. * math.pi * test_freqs
+        damping = test_damping_ratio * omega
+        omega_d = omega * math.sqrt(1. - test_damping_ratio**2)
+        W = A[:,None,:] * np.exp(
+                -damping[None,:,None] * (T[:,-1:] - T)[:,None,:])
+        phase = omega_d[None,:,None] * T[:,None,:]
+        S = (W * np.sin(phase)).sum(axis=-1)
+        C = (W * np.cos(phase)).sum(axis=-1)
+        return np.sqrt(S**2 + C**2) * inv_D[:,None]
+
+    def _get_shapers_smoothing(self, A, T, scv):
+        # Batched _get_shaper_smoothing() and find_shaper_max_accel().
+        # The smoothing offsets are linear in accel, so the max_accel
+        # producing TARGET_SMOOTHING is calculated directly.
+        np = self.numpy
+        TARGET_SMOOTHING = 0.12
+        inv_D = 1. / A.sum(axis=-1)
+        ts = (A * T).sum(axis=-1) * inv_D
+        dT = T - ts[:,None]
+        A_90 = np.where(T >= ts[:,None], A, 0.)
+        # offset_90 = c90 + k90 * accel, offset_180 = k180 * accel
+        c90 = (A_90 * dT).sum(axis=-1) * scv * inv_D * math.sqrt(2.)
+        k90 = (A_90 * dT**2).sum(axis=-1) * .5 * inv_D * math.sqrt(2.)
+        k180 = (A * dT**2).sum(axis=-1) * .5 * inv_D
+        accel = 5000.
+        smoothing = np.maximum(c90 + k90 * accel, k180 * accel)
+        max_accel = np.minimum((TARGET_SMOOTHING - c90) / k90,
+                               TARGET_SMOOTHING / k180)
+        return smoothing, np.maximum(max_accel, 0.)
+
+    def fit_shapers(self, shaper_cfgs, calibration_data, shaper_freqs,
+                    damping_ratio, scv, max_smoothing, test_damping_ratios,
+                    max_freq):
+        # Same as calling fit_shaper() for each shaper in shaper_cfgs, but
+        # all shapers and test frequencies are evaluated in batches
+        np = self.numpy
+
+        damping_ratio = damping_ratio or shaper_defs.DEFAULT_DAMPING_RATIO
+        test_damping_ratios = test_damping_ratios or TEST_DAMPING_RATIOS
+
+        # Generate all shaper candidates (in order of decreasing frequency)
+        candidates = []
+        cfg_counts = []
+        for shaper_cfg in shaper_cfgs:
+            test_freqs = self._get_test_freqs(shaper_cfg, shaper_freqs)
+            cfg_max_freq = max(max_freq or MAX_FREQ, test_freqs.max())
+            for test_freq in test_freqs[::-1]:
+                A, T = shaper_cfg.init_func(test_freq, damping_ratio)
+                candidates.append((shaper_cfg, test_freq, cfg_max_freq, A, T))
+            cfg_counts.append(len(test_freqs))
+        if not candidates:
+            return []
+        # Candidates with the same number of impulses and the same range of
+        # frequency bins are evaluated together
+        groups = collections.OrderedDict()
+        for i, (shaper_cfg, test_freq, cfg_max_freq, A, T) in enumerate(
+                candidates):
+            groups.setdefault((cfg_max_freq, len(A)), []).append(i)
+        smoothing = np.zeros(len(candidates))
+        max_accel = np.zeros(len(candidates))
+        vibrs = np.zeros(len(candidates))
+        vals = [None] * len(candidates)
+        for (cfg_max_freq, num_impulses), idx in groups.items():
+            freq_bins = calibration_data.freq_bins
+            psd = calibration_data.psd_sum[freq_bins <= cfg_max_freq]
+            freq_bins = freq_bins[freq_bins <= cfg_max_freq]
+            # The input shaper can only reduce the amplitude of vibrations by
+            # SHAPER_VIBRATION_REDUCTION times, so all vibrations below that
+            # threshold can be igonred
+            vibr_threshold = psd.max() / shaper_defs.SHAPER_VIBRATION_REDUCTION
+            all_vibrations = np.maximum(psd - vibr_threshold, 0).sum()
+            for start in range(0, len(idx), FIT_BATCH_SIZE):
+                batch = idx[start:start+FIT_BATCH_SIZE]
+                A = np.array([candidates[i][3] for i in batch])
+                T = np.array([candidates[i][4] for i in batch])
+                shapers_smoothing = self._get_shapers_smoothing(A, T, scv)
+                smoothing[batch], max_accel[batch] = shapers_smoothing
+                batch_vals = np.zeros(shape=(len(batch), len(freq_bins)))
+                batch_vibrs = np.zeros(len(batch))
+                # Exact damping ratio of the printer is unknown, pessimizing
+                # remaining vibrations over possible damping values
+                for dr in test_damping_ratios:
+                    dr_vals = self._estimate_shapers(A, T, dr, freq_bins)
+                    remaining_vibrations = np.maximum(
+                            dr_vals * psd - vibr_threshold, 0).sum(axis=-1)
+                    batch_vibrs = np.maximum(
+                            batch_vibrs, remaining_vibrations / all_vibrations)
+                    batch_vals = np.maximum(batch_vals, dr_vals)
+                vibrs[batch] = batch_vibrs
+                for i, j in enumerate(batch):
+                    vals[j] = batch_vals[i]
+
+        # The score trying to minimize vibrations, but also accounting
+        # the growth of smoothing. The formula itself does not have any
+        # special meaning, it simply shows good results on real user data
+        scores = smoothing * (vibrs**1.5 + vibrs * .2 + .01)
+
+        # Select the shaper frequencies using the same rules as fit_shaper()
+        selected_shapers = []
+        pos = 0
+        for shaper_cfg, count in zip(shaper_cfgs, cfg_counts):
+            best = None
+            results = []
+            for i in range(pos, pos + count):
+                if max_smoothing and smoothing[i] > max_smoothing and best:
+                    break
+                results.append(i)
+                if best is None or vibrs[best] > vibrs[i]:
+                    best = i
+            else:
+                # Try to find an 'optimal' shapper configuration: the one
+                # that is not much worse than the 'best' one, but gives
+                # much less smoothing
+                selected = best
+                for i in results[::-1]:
+                    if vibrs[i] < vibrs[best] * 1.1 and (
+                            scores[i] < scores[selected]):
+                        selected = i
+                best = selected
+            pos += count
+            if best is None:
+                selected_shapers.append(None)
+                continue
+            selected_shapers.append(CalibrationResult(
+                name=shaper_cfg.name, freq=candidates[best][1],
+                vals=vals[best], vibrs=vibrs[best], smoothing=smoothing[best],
+                score=scores[best], max_accel=max_accel[best]))
+        return selected_shapers
+
     def _bisect(self, func):
         left = right = 1.
         if not func(1e-9):
@@ -317,19 +811,31 @@ class ShaperCalibrate:
             shaper, test_accel, scv) <= TARGET_SMOOTHING)
         return max_accel
 
+    def submit_shaper_fits(self, calibration_data, shapers=None,
+                           damping_ratio=None, scv=None, shaper_freqs=None,
+                           max_smoothing=None, test_damping_ratios=None,
+                           max_freq=None):
+        # Start fitting all requested shapers in a background worker
+        shapers = shapers or AUTOTUNE_SHAPERS
+        shaper_cfgs = [shaper_cfg for shaper_cfg in shaper_defs.INPUT_SHAPERS
+                       if shaper_cfg.name in shapers]
+        return self.background_process_submit(self.fit_shapers, (
+            shaper_cfgs, calibration_data, shaper_freqs, damping_ratio,
+            scv, max_smoothing, test_damping_ratios, max_freq))
+
     def find_best_shaper(self, calibration_data, shapers=None,
                          damping_ratio=None, scv=None, shaper_freqs=None,
                          max_smoothing=None, test_damping_ratios=None,
                          max_freq=None, logger=None):
+        fits = self.submit_shaper_fits(
+                calibration_data, shapers, damping_ratio, scv, shaper_freqs,
+                max_smoothing, test_damping_ratios, max_freq)
+        return self.select_best_shaper(fits, logger)
+
+    def select_best_shaper(self, fit_job, logger=None):
         best_shaper = None
         all_shapers = []
-        shapers = shapers or AUTOTUNE_SHAPERS
-        for shaper_cfg in shaper_defs.INPUT_SHAPERS:
-            if shaper_cfg.name not in shapers:
-                continue
-            shaper = self.background_process_exec(self.fit_shaper, (
-                shaper_cfg, calibration_data, shaper_freqs, damping_ratio,
-                scv, max_smoothing, test_damping_ratios, max_freq))
+        for shaper in fit_job.wait():
             if logger is not None:
                 logger("Fitted shaper '%s' frequency = %.1f Hz "
                        "(vibrations = %.1f%%, smoothing ~= %.3f)" % (
@@ -3,7 +3,8 @@
 # Copyright (C) 2018-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, time, logging
+import os, time
+import queuelogger
 
 class PrinterSysStats:
     def __init__(self, config):
@@ -65,8 +66,7 @@ class PrinterStats:
     def generate_stats(self, eventtime):
         stats = [cb(eventtime) for cb in self.stats_cb]
         if max([s[0] for s in stats]):
-            logging.info("Stats %.1f: %s", eventtime,
-                         ' '.join([s[1] for s in stats]))
+            queuelogger.log_stats(eventtime, ' '.join([s[1] for s in stats]))
         return eventtime + 1.
 
 def load_config(config):
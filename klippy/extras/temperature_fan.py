@@ -45,6 +45,23 @@ class TemperatureFan:
             "SET_TEMPERATURE_FAN_TARGET", "TEMPERATURE_FAN", self.name,
             self.cmd_SET_TEMPERATURE_FAN_TARGET,
             desc=self.cmd_SET_TEMPERATURE_FAN_TARGET_help)
+        pconfig = self.printer.lookup_object('configfile')
+        pconfig.register_reload_handler(config.get_name(), self._handle_reload)
+    def _handle_reload(self, config, sections):
+        pconfig = self.printer.lookup_object('configfile')
+        config = config.getsection(sections[0])
+        pconfig.check_reload_options(config, ['target_temp', 'min_speed',
+                                              'max_speed'])
+        max_speed = config.getfloat('max_speed', 1., above=0., maxval=1.)
+        min_speed = config.getfloat('min_speed', 0.3, minval=0., maxval=1.)
+        target_temp = config.getfloat(
+            'target_temp', 40. if self.max_temp > 40. else self.max_temp,
+            minval=self.min_temp, maxval=self.max_temp)
+        def update():
+            self.max_speed = self.max_speed_conf = max_speed
+            self.min_speed = self.min_speed_conf = min_speed
+            self.target_temp = self.target_temp_conf = target_temp
+        return update
 
     def set_speed(self, read_time, value):
         if value <= 0.:
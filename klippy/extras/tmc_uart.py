@@ -43,9 +43,10 @@ class MCU_analog_mux:
                 "All TMC mux instances must use identical pins")
         return tuple([not pp['invert'] for pp in select_pin_params])
     def activate(self, instance_id):
-        for oid, old, new in zip(self.oids, self.pin_values, instance_id):
-            if old != new:
-                self.update_pin_cmd.send([oid, new])
+        with self.mcu.alloc_command_batch() as batch:
+            for oid, old, new in zip(self.oids, self.pin_values, instance_id):
+                if old != new:
+                    self.update_pin_cmd.send([oid, new], batch=batch)
         self.pin_values = instance_id
 
 
@@ -38,6 +38,21 @@ class ExtruderStepper:
         gcode.register_mux_command("SYNC_EXTRUDER_MOTION", "EXTRUDER",
                                    self.name, self.cmd_SYNC_EXTRUDER_MOTION,
                                    desc=self.cmd_SYNC_EXTRUDER_MOTION_help)
+        pconfig = self.printer.lookup_object('configfile')
+        pconfig.register_reload_handler(config.get_name(), self._handle_reload)
+    def _handle_reload(self, config, sections):
+        config = config.getsection(sections[0])
+        pconfig = self.printer.lookup_object('configfile')
+        pconfig.check_reload_options(config, [
+            'pressure_advance', 'pressure_advance_smooth_time'])
+        pressure_advance = config.getfloat('pressure_advance', 0., minval=0.)
+        smooth_time = config.getfloat(
+                'pressure_advance_smooth_time', 0.040, above=0., maxval=.200)
+        def update():
+            self.config_pa = pressure_advance
+            self.config_smooth_time = smooth_time
+            self._set_pressure_advance(pressure_advance, smooth_time)
+        return update
     def _handle_connect(self):
         toolhead = self.printer.lookup_object('toolhead')
         toolhead.register_step_generator(self.stepper.generate_steps)
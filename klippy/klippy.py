@@ -143,6 +143,35 @@ class Printer:
             m.add_printer_objects(config)
         # Validate that there are no undefined parameters in the config file
         pconfig.check_unused_options(config)
+    def reload_config(self):
+        pconfig = self.lookup_object('configfile')
+        config, changed, removed = pconfig.read_reload_config()
+        if removed:
+            raise self.config_error("Section '%s' was removed (use RESTART)"
+                                    % (removed[0],))
+        # Group the changed sections by their reload handler
+        handlers = collections.OrderedDict()
+        for section in changed:
+            handler = pconfig.lookup_reload_handler(section)
+            if handler is None:
+                raise self.config_error(
+                    "Section '%s' can not be reloaded (use RESTART)"
+                    % (section,))
+            handlers.setdefault(handler, []).append(section)
+        if not changed:
+            return changed
+        # Validate all changes before applying any of them
+        updates = [handler(config, sections)
+                   for handler, sections in handlers.items()]
+        raw_config = pconfig.validate_unused_options(config)
+        for update in updates:
+            update()
+        # Only report the new config once every change has been applied
+        pconfig.build_status(config, raw_config)
+        if self.bglogger is not None:
+            pconfig.log_config(config)
+        logging.info("Reloaded config sections: %s", ", ".join(changed))
+        return changed
     def _build_protocol_error_message(self, e):
         host_version = self.start_args['software_version']
         msg_update = []
@@ -307,10 +336,15 @@ def main():
                     help="api server unix domain socket filename")
     opts.add_option("-l", "--logfile", dest="logfile",
                     help="write log to file instead of stderr")
+    opts.add_option("--log-max-size", dest="logmaxsize", type="int",
+                    default=0,
+                    help="rotate the log file when it exceeds this many MiB")
     opts.add_option("-v", action="store_true", dest="verbose",
                     help="enable debug messages")
     opts.add_option("-o", "--debugoutput", dest="debugoutput",
                     help="write output to file instead of to serial port")
+    opts.add_option("-c", "--cache-dir", dest="cachedir",
+                    help="directory for caching data between restarts")
     opts.add_option("-d", "--dictionary", dest="dictionary", type="string",
                     action="callback", callback=arg_dictionary,
                     help="file to read for mcu protocol dictionary")
@@ -333,13 +367,16 @@ def main():
         start_args['gcode_fd'] = debuginput.fileno()
     else:
         start_args['gcode_fd'] = util.create_pty(options.inputtty)
+    if options.cachedir:
+        start_args['cache_dir'] = options.cachedir
     if options.debugoutput:
         start_args['debugoutput'] = options.debugoutput
         start_args.update(options.dictionary)
     bglogger = None
     if options.logfile:
         start_args['log_file'] = options.logfile
-        bglogger = queuelogger.setup_bg_logging(options.logfile, debuglevel)
+        bglogger = queuelogger.setup_bg_logging(
+            options.logfile, debuglevel, options.logmaxsize * 1024 * 1024)
     else:
         logging.getLogger().setLevel(debuglevel)
     logging.info("Starting Klippy...")
@@ -88,8 +88,20 @@ class CommandWrapper:
             cmd_queue = serial.get_default_command_queue()
         self._cmd_queue = cmd_queue
         self._msgtag = msgparser.lookup_msgtag(msgformat) & 0xffffffff
-    def send(self, data=(), minclock=0, reqclock=0):
+        # Commands with only integer parameters are encoded in C
+        self._msgid = self._cmd.msgid
+        self._int_count = -1
+        if self._cmd.int_params:
+            self._int_count = len(self._cmd.param_types)
+    def send(self, data=(), minclock=0, reqclock=0, batch=None):
+        if batch is None and len(data) == self._int_count:
+            self._serial.raw_send_ints(self._msgid, data, minclock, reqclock,
+                                       self._cmd_queue)
+            return
         cmd = self._cmd.encode(data)
+        if batch is not None:
+            batch.add(cmd, minclock, reqclock, self._cmd_queue)
+            return
         self._serial.raw_send(cmd, minclock, reqclock, self._cmd_queue)
     def send_wait_ack(self, data=(), minclock=0, reqclock=0):
         cmd = self._cmd.encode(data)
@@ -203,13 +215,16 @@ class MCU_trsync:
                                      expire_ticks, min_extend_ticks)
         self._mcu.register_response(self._handle_trsync_state,
                                     "trsync_state", self._oid)
-        self._trsync_start_cmd.send([self._oid, report_clock, report_ticks,
-                                     self.REASON_COMMS_TIMEOUT],
-                                    reqclock=report_clock)
-        for s in self._steppers:
-            self._stepper_stop_cmd.send([s.get_oid(), self._oid])
-        self._trsync_set_timeout_cmd.send([self._oid, expire_clock],
-                                          reqclock=expire_clock)
+        with self._mcu.alloc_command_batch() as batch:
+            self._trsync_start_cmd.send([self._oid, report_clock, report_ticks,
+                                         self.REASON_COMMS_TIMEOUT],
+                                        reqclock=report_clock, batch=batch)
+            for s in self._steppers:
+                self._stepper_stop_cmd.send([s.get_oid(), self._oid],
+                                            batch=batch)
+            self._trsync_set_timeout_cmd.send([self._oid, expire_clock],
+                                              reqclock=expire_clock,
+                                              batch=batch)
     def set_home_end_time(self, home_end_time):
         self._home_end_clock = self._mcu.print_time_to_clock(home_end_time)
     def stop(self):
@@ -489,12 +504,13 @@ class MCU_adc:
         self._oid = self._mcu.create_oid()
         self._mcu.add_config_cmd("config_analog_in oid=%d pin=%s" % (
             self._oid, self._pin))
-        clock = self._mcu.get_query_slot(self._oid)
         sample_ticks = self._mcu.seconds_to_clock(self._sample_time)
         mcu_adc_max = self._mcu.get_constant_float("ADC_MAX")
         max_adc = self._sample_count * mcu_adc_max
         self._inv_max_adc = 1.0 / max_adc
         self._report_clock = self._mcu.seconds_to_clock(self._report_time)
+        clock = self._mcu.register_adc_report(self._oid, self._report_clock,
+                                              self._handle_analog_in_state)
         min_sample = max(0, min(0xffff, int(self._min_sample * max_adc)))
         max_sample = max(0, min(0xffff, int(
             math.ceil(self._max_sample * max_adc))))
@@ -504,17 +520,53 @@ class MCU_adc:
                 self._oid, clock, sample_ticks, self._sample_count,
                 self._report_clock, min_sample, max_sample,
                 self._range_check_count), is_init=True)
-        self._mcu.register_response(self._handle_analog_in_state,
-                                    "analog_in_state", self._oid)
-    def _handle_analog_in_state(self, params):
-        last_value = params['value'] * self._inv_max_adc
-        next_clock = self._mcu.clock32_to_clock64(params['next_clock'])
+    def _handle_analog_in_state(self, next_clock, value):
+        last_value = value * self._inv_max_adc
+        next_clock = self._mcu.clock32_to_clock64(next_clock)
         last_read_clock = next_clock - self._report_clock
         last_read_time = self._mcu.clock_to_print_time(last_read_clock)
         self._last_state = (last_value, last_read_time)
         if self._callback is not None:
             self._callback(last_read_time, last_value)
 
+# Dispatch of analog input reports to the MCU_adc objects of an mcu
+class MCU_adc_reports:
+    def __init__(self, mcu):
+        self._mcu = mcu
+        self._handlers = {}
+        self._report_slots = {}
+        self._is_batched = None
+    def _check_batched(self):
+        if self._is_batched is None:
+            # Check if the mcu sends batched analog_in_states reports
+            self._is_batched = self._mcu.try_lookup_command(
+                "analog_in_states next_clock=%u values=%*s") is not None
+            if self._is_batched:
+                self._mcu.register_response(self._handle_analog_in_states,
+                                            "analog_in_states")
+        return self._is_batched
+    def register_adc(self, oid, report_clock, callback):
+        self._handlers[oid] = callback
+        if not self._check_batched():
+            self._mcu.register_response(self._handle_analog_in_state,
+                                        "analog_in_state", oid)
+            return self._mcu.get_query_slot(oid)
+        # Start all adcs with the same report time together so that the
+        # mcu can report their results in a single message
+        clock = self._report_slots.get(report_clock)
+        if clock is None:
+            clock = self._mcu.get_query_slot(oid)
+            self._report_slots[report_clock] = clock
+        return clock
+    def _handle_analog_in_state(self, params):
+        self._handlers[params['oid']](params['next_clock'], params['value'])
+    def _handle_analog_in_states(self, params):
+        next_clock = params['next_clock']
+        data = params['values']
+        handlers = self._handlers
+        for i in range(0, len(data) - 2, 3):
+            handlers[data[i]](next_clock, data[i+1] | (data[i+2] << 8))
+
 
 ######################################################################
 # Main MCU class
@@ -531,7 +583,13 @@ class MCU:
             self._name = self._name[4:]
         # Serial port
         wp = "mcu '%s': " % (self._name)
-        self._serial = serialhdl.SerialReader(self._reactor, warn_prefix=wp)
+        identify_cache = None
+        cache_dir = printer.get_start_args().get('cache_dir')
+        if cache_dir is not None:
+            identify_cache = serialhdl.IdentifyCache(
+                os.path.join(cache_dir, 'mcu_identify'))
+        self._serial = serialhdl.SerialReader(self._reactor, warn_prefix=wp,
+                                              identify_cache=identify_cache)
         self._baud = 0
         self._canbus_iface = None
         canbus_uuid = config.get('canbus_uuid', None)
@@ -566,6 +624,7 @@ class MCU:
         self._restart_cmds = []
         self._init_cmds = []
         self._mcu_freq = 0.
+        self._adc_reports = MCU_adc_reports(self)
         # Move command queuing
         ffi_main, self._ffi_lib = chelper.get_ffi()
         self._max_stepper_error = config.getfloat('max_stepper_error', 0.000025,
@@ -834,6 +893,8 @@ class MCU:
             self._restart_cmds.append(cmd)
         else:
             self._config_cmds.append(cmd)
+    def register_adc_report(self, oid, report_clock, callback):
+        return self._adc_reports.register_adc(oid, report_clock, callback)
     def get_query_slot(self, oid):
         slot = self.seconds_to_clock(oid * .01)
         t = int(self.estimated_print_time(self._reactor.monotonic()) + 1.5)
@@ -851,6 +912,8 @@ class MCU:
         self._serial.register_response(cb, msg, oid)
     def alloc_command_queue(self):
         return self._serial.alloc_command_queue()
+    def alloc_command_batch(self):
+        return self._serial.alloc_command_batch()
     def lookup_command(self, msgformat, cq=None):
         return CommandWrapper(self._serial, msgformat, cq)
     def lookup_query_command(self, msgformat, respformat, oid=None,
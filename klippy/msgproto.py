@@ -69,6 +69,19 @@ class PT_int16(PT_int32):
 class PT_byte(PT_uint32):
     max_length = 2
 
+# Encode a series of integers (equivalent to PT_uint32.encode() on each)
+def encode_ints(out, params):
+    for v in params:
+        if v >= 0x60 or v < -0x20:
+            if v >= 0x3000 or v < -0x1000:
+                if v >= 0x180000 or v < -0x80000:
+                    if v >= 0xc000000 or v < -0x4000000:
+                        out.append((v>>28) & 0x7f | 0x80)
+                    out.append((v>>21) & 0x7f | 0x80)
+                out.append((v>>14) & 0x7f | 0x80)
+            out.append((v>>7) & 0x7f | 0x80)
+        out.append(v & 0x7f)
+
 class PT_string:
     is_int = False
     is_dynamic_string = True
@@ -168,11 +181,30 @@ class MessageFormat:
         self.param_names = lookup_params(msgformat, enumerations)
         self.param_types = [t for name, t in self.param_names]
         self.name_to_type = dict(self.param_names)
-    def encode(self, params):
-        out = []
-        out.append(self.msgid)
+        self.int_params = all([t.is_int for t in self.param_types])
+        # Build an encoding plan - runs of integer parameters are
+        # encoded with encode_ints(), other types individually
+        self.encode_plan = []
         for i, t in enumerate(self.param_types):
-            t.encode(out, params[i])
+            if not t.is_int:
+                self.encode_plan.append((i, i + 1, t))
+            elif self.encode_plan and self.encode_plan[-1][2] is None:
+                self.encode_plan[-1] = (self.encode_plan[-1][0], i + 1, None)
+            else:
+                self.encode_plan.append((i, i + 1, None))
+        if self.int_params:
+            self.encode = self._encode_ints
+    def _encode_ints(self, params):
+        out = [self.msgid]
+        encode_ints(out, params)
+        return out
+    def encode(self, params):
+        out = [self.msgid]
+        for start, end, t in self.encode_plan:
+            if t is None:
+                encode_ints(out, params[start:end])
+            else:
+                t.encode(out, params[start])
         return out
     def encode_by_name(self, **params):
         out = []
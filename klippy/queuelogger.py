@@ -3,7 +3,10 @@
 # Copyright (C) 2016-2019  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, logging.handlers, threading, queue, time
+import logging, logging.handlers, threading, queue, time, os, struct
+
+# Argument types that can be formatted later in the background thread
+DEFER_TYPES = {str, bytes, int, float, bool, type(None)}
 
 # Class to forward all messages through a queue to a background thread
 class QueueHandler(logging.Handler):
@@ -12,19 +15,110 @@ class QueueHandler(logging.Handler):
         self.queue = queue
     def emit(self, record):
         try:
-            self.format(record)
-            record.msg = record.message
-            record.args = None
-            record.exc_info = None
+            args = record.args
+            if (record.exc_info is not None or type(record.msg) is not str
+                or type(args) is not tuple
+                or not all([type(a) in DEFER_TYPES for a in args])):
+                # Arguments may change - format the message now
+                self.format(record)
+                record.msg = record.message
+                record.args = None
+                record.exc_info = None
             self.queue.put_nowait(record)
         except Exception:
             self.handleError(record)
 
+# Compact binary storage of the periodic "Stats" messages
+STATS_HEADER = b"KLIPPY_STATS 1\n"
+STATS_LAYOUT = b"L"
+STATS_VALUES = b"S"
+STATS_TEXT = b"T"
+
+class StatsWriter:
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.layout = None
+    def write(self, eventtime, msg):
+        # Separate the value names from the values
+        layout = []
+        values = []
+        for part in msg.split():
+            name, sep, val = part.partition('=')
+            layout.append(name + sep)
+            if sep:
+                values.append(val)
+        try:
+            values = [float(v) for v in values]
+        except ValueError:
+            values = None
+        layout = " ".join(layout).encode()
+        data = []
+        if self.file is None:
+            self.file = open(self.filename, 'wb')
+            self.file.write(STATS_HEADER)
+            self.layout = None
+        if values is None or len(values) > 0xffff or len(layout) > 0xffff:
+            msg = msg.encode()
+            data.append(STATS_TEXT + struct.pack("<dI", eventtime, len(msg)))
+            data.append(msg)
+        else:
+            if layout != self.layout:
+                self.layout = layout
+                data.append(STATS_LAYOUT + struct.pack("<H", len(layout)))
+                data.append(layout)
+            data.append(STATS_VALUES + struct.pack(
+                "<dH%dd" % (len(values),), eventtime, len(values), *values))
+        self.file.write(b"".join(data))
+        self.file.flush()
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+    def rotate(self, rotated_name):
+        self.close()
+        if os.path.exists(self.filename):
+            os.rename(self.filename, rotated_name)
+
+# Generate (eventtime, msg) for each message in a stats file
+def read_stats(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if not data.startswith(STATS_HEADER):
+        return
+    pos = len(STATS_HEADER)
+    layout = []
+    while pos < len(data):
+        rtype = data[pos:pos+1]
+        if rtype == STATS_LAYOUT:
+            count, = struct.unpack_from("<H", data, pos + 1)
+            pos += 3
+            layout = data[pos:pos+count].decode().split()
+            pos += count
+        elif rtype == STATS_VALUES:
+            eventtime, count = struct.unpack_from("<dH", data, pos + 1)
+            pos += 11
+            values = iter(struct.unpack_from("<%dd" % (count,), data, pos))
+            pos += count * 8
+            parts = [("%s%.15g" % (l, next(values)) if l.endswith('=')
+                      else l) for l in layout]
+            yield eventtime, " ".join(parts)
+        elif rtype == STATS_TEXT:
+            eventtime, count = struct.unpack_from("<dI", data, pos + 1)
+            pos += 13
+            yield eventtime, data[pos:pos+count].decode()
+            pos += count
+        else:
+            break
+
 # Class to poll a queue in a background thread and log each message
 class QueueListener(logging.handlers.TimedRotatingFileHandler):
-    def __init__(self, filename):
+    def __init__(self, filename, max_bytes=0):
         logging.handlers.TimedRotatingFileHandler.__init__(
             self, filename, when='midnight', backupCount=5)
+        self.max_bytes = max_bytes
+        self.stats_writer = StatsWriter(filename + ".stats")
+        self.rotated_name = None
         self.bg_queue = queue.Queue()
         self.bg_thread = threading.Thread(target=self._bg_thread)
         self.bg_thread.start()
@@ -35,9 +129,16 @@ class QueueListener(logging.handlers.TimedRotatingFileHandler):
             if record is None:
                 break
             self.handle(record)
+            stats = getattr(record, 'stats', None)
+            if stats is not None:
+                try:
+                    self.stats_writer.write(*stats)
+                except Exception:
+                    self.handleError(record)
     def stop(self):
         self.bg_queue.put_nowait(None)
         self.bg_thread.join()
+        self.stats_writer.close()
     def set_rollover_info(self, name, info):
         if info is None:
             self.rollover_info.pop(name, None)
@@ -45,8 +146,62 @@ class QueueListener(logging.handlers.TimedRotatingFileHandler):
         self.rollover_info[name] = info
     def clear_rollover_info(self):
         self.rollover_info.clear()
+    def shouldRollover(self, record):
+        if (self.max_bytes and self.stream is not None
+            and self.stream.tell() >= self.max_bytes):
+            return True
+        return logging.handlers.TimedRotatingFileHandler.shouldRollover(
+            self, record)
+    def rotation_filename(self, default_name):
+        # Logs rotated earlier in the same day get increasing suffixes
+        dir_name, base_name = os.path.split(default_name)
+        prefix = base_name + "."
+        counts = []
+        for fname in os.listdir(dir_name):
+            if fname == base_name:
+                counts.append(1)
+            elif fname.startswith(prefix) and fname[len(prefix):].isdigit():
+                counts.append(int(fname[len(prefix):]) + 1)
+        name = default_name
+        if counts:
+            name = "%s.%d" % (default_name, max(counts))
+        self.rotated_name = name
+        return name
+    def getFilesToDelete(self):
+        # Select old logs by name (the stats files are removed with them)
+        dir_name, base_name = os.path.split(self.baseFilename)
+        prefix = base_name + "."
+        logs = []
+        for fname in os.listdir(dir_name):
+            suffix = fname[len(prefix):]
+            if (fname.startswith(prefix) and not fname.endswith(".stats")
+                and self.extMatch.match(suffix)):
+                date, sep, count = suffix.partition('.')
+                order = (date, int(count) if count.isdigit() else 0)
+                logs.append((order, os.path.join(dir_name, fname)))
+        logs.sort()
+        return [fname for order, fname in logs[:-self.backupCount]]
+    def _rotate_stats(self, rotated_name):
+        # Keep the stats next to the rotated log (eg, klippy.log.<date>.stats)
+        self.stats_writer.rotate(rotated_name + ".stats")
+        # Remove the stats of logs that have been deleted
+        dir_name, base_name = os.path.split(self.baseFilename)
+        prefix = base_name + "."
+        for fname in os.listdir(dir_name):
+            if (fname.startswith(prefix) and fname.endswith(".stats")
+                and fname != prefix + "stats"
+                and not os.path.exists(os.path.join(dir_name, fname[:-6]))):
+                os.remove(os.path.join(dir_name, fname))
     def doRollover(self):
+        rollover_time = self.rolloverAt - self.interval
+        self.rotated_name = None
         logging.handlers.TimedRotatingFileHandler.doRollover(self)
+        rotated_name = self.rotated_name
+        if rotated_name is None:
+            # Python 2 does not call rotation_filename()
+            rotated_name = "%s.%s" % (self.baseFilename, time.strftime(
+                self.suffix, time.localtime(rollover_time)))
+        self._rotate_stats(rotated_name)
         lines = [self.rollover_info[name]
                  for name in sorted(self.rollover_info)]
         lines.append(
@@ -57,9 +212,9 @@ class QueueListener(logging.handlers.TimedRotatingFileHandler):
 
 MainQueueHandler = None
 
-def setup_bg_logging(filename, debuglevel):
+def setup_bg_logging(filename, debuglevel, max_bytes=0):
     global MainQueueHandler
-    ql = QueueListener(filename)
+    ql = QueueListener(filename, max_bytes)
     MainQueueHandler = QueueHandler(ql.bg_queue)
     root = logging.getLogger()
     root.addHandler(MainQueueHandler)
@@ -73,3 +228,8 @@ def clear_bg_logging():
         root.removeHandler(MainQueueHandler)
         root.setLevel(logging.WARNING)
         MainQueueHandler = None
+
+# Log a "Stats" message (it is also written to the binary stats file)
+def log_stats(eventtime, msg):
+    logging.info("Stats %.1f: %s", eventtime, msg,
+                 extra={'stats': (eventtime, msg)})
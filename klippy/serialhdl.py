@@ -3,7 +3,7 @@
 # Copyright (C) 2016-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, threading, os
+import logging, threading, os, hashlib
 import serial
 
 import msgproto, chelper, util
@@ -11,10 +11,70 @@ import msgproto, chelper, util
 class error(Exception):
     pass
 
+# Maximum number of data dictionaries kept in the identify cache
+IDENTIFY_CACHE_SIZE = 16
+IDENTIFY_CHUNK = 40
+
+# Disk cache of the data dictionaries obtained from micro-controllers
+class IdentifyCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+    def _get_prefix(self, first_chunk):
+        return "identify-%s-" % (hashlib.sha1(first_chunk).hexdigest()[:16],)
+    def lookup(self, first_chunk):
+        # Return (filename, data) of cached dictionaries with this start
+        prefix = self._get_prefix(first_chunk)
+        try:
+            fnames = [fname for fname in os.listdir(self.cache_dir)
+                      if fname.startswith(prefix)]
+        except OSError:
+            return []
+        res = []
+        for fname in sorted(fnames):
+            fname = os.path.join(self.cache_dir, fname)
+            try:
+                with open(fname, 'rb') as f:
+                    data = f.read()
+            except (IOError, OSError):
+                continue
+            if data.startswith(first_chunk):
+                res.append((fname, data))
+        return res
+    def note_used(self, fname):
+        try:
+            os.utime(fname, None)
+        except OSError:
+            pass
+    def store(self, identify_data):
+        first_chunk = identify_data[:IDENTIFY_CHUNK]
+        fname = os.path.join(self.cache_dir, "%s%s" % (
+            self._get_prefix(first_chunk),
+            hashlib.sha1(identify_data).hexdigest()[:16]))
+        tmpname = fname + ".tmp"
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with open(tmpname, 'wb') as f:
+                f.write(identify_data)
+            os.rename(tmpname, fname)
+            # Remove the least recently used dictionaries
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.startswith("identify-") and not name.endswith(".tmp"):
+                    name = os.path.join(self.cache_dir, name)
+                    entries.append((os.path.getmtime(name), name))
+            entries.sort(reverse=True)
+            for mtime, name in entries[IDENTIFY_CACHE_SIZE:]:
+                os.remove(name)
+        except (IOError, OSError) as e:
+            logging.warning("Unable to store data dictionary in cache"
+                            " '%s': %s", self.cache_dir, e)
+
 class SerialReader:
-    def __init__(self, reactor, warn_prefix=""):
+    def __init__(self, reactor, warn_prefix="", identify_cache=None):
         self.reactor = reactor
         self.warn_prefix = warn_prefix
+        self.identify_cache = identify_cache
         # Serial port
         self.serial_dev = None
         self.msgparser = msgproto.MessageParser(warn_prefix=warn_prefix)
@@ -33,6 +93,8 @@ class SerialReader:
         # Sent message notification tracking
         self.last_notify_id = 0
         self.pending_notifications = {}
+        # Batched command statistics
+        self.batch_sends = self.batch_msgs = 0
     def _bg_thread(self):
         response = self.ffi_main.new('struct pull_queue_message *')
         while 1:
@@ -59,23 +121,46 @@ class SerialReader:
                                   self.warn_prefix)
     def _error(self, msg, *params):
         raise error(self.warn_prefix + (msg % params))
+    def _query_identify(self, offset):
+        msg = "identify offset=%d count=%d" % (offset, IDENTIFY_CHUNK)
+        while 1:
+            params = self.send_with_response(msg, 'identify_response')
+            if params['offset'] == offset:
+                return params['data']
+    def _check_identify_cache(self, first_chunk):
+        # A cached dictionary is used if the micro-controller reports the
+        # same start, the same final chunk (which holds the zlib adler32
+        # checksum of the dictionary), and the same total size.
+        for fname, data in self.identify_cache.lookup(first_chunk):
+            size = len(data)
+            tail_offset = max(0, size - IDENTIFY_CHUNK)
+            if (self._query_identify(tail_offset) == data[tail_offset:]
+                and not self._query_identify(size)):
+                logging.info("%sUsing cached data dictionary %s",
+                             self.warn_prefix, fname)
+                self.identify_cache.note_used(fname)
+                return data
+        return None
     def _get_identify_data(self, eventtime):
         # Query the "data dictionary" from the micro-controller
-        identify_data = b""
-        while 1:
-            msg = "identify offset=%d count=%d" % (len(identify_data), 40)
-            try:
-                params = self.send_with_response(msg, 'identify_response')
-            except error as e:
-                logging.exception("%sWait for identify_response",
-                                  self.warn_prefix)
-                return None
-            if params['offset'] == len(identify_data):
-                msgdata = params['data']
+        try:
+            identify_data = self._query_identify(0)
+            if identify_data and self.identify_cache is not None:
+                data = self._check_identify_cache(identify_data)
+                if data is not None:
+                    return data
+            while 1:
+                msgdata = self._query_identify(len(identify_data))
                 if not msgdata:
-                    # Done
-                    return identify_data
+                    break
                 identify_data += msgdata
+        except error as e:
+            logging.exception("%sWait for identify_response",
+                              self.warn_prefix)
+            return None
+        if identify_data and self.identify_cache is not None:
+            self.identify_cache.store(identify_data)
+        return identify_data
     def _start_session(self, serial_dev, serial_fd_type=b'u', client_id=0):
         self.serial_dev = serial_dev
         self.serialqueue = self.ffi_main.gc(
@@ -221,7 +306,9 @@ class SerialReader:
             return ""
         self.ffi_lib.serialqueue_get_stats(self.serialqueue,
                                            self.stats_buf, len(self.stats_buf))
-        return str(self.ffi_main.string(self.stats_buf).decode())
+        return "%s batch_sends=%d batch_msgs=%d" % (
+            self.ffi_main.string(self.stats_buf).decode(),
+            self.batch_sends, self.batch_msgs)
     def get_reactor(self):
         return self.reactor
     def get_msgparser(self):
@@ -241,6 +328,12 @@ class SerialReader:
     def raw_send(self, cmd, minclock, reqclock, cmd_queue):
         self.ffi_lib.serialqueue_send(self.serialqueue, cmd_queue,
                                       cmd, len(cmd), minclock, reqclock, 0)
+    def raw_send_ints(self, msgid, data, minclock, reqclock, cmd_queue):
+        ret = self.ffi_lib.serialqueue_encode_and_send(
+            self.serialqueue, cmd_queue, msgid, data, len(data),
+            minclock, reqclock)
+        if ret:
+            self._error("Unable to encode command (msgid %d)", msgid)
     def raw_send_wait_ack(self, cmd, minclock, reqclock, cmd_queue):
         self.last_notify_id += 1
         nid = self.last_notify_id
@@ -252,6 +345,23 @@ class SerialReader:
         if params is None:
             self._error("Serial connection closed")
         return params
+    def raw_send_batch(self, cmds, cmd_queue):
+        msgs = []
+        lens = []
+        minclocks = []
+        reqclocks = []
+        for cmd, minclock, reqclock in cmds:
+            msgs.extend(cmd)
+            lens.append(len(cmd))
+            minclocks.append(minclock)
+            reqclocks.append(reqclock)
+        self.ffi_lib.serialqueue_send_multi(self.serialqueue, cmd_queue,
+                                            msgs, lens, minclocks, reqclocks,
+                                            len(cmds))
+        self.batch_sends += 1
+        self.batch_msgs += len(cmds)
+    def alloc_command_batch(self):
+        return CommandBatch(self)
     def send(self, msg, minclock=0, reqclock=0):
         cmd = self.msgparser.create_command(msg)
         self.raw_send(cmd, minclock, reqclock, self.default_cmd_queue)
@@ -329,6 +439,38 @@ class SerialRetryCommand:
             retries -= 1
             retry_delay *= 2.
 
+# Class to collect a series of commands and submit them to the
+# serialqueue with a single call per command queue
+class CommandBatch:
+    def __init__(self, serial):
+        self.serial = serial
+        self.cmds = []
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # Don't send a partially built batch
+            self.cmds = []
+            return
+        self.flush()
+    def add(self, cmd, minclock, reqclock, cmd_queue):
+        self.cmds.append((cmd_queue, (cmd, minclock, reqclock)))
+    def flush(self):
+        cmds = self.cmds
+        self.cmds = []
+        # Submit each run of commands on the same command queue together
+        start = 0
+        for i in range(1, len(cmds) + 1):
+            if i < len(cmds) and cmds[i][0] == cmds[start][0]:
+                continue
+            if i - start == 1:
+                cmd, minclock, reqclock = cmds[start][1]
+                self.serial.raw_send(cmd, minclock, reqclock, cmds[start][0])
+            else:
+                self.serial.raw_send_batch([c for cq, c in cmds[start:i]],
+                                           cmds[start][0])
+            start = i
+
 # Attempt to place an AVR stk500v2 style programmer into normal mode
 def stk500v2_leave(ser, reactor):
     logging.debug("Starting stk500v2 leave programmer sequence")
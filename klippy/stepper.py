@@ -16,11 +16,15 @@ class error(Exception):
 
 MIN_BOTH_EDGE_DURATION = 0.000000200
 
+# Step compression strategies (see stepcompress.c)
+STEP_COMPRESS_MODES = {'exact': 0, 'fast': 1, 'compact': 2}
+
 # Interface to low-level mcu and chelper code
 class MCU_stepper:
     def __init__(self, name, step_pin_params, dir_pin_params,
                  rotation_dist, steps_per_rotation,
-                 step_pulse_duration=None, units_in_radians=False):
+                 step_pulse_duration=None, units_in_radians=False,
+                 step_compress_mode=0):
         self._name = name
         self._rotation_dist = rotation_dist
         self._steps_per_rotation = steps_per_rotation
@@ -45,6 +49,8 @@ class MCU_stepper:
         self._stepqueue = ffi_main.gc(ffi_lib.stepcompress_alloc(oid),
                                       ffi_lib.stepcompress_free)
         ffi_lib.stepcompress_set_invert_sdir(self._stepqueue, self._invert_dir)
+        ffi_lib.stepcompress_set_compress_mode(self._stepqueue,
+                                               step_compress_mode)
         self._mcu.register_stepqueue(self._stepqueue)
         self._stepper_kinematics = None
         self._itersolve_generate_steps = ffi_lib.itersolve_generate_steps
@@ -245,9 +251,12 @@ def PrinterStepper(config, units_in_radians=False):
         config, units_in_radians, True)
     step_pulse_duration = config.getfloat('step_pulse_duration', None,
                                           minval=0., maxval=.001)
+    step_compress_mode = config.getchoice('step_compress', STEP_COMPRESS_MODES,
+                                          'exact')
     mcu_stepper = MCU_stepper(name, step_pin_params, dir_pin_params,
                               rotation_dist, steps_per_rotation,
-                              step_pulse_duration, units_in_radians)
+                              step_pulse_duration, units_in_radians,
+                              step_compress_mode)
     # Register with helper modules
     for mname in ['stepper_enable', 'force_move', 'motion_report']:
         m = printer.load_object(config, mname)
@@ -215,22 +215,12 @@ class ToolHead:
         self.lookahead.set_flush_time(BUFFER_TIME_HIGH)
         self.commanded_pos = [0., 0., 0., 0.]
         # Velocity and acceleration control
-        self.max_velocity = config.getfloat('max_velocity', above=0.)
-        self.max_accel = config.getfloat('max_accel', above=0.)
-        self.min_cruise_ratio = config.getfloat('minimum_cruise_ratio', None,
-                                                below=1., minval=0.)
-        if self.min_cruise_ratio is None:
-            self.min_cruise_ratio = 0.5
-            req_accel_to_decel = config.getfloat('max_accel_to_decel', None,
-                                                 above=0.)
-            if req_accel_to_decel is not None:
-                config.deprecate('max_accel_to_decel')
-                self.min_cruise_ratio = 1. - min(1., (req_accel_to_decel
-                                                      / self.max_accel))
-        self.square_corner_velocity = config.getfloat(
-            'square_corner_velocity', 5., minval=0.)
+        (self.max_velocity, self.max_accel, self.min_cruise_ratio,
+         self.square_corner_velocity) = self._parse_velocity_limits(config)
         self.junction_deviation = self.max_accel_to_decel = 0.
         self._calc_junction_deviation()
+        pconfig = self.printer.lookup_object('configfile')
+        pconfig.register_reload_handler('printer', self._handle_reload)
         # Input stall detection
         self.check_stall_time = 0.
         self.print_stall = 0
@@ -604,6 +594,34 @@ class ToolHead:
             self.reactor.update_timer(self.flush_timer, self.reactor.NOW)
     def get_max_velocity(self):
         return self.max_velocity, self.max_accel
+    def _parse_velocity_limits(self, config):
+        max_velocity = config.getfloat('max_velocity', above=0.)
+        max_accel = config.getfloat('max_accel', above=0.)
+        min_cruise_ratio = config.getfloat('minimum_cruise_ratio', None,
+                                           below=1., minval=0.)
+        if min_cruise_ratio is None:
+            min_cruise_ratio = 0.5
+            req_accel_to_decel = config.getfloat('max_accel_to_decel', None,
+                                                 above=0.)
+            if req_accel_to_decel is not None:
+                config.deprecate('max_accel_to_decel')
+                min_cruise_ratio = 1. - min(1., (req_accel_to_decel
+                                                 / max_accel))
+        square_corner_velocity = config.getfloat(
+            'square_corner_velocity', 5., minval=0.)
+        return max_velocity, max_accel, min_cruise_ratio, square_corner_velocity
+    def _handle_reload(self, config, sections):
+        config = config.getsection('printer')
+        pconfig = self.printer.lookup_object('configfile')
+        pconfig.check_reload_options(config, [
+            'max_velocity', 'max_accel', 'minimum_cruise_ratio',
+            'square_corner_velocity'])
+        limits = self._parse_velocity_limits(config)
+        def update():
+            (self.max_velocity, self.max_accel, self.min_cruise_ratio,
+             self.square_corner_velocity) = limits
+            self._calc_junction_deviation()
+        return update
     def _calc_junction_deviation(self):
         scv2 = self.square_corner_velocity**2
         self.junction_deviation = scv2 * (math.sqrt(2.) - 1.) / self.max_accel
@@ -189,12 +189,13 @@ class ClientConnection:
         self.request_log = collections.deque([], REQUEST_LOG_SIZE)
 
     def dump_request_log(self):
-        out = []
-        out.append("Dumping %d requests for client %d"
-                   % (len(self.request_log), self.uid,))
+        # Pass the raw values so that the log is formatted in the background
+        fmt = ["Dumping %d requests for client %d"]
+        args = [len(self.request_log), self.uid]
         for eventtime, request in self.request_log:
-            out.append("Received %f: %s" % (eventtime, request))
-        logging.info("\n".join(out))
+            fmt.append("Received %f: %s")
+            args.extend((eventtime, request))
+        logging.info("\n".join(fmt), *args)
 
     def set_client_info(self, client_info, state_msg=None):
         if state_msg is None:
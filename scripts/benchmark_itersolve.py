@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# Benchmark of the step time solvers on a generated series of moves
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import math, optparse, os, random, sys, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import chelper
+
+MCU_FREQ = 72000000.
+MAX_ERROR = .000025
+FLUSH_TIME = .050
+
+KINEMATICS = {
+    'cartesian_x': ('cartesian_stepper_alloc', b'x'),
+    'corexy_plus': ('corexy_stepper_alloc', b'+'),
+    'extruder': ('extruder_stepper_alloc',),
+}
+
+
+######################################################################
+# Move generation
+######################################################################
+
+# Generate a series of randomly placed trapezoidal XY moves
+def gen_moves(options):
+    rnd = random.Random(options.seed)
+    moves = []
+    print_time = .100
+    pos = (100., 100.)
+    total_dist = 0.
+    steps_dist = options.steps * options.step_dist * 2.
+    while total_dist < steps_dist:
+        npos = (rnd.uniform(0., 200.), rnd.uniform(0., 200.))
+        axes_d = (npos[0] - pos[0], npos[1] - pos[1])
+        dist = math.sqrt(axes_d[0]**2 + axes_d[1]**2)
+        if dist < .001:
+            continue
+        accel, max_v = options.accel, options.velocity
+        cruise_v = min(max_v, math.sqrt(accel * dist))
+        accel_t = cruise_v / accel
+        cruise_t = (dist - cruise_v * accel_t) / cruise_v
+        moves.append((print_time, accel_t, max(0., cruise_t), accel_t,
+                      pos[0], pos[1], axes_d[0] / dist, axes_d[1] / dist,
+                      cruise_v, accel))
+        print_time += 2. * accel_t + max(0., cruise_t)
+        pos = npos
+        total_dist += dist
+    return moves, print_time
+
+
+######################################################################
+# Step generation
+######################################################################
+
+def run_solver(kin, moves, end_time, options, linear, max_error=MAX_ERROR):
+    ffi_main, ffi_lib = chelper.get_ffi()
+    trapq = ffi_main.gc(ffi_lib.trapq_alloc(), ffi_lib.trapq_free)
+    epos = 0.
+    for (print_time, accel_t, cruise_t, decel_t, start_x, start_y,
+         axes_r_x, axes_r_y, cruise_v, accel) in moves:
+        if kin == 'extruder':
+            # Use the XY distance as extrusion distance
+            ffi_lib.trapq_append(trapq, print_time, accel_t, cruise_t, decel_t,
+                                 epos, 0., 0., 1., 0., 0., 0., cruise_v, accel)
+            epos += cruise_v * (accel_t + cruise_t)
+        else:
+            ffi_lib.trapq_append(trapq, print_time, accel_t, cruise_t, decel_t,
+                                 start_x, start_y, 0., axes_r_x, axes_r_y, 0.,
+                                 0., cruise_v, accel)
+    alloc_func = KINEMATICS[kin]
+    sk = ffi_main.gc(getattr(ffi_lib, alloc_func[0])(*alloc_func[1:]),
+                     ffi_lib.free)
+    if not linear:
+        ffi_lib.itersolve_set_linear(sk, 0., 0., 0.)
+    sc = ffi_main.gc(ffi_lib.stepcompress_alloc(0), ffi_lib.stepcompress_free)
+    ffi_lib.stepcompress_fill(sc, int(max_error * MCU_FREQ), 0, 0)
+    ss = ffi_main.gc(ffi_lib.steppersync_alloc(ffi_main.NULL, [sc], 1, 1),
+                     ffi_lib.steppersync_free)
+    ffi_lib.steppersync_set_time(ss, 0., MCU_FREQ)
+    ffi_lib.itersolve_set_stepcompress(sk, sc, options.step_dist)
+    ffi_lib.itersolve_set_trapq(sk, trapq)
+    if kin != 'extruder':
+        ffi_lib.itersolve_set_position(sk, moves[0][4], moves[0][5], 0.)
+    # Generate steps
+    flush_time = 0.
+    start_time = time.process_time()
+    while flush_time < end_time:
+        flush_time += FLUSH_TIME
+        ret = ffi_lib.itersolve_generate_steps(sk, flush_time)
+        if ret:
+            raise Exception("Internal error in stepcompress")
+    ret = ffi_lib.stepcompress_reset(sc, 0)
+    cpu_time = time.process_time() - start_time
+    if ret:
+        raise Exception("Internal error in stepcompress")
+    # Extract the resulting step commands
+    max_moves = options.steps * 4
+    data = ffi_main.new('struct pull_history_steps[]', max_moves)
+    count = ffi_lib.stepcompress_extract_old(sc, data, max_moves,
+                                             0, 2**64-1)
+    clocks = []
+    for i in range(count-1, -1, -1):
+        m = data[i]
+        clock, interval = m.first_clock, m.interval
+        for j in range(abs(m.step_count)):
+            clocks.append(clock)
+            interval += m.add
+            clock += interval
+    return cpu_time, count, clocks
+
+
+######################################################################
+# Startup
+######################################################################
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--steps", type="int", default=1000000,
+                    help="approximate number of steps to generate")
+    opts.add_option("-k", "--kinematics", type="string",
+                    default=",".join(sorted(KINEMATICS)),
+                    help="comma separated list of stepper kinematics")
+    opts.add_option("--step_dist", type="float", default=.0125,
+                    help="stepper step distance")
+    opts.add_option("--velocity", type="float", default=300.,
+                    help="maximum move velocity")
+    opts.add_option("--accel", type="float", default=5000.,
+                    help="move acceleration")
+    opts.add_option("--seed", type="int", default=0,
+                    help="random seed for move generation")
+    options, args = opts.parse_args()
+    if len(args) != 0:
+        opts.error("Incorrect number of arguments")
+    kins = [k.strip() for k in options.kinematics.split(',')]
+    for kin in kins:
+        if kin not in KINEMATICS:
+            opts.error("Unknown kinematics '%s'" % (kin,))
+    moves, end_time = gen_moves(options)
+    print("%d moves over %.3f seconds" % (len(moves), end_time))
+    for kin in kins:
+        iter_time, iter_cmds, iter_clocks = run_solver(
+            kin, moves, end_time, options, False)
+        lin_time, lin_cmds, lin_clocks = run_solver(
+            kin, moves, end_time, options, True)
+        msteps = len(iter_clocks) / 1000000.
+        print("%s: %d steps" % (kin, len(iter_clocks)))
+        print("  itersolve %7.3fs per million steps (%d cmds)" % (
+            iter_time / msteps, iter_cmds))
+        print("  linear    %7.3fs per million steps (%d cmds)  %.1fx speedup"
+              % (lin_time / msteps, lin_cmds, iter_time / lin_time))
+        # Compare the uncompressed step times of both solvers
+        iter_clocks = run_solver(kin, moves, end_time, options, False, 0.)[2]
+        lin_clocks = run_solver(kin, moves, end_time, options, True, 0.)[2]
+        if len(iter_clocks) != len(lin_clocks):
+            print("  Step count mismatch (%d vs %d)" % (
+                len(iter_clocks), len(lin_clocks)))
+            continue
+        diff = max([abs(a - b) for a, b in zip(iter_clocks, lin_clocks)])
+        print("  maximum step time difference %.3fus" % (
+            diff * 1000000. / MCU_FREQ,))
+
+if __name__ == '__main__':
+    main()
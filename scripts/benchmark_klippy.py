@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# Benchmark of the host code with a varying number of micro-controllers
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, math, random, time, gc, logging, tempfile
+import multiprocessing
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import klippy, reactor, msgproto
+
+STEP_COMMANDS = ['queue_step', 'set_next_step_dir', 'reset_step_clock']
+LAG_CHECK_TIME = .010
+
+
+######################################################################
+# Config and workload generation
+######################################################################
+
+# Return the mcu pin names available in a data dictionary
+def get_dictionary_pins(dict_fname):
+    mp = msgproto.MessageParser()
+    with open(dict_fname, 'rb') as f:
+        mp.process_identify(f.read(), decompress=False)
+    pins = {}
+    for name, value in mp.get_enumerations().get('pin', {}).items():
+        if value not in pins:
+            pins[value] = name
+    return [pins[v] for v in sorted(pins)]
+
+# Build a printer config with the steppers spread over 'mcu_count' mcus
+def build_config(pins, mcu_count, options):
+    mcu_names = ['mcu'] + ['mcu%d' % (i,) for i in range(1, mcu_count)]
+    mcu_pins = {name: list(pins) for name in mcu_names}
+    steppers = (['stepper_x', 'stepper_y', 'stepper_z']
+                + ['stepper_z%d' % (i,) for i in range(1, options.zcount)]
+                + ['extruder']
+                + ['extruder_stepper e%d' % (i,)
+                   for i in range(1, options.ecount)])
+    def alloc_pin(mcu_name):
+        pin = mcu_pins[mcu_name].pop(0)
+        if mcu_name == 'mcu':
+            return pin
+        return "%s:%s" % (mcu_name, pin)
+    out = []
+    for mcu_name in mcu_names:
+        if mcu_name == 'mcu':
+            out.append("[mcu]\nserial: /dev/null\n")
+        else:
+            out.append("[mcu %s]\nserial: /dev/null\n" % (mcu_name,))
+    out.append("[printer]\nkinematics: cartesian\nmax_velocity: 500\n"
+               "max_accel: 5000\nmax_z_velocity: 50\nmax_z_accel: 500\n")
+    for i, name in enumerate(steppers):
+        mcu_name = mcu_names[i % mcu_count]
+        s = ["[%s]" % (name,),
+             "step_pin: %s" % (alloc_pin(mcu_name),),
+             "dir_pin: %s" % (alloc_pin(mcu_name),),
+             "enable_pin: !%s" % (alloc_pin(mcu_name),),
+             "microsteps: 16"]
+        if name in ('stepper_x', 'stepper_y', 'stepper_z'):
+            s += ["rotation_distance: %d" % (8 if name == 'stepper_z' else 40),
+                  "endstop_pin: ^%s" % (alloc_pin(mcu_name),),
+                  "position_endstop: 0", "position_max: 200",
+                  "homing_speed: 50"]
+        elif name.startswith('stepper_z'):
+            s += ["rotation_distance: 8",
+                  "endstop_pin: ^%s" % (alloc_pin(mcu_name),)]
+        elif name == 'extruder':
+            s += ["rotation_distance: 33.5", "nozzle_diameter: 0.400",
+                  "filament_diameter: 1.750",
+                  "heater_pin: %s" % (alloc_pin(mcu_name),),
+                  "sensor_type: EPCOS 100K B57560G104F",
+                  "sensor_pin: %s" % (alloc_pin(mcu_name),),
+                  "control: watermark", "min_temp: 0", "max_temp: 250",
+                  "min_extrude_temp: 0"]
+        else:
+            s += ["rotation_distance: 33.5", "extruder: extruder"]
+        out.append("\n".join(s) + "\n")
+    return "\n".join(out)
+
+# Generate a "vase mode" style print made of short curved segments
+def build_gcode(options):
+    rnd = random.Random(options.seed)
+    out = ["G28", "G1 X100 Y100 Z0.2 F6000", "M83"]
+    x = y = 100.
+    z = .2
+    heading = 0.
+    total_dist = 0.
+    while total_dist < options.distance:
+        heading += rnd.uniform(-.3, .3)
+        dist = rnd.uniform(.5, 2.)
+        nx = x + math.cos(heading) * dist
+        ny = y + math.sin(heading) * dist
+        if not (20. < nx < 180. and 20. < ny < 180.):
+            # Turn back towards the center of the bed
+            heading = math.atan2(100. - y, 100. - x)
+            continue
+        z = min(z + dist * .0002, 150.)
+        out.append("G1 X%.3f Y%.3f Z%.4f E%.5f F%d" % (
+            nx, ny, z, dist * .033, options.speed * 60.))
+        x, y = nx, ny
+        total_dist += dist
+    return "\n".join(out) + "\n"
+
+
+######################################################################
+# Klippy runs
+######################################################################
+
+class RunResult:
+    def __init__(self):
+        self.print_time = 0.
+        self.cpu_time = 0.
+        self.step_bytes = self.total_bytes = 0
+        self.lookahead_latency = []
+        self.reactor_lag = []
+
+# Record the delay between a move being queued and its step generation
+class LookaheadMonitor:
+    def __init__(self, toolhead, result):
+        self.result = result
+        self.queue_times = {}
+        self.lookahead = toolhead.lookahead
+        self.orig_add_move = self.lookahead.add_move
+        self.orig_process_moves = toolhead._process_moves
+        self.lookahead.add_move = self.add_move
+        toolhead._process_moves = self.process_moves
+    def add_move(self, move):
+        self.queue_times[id(move)] = time.perf_counter()
+        self.orig_add_move(move)
+    def process_moves(self, moves):
+        curtime = time.perf_counter()
+        for move in moves:
+            qtime = self.queue_times.pop(id(move), None)
+            if qtime is not None:
+                self.result.lookahead_latency.append(curtime - qtime)
+        self.orig_process_moves(moves)
+
+# Record how late a periodic reactor timer is run
+class ReactorLagMonitor:
+    def __init__(self, reactor, result):
+        self.reactor = reactor
+        self.result = result
+        self.waketime = reactor.monotonic()
+        reactor.register_timer(self.check_lag, self.waketime)
+    def check_lag(self, eventtime):
+        curtime = self.reactor.monotonic()
+        self.result.reactor_lag.append(max(0., curtime - self.waketime))
+        self.waketime = curtime + LAG_CHECK_TIME
+        return self.waketime
+
+def count_output_bytes(dict_fname, out_fname, result):
+    mp = msgproto.MessageParser()
+    with open(dict_fname, 'rb') as f:
+        mp.process_identify(f.read(), decompress=False)
+    with open(out_fname, 'rb') as f:
+        data = bytearray(f.read())
+    result.total_bytes += len(data)
+    while 1:
+        l = mp.check_packet(data)
+        if l == 0:
+            break
+        if l < 0:
+            data = data[-l:]
+            continue
+        pos = msgproto.MESSAGE_HEADER_SIZE
+        while pos < l - msgproto.MESSAGE_TRAILER_SIZE:
+            mid = mp.messages_by_id.get(data[pos], mp.unknown)
+            params, next_pos = mid.parse(data, pos)
+            if mid.name in STEP_COMMANDS:
+                result.step_bytes += next_pos - pos
+            pos = next_pos
+        data = data[l:]
+
+def run_klippy(workdir, config, gcode, dict_fname, mcu_count):
+    logging.getLogger().setLevel(logging.WARNING)
+    gc.disable()
+    result = RunResult()
+    cfg_fname = os.path.join(workdir, "printer.cfg")
+    gcode_fname = os.path.join(workdir, "workload.gcode")
+    out_fname = os.path.join(workdir, "output.serial")
+    with open(cfg_fname, 'w') as f:
+        f.write(config)
+    with open(gcode_fname, 'w') as f:
+        f.write(gcode)
+    gcode_file = open(gcode_fname, 'rb')
+    start_args = {'config_file': cfg_fname, 'apiserver': None,
+                  'start_reason': 'startup', 'debuginput': gcode_fname,
+                  'gcode_fd': gcode_file.fileno(), 'debugoutput': out_fname,
+                  'dictionary': dict_fname, 'software_version': '?',
+                  'cpu_info': '?'}
+    out_fnames = [out_fname]
+    for i in range(1, mcu_count):
+        start_args['dictionary_mcu%d' % (i,)] = dict_fname
+        out_fnames.append("%s-mcu%d" % (out_fname, i))
+    gc.collect()
+    main_reactor = reactor.Reactor(gc_checking=True)
+    printer = klippy.Printer(main_reactor, None, start_args)
+    start_times = []
+    def handle_connect():
+        toolhead = printer.lookup_object('toolhead')
+        LookaheadMonitor(toolhead, result)
+        ReactorLagMonitor(main_reactor, result)
+    def handle_ready():
+        # Don't count the startup (config parsing and mcu setup)
+        start_times.append(time.process_time())
+    def handle_request_restart(print_time):
+        result.print_time = print_time
+    printer.register_event_handler("klippy:connect", handle_connect)
+    printer.register_event_handler("klippy:ready", handle_ready)
+    printer.register_event_handler("gcode:request_restart",
+                                   handle_request_restart)
+    res = printer.run()
+    if start_times:
+        result.cpu_time = time.process_time() - start_times[0]
+    main_reactor.finalize()
+    gcode_file.close()
+    if res != 'exit':
+        raise Exception("Klippy run failed (%s)" % (res,))
+    for fname in out_fnames:
+        count_output_bytes(dict_fname, fname, result)
+    return result
+
+# Run klippy in a new python process so that each run starts from the
+# same state (independent of the runs made before it)
+def run_klippy_process(*args):
+    ctx = multiprocessing.get_context('spawn')
+    pool = ctx.Pool(1)
+    try:
+        return pool.apply(run_klippy, args)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+######################################################################
+# Startup
+######################################################################
+
+def format_times(times):
+    if not times:
+        return "     -/-     "
+    return "%6.2f/%-6.2f" % (sum(times) * 1000. / len(times),
+                             max(times) * 1000.)
+
+def main():
+    usage = "%prog [options] <dictionary> [<gcode file> ...]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-m", "--mcus", type="string", default="1,2,4,8",
+                    help="comma separated list of mcu counts to test")
+    opts.add_option("-z", "--zcount", type="int", default=4,
+                    help="number of z steppers")
+    opts.add_option("-e", "--ecount", type="int", default=2,
+                    help="number of extruder steppers")
+    opts.add_option("--distance", type="float", default=20000.,
+                    help="xy distance of the generated workload (in mm)")
+    opts.add_option("--speed", type="float", default=150.,
+                    help="velocity of the generated workload (in mm/s)")
+    opts.add_option("--seed", type="int", default=0,
+                    help="random seed for the generated workload")
+    opts.add_option("-r", "--repeat", type="int", default=3,
+                    help="number of runs of each test (the run with the"
+                    " lowest cpu time is reported)")
+    options, args = opts.parse_args()
+    if len(args) < 1:
+        opts.error("Incorrect number of arguments")
+    dict_fname = os.path.abspath(args[0])
+    mcu_counts = [int(c) for c in options.mcus.split(',')]
+    workloads = [("generated", build_gcode(options))]
+    for fname in args[1:]:
+        with open(fname, 'r') as f:
+            workloads.append((os.path.basename(fname),
+                              "G28\n" + f.read() + "\n"))
+    pins = get_dictionary_pins(dict_fname)
+    print("%-10s %4s %8s %8s %9s %10s %10s %14s %14s" % (
+        "workload", "mcus", "print_t", "cpu_t", "cpu/print", "step_B/s",
+        "total_B/s", "lookahead(ms)", "reactor(ms)"))
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, gcode in workloads:
+            for mcu_count in mcu_counts:
+                config = build_config(pins, mcu_count, options)
+                runs = [run_klippy_process(workdir, config, gcode,
+                                           dict_fname, mcu_count)
+                        for i in range(max(1, options.repeat))]
+                res = min(runs, key=lambda r: r.cpu_time)
+                pt = max(res.print_time, .001)
+                print("%-10s %4d %8.2f %8.3f %9.4f %10.0f %10.0f %14s %14s"
+                      % (name[:10], mcu_count, res.print_time, res.cpu_time,
+                         res.cpu_time / pt, res.step_bytes / pt,
+                         res.total_bytes / pt,
+                         format_times(res.lookahead_latency),
+                         format_times(res.reactor_lag)))
+                sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
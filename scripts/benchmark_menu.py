@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Benchmark of the lcd menu code with a large generated menu tree
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, gc, logging, tempfile
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import klippy, reactor, msgproto
+from extras.display import menu
+
+# Return the mcu pin names available in a data dictionary
+def get_dictionary_pins(dict_fname):
+    mp = msgproto.MessageParser()
+    with open(dict_fname, 'rb') as f:
+        mp.process_identify(f.read(), decompress=False)
+    pins = {}
+    for name, value in mp.get_enumerations().get('pin', {}).items():
+        if value not in pins:
+            pins[value] = name
+    return [pins[v] for v in sorted(pins)]
+
+# Build a printer config with a menu of 'count' items in lists of 'width'
+def build_config(pins, options):
+    out = ["[mcu]\nserial: /dev/null\n",
+           "[printer]\nkinematics: none\nmax_velocity: 1\nmax_accel: 1\n"]
+    lcd_pins = ["%s_pin: %s" % (name, pins.pop(0))
+                for name in ['rs', 'e', 'd4', 'd5', 'd6', 'd7']]
+    out.append("[display]\nlcd_type: hd44780\nmenu_root: bench\n"
+               + "\n".join(lcd_pins) + "\n")
+    out.append("[menu bench]\ntype: list\nname: Benchmark\n")
+    for i in range(0, options.count, options.width):
+        lname = "bench list%d" % (i // options.width,)
+        out.append("[menu %s]\ntype: list\nname: List %d\n"
+                   % (lname, i // options.width))
+        for j in range(i, min(i + options.width, options.count)):
+            s = ["[menu %s item%d]" % (lname, j), "type: command",
+                 "gcode: M117 item%d" % (j,)]
+            if j & 1:
+                s.append("name: Item %d: { printer.idle_timeout.state }"
+                         % (j,))
+            else:
+                s.append("name: Item %d" % (j,))
+            if j % 3 == 0:
+                s.append("enable: { printer.idle_timeout.state != 'x' }")
+            out.append("\n".join(s) + "\n")
+    return "\n".join(out)
+
+def time_func(func, *args):
+    start_time = time.process_time()
+    func(*args)
+    return (time.process_time() - start_time) * 1000.
+
+# Navigate the menu and report the time spent in each operation
+def run_benchmark(printer, results, options):
+    display = printer.lookup_object('display')
+    manager = printer.lookup_object('menu')
+    eventtime = printer.get_reactor().monotonic()
+    results['open'] = time_func(manager.begin, eventtime)
+    manager.down()
+    redraw_times = []
+    for i in range(options.count // options.width):
+        results['open'] += time_func(manager.press)
+        for j in range(options.scroll):
+            eventtime += .100
+            manager.down()
+            redraw_times.append(time_func(display.screen_update_event,
+                                          eventtime))
+        manager.back()
+        manager.down()
+    results['redraw'] = sum(redraw_times) / len(redraw_times)
+    results['redraw_max'] = max(redraw_times)
+
+def run_klippy(workdir, config, dict_fname, options):
+    results = {}
+    cfg_fname = os.path.join(workdir, "printer.cfg")
+    gcode_fname = os.path.join(workdir, "workload.gcode")
+    out_fname = os.path.join(workdir, "output.serial")
+    with open(cfg_fname, 'w') as f:
+        f.write(config)
+    with open(gcode_fname, 'w') as f:
+        f.write("\n")
+    gcode_file = open(gcode_fname, 'rb')
+    start_args = {'config_file': cfg_fname, 'apiserver': None,
+                  'start_reason': 'startup', 'debuginput': gcode_fname,
+                  'gcode_fd': gcode_file.fileno(), 'debugoutput': out_fname,
+                  'dictionary': dict_fname, 'software_version': '?',
+                  'cpu_info': '?'}
+    # Time the loading of the menu config
+    orig_init = menu.MenuManager.__init__
+    def init_wrapper(*args):
+        results['load'] = time_func(orig_init, *args)
+    menu.MenuManager.__init__ = init_wrapper
+    main_reactor = reactor.Reactor()
+    printer = klippy.Printer(main_reactor, None, start_args)
+    def handle_ready():
+        run_benchmark(printer, results, options)
+    printer.register_event_handler("klippy:ready", handle_ready)
+    try:
+        res = printer.run()
+    finally:
+        menu.MenuManager.__init__ = orig_init
+        main_reactor.finalize()
+        gcode_file.close()
+    if res != 'exit' or 'redraw' not in results:
+        raise Exception("Klippy run failed (%s)" % (res,))
+    return results
+
+def main():
+    usage = "%prog [options] <dictionary>"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--count", type="int", default=500,
+                    help="number of menu items")
+    opts.add_option("-w", "--width", type="int", default=50,
+                    help="number of menu items in each menu list")
+    opts.add_option("-s", "--scroll", type="int", default=20,
+                    help="number of items to scroll through in each list")
+    options, args = opts.parse_args()
+    if len(args) != 1:
+        opts.error("Incorrect number of arguments")
+    dict_fname = os.path.abspath(args[0])
+    config = build_config(get_dictionary_pins(dict_fname), options)
+    logging.getLogger().setLevel(logging.WARNING)
+    gc.disable()
+    with tempfile.TemporaryDirectory() as workdir:
+        res = run_klippy(workdir, config, dict_fname, options)
+    print("menu items: %d (lists of %d)" % (options.count, options.width))
+    print("load config:     %8.2f ms" % (res['load'],))
+    print("open menus:      %8.2f ms" % (res['open'],))
+    print("redraw avg/max:  %8.3f/%.3f ms" % (res['redraw'],
+                                              res['redraw_max']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# Benchmark of the host command encoding and queuing code
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import optparse, os, sys, time, tempfile
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import chelper, msgproto
+
+COMMANDS = [
+    ("queue_digital_out oid=%c clock=%u on_ticks=%u", [5, 123456789, 16000]),
+    ("set_next_step_dir oid=%c dir=%c", [3, 1]),
+    ("queue_step oid=%c interval=%u count=%hu add=%hi", [2, 40000, 120, -3]),
+    ("neopixel_update oid=%c pos=%hu data=%*s",
+     [0, 6, bytearray(b'abcdefghi')]),
+]
+
+# Reference encoder (one PT_xxx.encode() call per parameter)
+def encode_reference(mf, params):
+    out = [mf.msgid]
+    for t, v in zip(mf.param_types, params):
+        t.encode(out, v)
+    return out
+
+# Check that serialqueue_encode_and_send() produces the same message as
+# the python encoder (the message id is a raw byte, not a vlq)
+def check_c_encode(ffi_lib, mf, params):
+    with tempfile.TemporaryFile() as f:
+        sq = ffi_lib.serialqueue_alloc(f.fileno(), b'f', 0)
+        cq = ffi_lib.serialqueue_alloc_commandqueue()
+        ret = ffi_lib.serialqueue_encode_and_send(sq, cq, mf.msgid, params,
+                                                  len(params), 0, 0)
+        end_time = time.time() + 1.
+        while not ret and not os.fstat(f.fileno()).st_size:
+            if time.time() > end_time:
+                break
+            time.sleep(.001)
+        ffi_lib.serialqueue_exit(sq)
+        ffi_lib.serialqueue_free(sq)
+        ffi_lib.serialqueue_free_commandqueue(cq)
+        f.seek(0)
+        data = f.read()
+    msg = data[msgproto.MESSAGE_HEADER_SIZE:-msgproto.MESSAGE_TRAILER_SIZE]
+    if ret or bytearray(msg) != bytearray(mf.encode(params)):
+        raise Exception("C encoding mismatch on %s (msgid %d)"
+                        % (mf.name, mf.msgid))
+
+def time_calls(func, count):
+    start_time = time.process_time()
+    for i in range(count):
+        func()
+    return (time.process_time() - start_time) * 1000000. / count
+
+def main():
+    usage = "%prog [options] <dictionary>"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--count", type="int", default=200000,
+                    help="number of times to encode each command")
+    options, args = opts.parse_args()
+    if len(args) != 1:
+        opts.error("Incorrect number of arguments")
+    mp = msgproto.MessageParser()
+    with open(args[0], 'rb') as f:
+        mp.process_identify(f.read(), decompress=False)
+    ffi_main, ffi_lib = chelper.get_ffi()
+    fd = os.open(os.devnull, os.O_WRONLY)
+    sq = ffi_lib.serialqueue_alloc(fd, b'f', 0)
+    cq = ffi_main.gc(ffi_lib.serialqueue_alloc_commandqueue(),
+                     ffi_lib.serialqueue_free_commandqueue)
+    count = options.count
+    for msgformat, params in COMMANDS:
+        try:
+            mf = mp.lookup_command(msgformat)
+        except mp.error as e:
+            print("%s: not in dictionary" % (msgformat.split()[0],))
+            continue
+        if mf.encode(params) != encode_reference(mf, params):
+            raise Exception("Encoding mismatch on %s" % (mf.name,))
+        if mf.int_params:
+            # Also check a message id (96-127) that is not a 1 byte vlq
+            check_c_encode(ffi_lib, mf, params)
+            check_c_encode(ffi_lib, msgproto.MessageFormat(
+                100, mf.msgformat), params)
+        ref_time = time_calls(lambda: encode_reference(mf, params), count)
+        enc_time = time_calls(lambda: mf.encode(params), count)
+        def send_python():
+            cmd = mf.encode(params)
+            ffi_lib.serialqueue_send(sq, cq, cmd, len(cmd), 0, 0, 0)
+        send_time = time_calls(send_python, count)
+        res = "%-18s encode %.3fus (reference %.3fus)  encode+send %.3fus" % (
+            mf.name, enc_time, ref_time, send_time)
+        if mf.int_params:
+            send_c = lambda: ffi_lib.serialqueue_encode_and_send(
+                sq, cq, mf.msgid, params, len(params), 0, 0)
+            res += " (in C %.3fus)" % (time_calls(send_c, count),)
+        print(res)
+    ffi_lib.serialqueue_exit(sq)
+    ffi_lib.serialqueue_free(sq)
+    os.close(fd)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# Benchmark of the input shaper fitting on recorded calibration data
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import importlib, optparse, os, sys, time
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+shaper_calibrate = importlib.import_module('.shaper_calibrate', 'extras')
+shaper_defs = importlib.import_module('.shaper_defs', 'extras')
+bulk_sensor = importlib.import_module('.bulk_sensor', 'extras')
+
+# Load raw accelerometer data (capture or CSV files) or calibration data
+# (as produced by TEST_RESONANCES, SHAPER_CALIBRATE or calibrate_shaper.py)
+def load_calibration_data(helper, logname):
+    if bulk_sensor.is_capture_file(logname):
+        data = bulk_sensor.load_capture_file(np, logname)[0]
+        calibration_data = helper.process_accelerometer_data(data)
+        calibration_data.normalize_to_frequencies()
+        return calibration_data
+    with open(logname) as f:
+        for header in f:
+            if not header.startswith('#'):
+                break
+    if not header.startswith('freq,psd_x,psd_y,psd_z,psd_xyz'):
+        data = np.loadtxt(logname, comments='#', delimiter=',')
+        calibration_data = helper.process_accelerometer_data(data)
+        calibration_data.normalize_to_frequencies()
+        return calibration_data
+    data = np.loadtxt(logname, skiprows=1, comments='#', delimiter=',')
+    calibration_data = shaper_calibrate.CalibrationData(
+            freq_bins=data[:,0], psd_sum=data[:,4],
+            psd_x=data[:,1], psd_y=data[:,2], psd_z=data[:,3])
+    calibration_data.set_numpy(np)
+    if 'mzv' not in header:
+        calibration_data.normalize_to_frequencies()
+    return calibration_data
+
+# Choose the best shaper from a list of fitted shapers
+def pick_best(helper, shapers):
+    return helper.select_best_shaper(
+            shaper_calibrate.CalculationResult(shapers))[0]
+
+def run_benchmark(helper, calibration_data, shaper_cfgs, options):
+    args = (calibration_data, None, None, options.scv, options.max_smoothing,
+            None, options.max_freq)
+    # Per-frequency evaluation (fit_shaper)
+    start_time = time.time()
+    for i in range(options.iterations):
+        loop_shapers = [helper.fit_shaper(cfg, *args) for cfg in shaper_cfgs]
+    loop_time = (time.time() - start_time) / options.iterations
+    # Batched evaluation (fit_shapers)
+    start_time = time.time()
+    for i in range(options.iterations):
+        batch_shapers = helper.fit_shapers(shaper_cfgs, *args)
+    batch_time = (time.time() - start_time) / options.iterations
+    for loop_res, batch_res in zip(loop_shapers, batch_shapers):
+        print("  %-9s loop %6.1f Hz (vibr %.4f, max_accel %.0f)"
+              "  batch %6.1f Hz (vibr %.4f, max_accel %.0f)" % (
+                  loop_res.name, loop_res.freq, loop_res.vibrs,
+                  loop_res.max_accel, batch_res.freq, batch_res.vibrs,
+                  batch_res.max_accel))
+    loop_best = pick_best(helper, loop_shapers)
+    batch_best = pick_best(helper, batch_shapers)
+    same = (loop_best.name == batch_best.name
+            and abs(loop_best.freq - batch_best.freq) < 1e-6)
+    print("  Selected: loop %s @ %.1f Hz, batch %s @ %.1f Hz (%s)" % (
+        loop_best.name, loop_best.freq, batch_best.name, batch_best.freq,
+        "match" if same else "MISMATCH"))
+    print("  Time: loop %.3fs, batch %.3fs (%.1fx speedup)" % (
+        loop_time, batch_time, loop_time / batch_time))
+    return same
+
+def main():
+    usage = "%prog [options] <logs>"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-f", "--max_freq", type="float", default=200.,
+                    help="maximum frequency to consider")
+    opts.add_option("-s", "--max_smoothing", type="float", dest="max_smoothing",
+                    default=None, help="maximum shaper smoothing to allow")
+    opts.add_option("--scv", "--square_corner_velocity", type="float",
+                    dest="scv", default=5., help="square corner velocity")
+    opts.add_option("-n", "--iterations", type="int", default=1,
+                    help="number of times to repeat each measurement")
+    options, args = opts.parse_args()
+    if len(args) < 1:
+        opts.error("Incorrect number of arguments")
+    helper = shaper_calibrate.ShaperCalibrate(printer=None)
+    shaper_cfgs = shaper_defs.INPUT_SHAPERS
+    all_same = True
+    for logname in args:
+        print("%s:" % (logname,))
+        calibration_data = load_calibration_data(helper, logname)
+        all_same &= run_benchmark(helper, calibration_data, shaper_cfgs,
+                                  options)
+    if not all_same:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# Benchmark of the step compression strategies on recorded step times
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import math, optparse, os, sys, time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '..', 'klippy'))
+import chelper, msgproto, stepper
+
+QUEUE_STEP = "queue_step oid=%c interval=%u count=%hu add=%hi"
+SET_NEXT_STEP_DIR = "set_next_step_dir oid=%c dir=%c"
+
+
+######################################################################
+# Recorded step streams
+######################################################################
+
+# Step times of one stepper stored as runs of steps in the same
+# direction.  A direction of -1 notes a reset of the step clock (as
+# sent after homing).
+class StepStream:
+    def __init__(self, oid):
+        self.oid = oid
+        self.clock = 0
+        self.sdir = 0
+        self.runs = []
+    def reset_clock(self, clock):
+        self.clock += (clock - self.clock) & 0xffffffff
+        self.runs.append((-1, [self.clock]))
+    def set_dir(self, sdir):
+        self.sdir = sdir
+    def queue_step(self, interval, count, add):
+        if not self.runs or self.runs[-1][0] != self.sdir:
+            self.runs.append((self.sdir, []))
+        clocks = self.runs[-1][1]
+        clock = self.clock
+        for i in range(count):
+            clock += interval
+            clocks.append(clock)
+            interval += add
+        self.clock = clock
+    def get_step_clocks(self):
+        return [c for sdir, clocks in self.runs if sdir >= 0 for c in clocks]
+
+# Extract the step times of each stepper from a serial port data dump
+# (as produced by "klippy.py -o <file> -d <dictionary>")
+def read_step_streams(mp, data_filename):
+    streams = {}
+    def get_stream(oid):
+        s = streams.get(oid)
+        if s is None:
+            s = streams[oid] = StepStream(oid)
+        return s
+    with open(data_filename, 'rb') as f:
+        data = bytearray(f.read())
+    while 1:
+        l = mp.check_packet(data)
+        if l == 0:
+            break
+        if l < 0:
+            data = data[-l:]
+            continue
+        pos = msgproto.MESSAGE_HEADER_SIZE
+        while pos < l - msgproto.MESSAGE_TRAILER_SIZE:
+            mid = mp.messages_by_id.get(data[pos], mp.unknown)
+            params, pos = mid.parse(data, pos)
+            if mid.name == 'queue_step':
+                get_stream(params['oid']).queue_step(
+                    params['interval'], params['count'], params['add'])
+            elif mid.name == 'set_next_step_dir':
+                get_stream(params['oid']).set_dir(params['dir'])
+            elif mid.name == 'reset_step_clock':
+                get_stream(params['oid']).reset_clock(params['clock'])
+        data = data[l:]
+    return [streams[oid] for oid in sorted(streams)
+            if streams[oid].get_step_clocks()]
+
+
+######################################################################
+# Compression replay
+######################################################################
+
+class ReplayResult:
+    def __init__(self, steps, commands, payload, cpu_time, max_error):
+        self.steps = steps
+        self.commands = commands
+        self.payload = payload
+        self.cpu_time = cpu_time
+        self.max_error = max_error
+    def __add__(self, other):
+        return ReplayResult(self.steps + other.steps,
+                            self.commands + other.commands,
+                            self.payload + other.payload,
+                            self.cpu_time + other.cpu_time,
+                            max(self.max_error, other.max_error))
+
+# Compress the steps of a stream and compare the result to the input
+def replay_stream(mp, stream, mode, mcu_freq, max_error):
+    ffi_main, ffi_lib = chelper.get_ffi()
+    sc = ffi_main.gc(ffi_lib.stepcompress_alloc(stream.oid),
+                     ffi_lib.stepcompress_free)
+    ffi_lib.stepcompress_fill(sc, max_error, 0, 0)
+    ffi_lib.stepcompress_set_compress_mode(sc, mode)
+    runs = [(sdir, ffi_main.new('uint64_t[]', clocks), len(clocks))
+            for sdir, clocks in stream.runs]
+    start_time = time.process_time()
+    for sdir, clocks, count in runs:
+        if sdir < 0:
+            ret = ffi_lib.stepcompress_reset(sc, clocks[0])
+        else:
+            ret = ffi_lib.stepcompress_append_clocks(sc, sdir, clocks, count)
+        if ret:
+            raise Exception("Internal error in stepcompress")
+    ret = ffi_lib.stepcompress_reset(sc, 0)
+    cpu_time = time.process_time() - start_time
+    if ret:
+        raise Exception("Internal error in stepcompress")
+    # Extract the generated step commands
+    orig_clocks = stream.get_step_clocks()
+    max_moves = len(orig_clocks)
+    data = ffi_main.new('struct pull_history_steps[]', max_moves)
+    count = ffi_lib.stepcompress_extract_old(sc, data, max_moves,
+                                             0, 2**64-1)
+    moves = [data[i] for i in range(count-1, -1, -1)]
+    # Calculate command sizes and timing errors
+    step_cmd = mp.lookup_command(QUEUE_STEP)
+    dir_cmd = mp.lookup_command(SET_NEXT_STEP_DIR)
+    payload = 0
+    sdir = None
+    clocks = []
+    for m in moves:
+        move_dir = m.step_count > 0
+        if move_dir != sdir:
+            sdir = move_dir
+            payload += len(dir_cmd.encode([stream.oid, sdir]))
+        count = abs(m.step_count)
+        payload += len(step_cmd.encode([stream.oid, m.interval, count, m.add]))
+        clock, interval = m.first_clock, m.interval
+        for i in range(count):
+            clocks.append(clock)
+            interval += m.add
+            clock += interval
+    if len(clocks) != len(orig_clocks):
+        raise Exception("Step count mismatch on oid %d (%d vs %d)" % (
+            stream.oid, len(clocks), len(orig_clocks)))
+    err = max([abs(c - o) for c, o in zip(clocks, orig_clocks)])
+    return ReplayResult(len(clocks), len(moves), payload, cpu_time,
+                        err / mcu_freq)
+
+# Estimate the bytes sent including the message block framing
+def calc_wire_bytes(payload):
+    blocks = math.ceil(payload / msgproto.MESSAGE_PAYLOAD_MAX)
+    return payload + blocks * msgproto.MESSAGE_MIN
+
+
+######################################################################
+# Startup
+######################################################################
+
+def main():
+    usage = "%prog [options] <dictionary> <serial dump> [<serial dump> ...]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-e", "--max_error", type="float", default=0.000025,
+                    help="maximum step time error (in seconds)")
+    modes = sorted(stepper.STEP_COMPRESS_MODES,
+                   key=stepper.STEP_COMPRESS_MODES.get)
+    opts.add_option("-m", "--modes", type="string", default=",".join(modes),
+                    help="comma separated list of compression strategies")
+    options, args = opts.parse_args()
+    if len(args) < 2:
+        opts.error("Incorrect number of arguments")
+    modes = [m.strip() for m in options.modes.split(',')]
+    for m in modes:
+        if m not in stepper.STEP_COMPRESS_MODES:
+            opts.error("Unknown compression strategy '%s'" % (m,))
+    mp = msgproto.MessageParser()
+    with open(args[0], 'rb') as f:
+        mp.process_identify(f.read(), decompress=False)
+    mcu_freq = mp.get_constant_float('CLOCK_FREQ')
+    max_error = int(options.max_error * mcu_freq)
+    for data_filename in args[1:]:
+        streams = read_step_streams(mp, data_filename)
+        if not streams:
+            print("%s: no step commands found" % (data_filename,))
+            continue
+        step_clocks = [s.get_step_clocks() for s in streams]
+        first = min([c[0] for c in step_clocks])
+        last = max([c[-1] for c in step_clocks])
+        duration = max(1., last - first) / mcu_freq
+        print("%s: %d steppers, %d steps over %.3f seconds" % (
+            data_filename, len(streams), sum(map(len, step_clocks)),
+            duration))
+        for mode in modes:
+            res = ReplayResult(0, 0, 0, 0., 0.)
+            for s in streams:
+                res += replay_stream(mp, s, stepper.STEP_COMPRESS_MODES[mode],
+                                     mcu_freq, max_error)
+            print("  %-8s %7d cmds %6.1f steps/cmd %9.1f bytes/s"
+                  "  cpu %6.3fs (%5.1fns/step)  max error %.2fus" % (
+                      mode, res.commands, res.steps / float(res.commands),
+                      calc_wire_bytes(res.payload) / duration, res.cpu_time,
+                      res.cpu_time * 1000000000. / res.steps,
+                      res.max_error * 1000000.))
+
+if __name__ == '__main__':
+    main()
@@ -12,10 +12,14 @@ import numpy as np, matplotlib
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
                              '..', 'klippy'))
 shaper_calibrate = importlib.import_module('.shaper_calibrate', 'extras')
+bulk_sensor = importlib.import_module('.bulk_sensor', 'extras')
 
 MAX_TITLE_LENGTH=65
 
 def parse_log(logname):
+    if bulk_sensor.is_capture_file(logname):
+        # Raw accelerometer data in binary capture format
+        return bulk_sensor.load_capture_file(np, logname)[0]
     with open(logname) as f:
         for header in f:
             if not header.startswith('#'):
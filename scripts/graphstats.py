@@ -6,6 +6,7 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import optparse, datetime
 import matplotlib
+import logindex
 
 MAXBANDWIDTH=25000.
 MAXBUFFER=2.
@@ -23,31 +24,23 @@ def parse_log(logname, mcu):
         mcu = "mcu"
     mcu_prefix = mcu + ":"
     apply_prefix = { p: 1 for p in APPLY_PREFIX }
-    f = open(logname, 'r')
+    index = logindex.LogIndex(logname)
+    index.update()
     out = []
-    for line in f:
-        parts = line.split()
-        if not parts or parts[0] not in ('Stats', 'INFO:root:Stats'):
-            #if parts and parts[0] == 'INFO:root:shutdown:':
-            #    break
-            continue
-        prefix = ""
-        keyparts = {}
-        for p in parts[2:]:
-            if '=' not in p:
-                prefix = p
-                if prefix == mcu_prefix:
-                    prefix = ''
-                continue
-            name, val = p.split('=', 1)
+    for keys, times, values in index.get_stats():
+        names = []
+        for prefix, name in keys:
+            if prefix == mcu_prefix:
+                prefix = ''
             if name in apply_prefix:
                 name = prefix + name
-            keyparts[name] = val
-        if 'print_time' not in keyparts:
+            names.append(name)
+        if 'print_time' not in names:
             continue
-        keyparts['#sampletime'] = float(parts[1][:-1])
-        out.append(keyparts)
-    f.close()
+        for sampletime, vals in zip(times, values):
+            keyparts = dict(zip(names, vals))
+            keyparts['#sampletime'] = sampletime
+            out.append(keyparts)
     return out
 
 def setup_matplotlib(output_to_file):
@@ -4,7 +4,8 @@
 # Copyright (C) 2017  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import sys, re, collections, ast, itertools
+import sys, re, ast, itertools
+import logindex
 
 def format_comment(line_num, line):
     return "# %6d: %s" % (line_num, line)
@@ -578,38 +579,48 @@ class GatherShutdown:
 
 def main():
     logname = sys.argv[1]
+    index = logindex.LogIndex(logname, load_stats=False)
+    index.update()
     last_git = last_start = None
     configs = {}
-    handler = None
-    recent_lines = collections.deque([], 200)
-    # Parse log file
-    with open(logname, 'rt') as f:
-        for line_num, line in enumerate(f):
-            line = line.rstrip()
-            line_num += 1
-            recent_lines.append((line_num, line))
-            if handler is not None:
-                ret = handler.add_line(line_num, line)
-                if ret:
-                    continue
-                recent_lines.clear()
-                handler = None
-            if line.startswith('Git version'):
-                last_git = format_comment(line_num, line)
-            elif line.startswith('Start printer at'):
-                last_start = format_comment(line_num, line)
-            elif line == '===== Config file =====':
-                handler = GatherConfig(configs, line_num,
-                                       recent_lines, logname)
-                handler.add_comment(last_git)
-                handler.add_comment(last_start)
-            elif 'shutdown: ' in line or line.startswith('Dumping '):
-                handler = GatherShutdown(configs, line_num,
-                                         recent_lines, logname)
-                handler.add_comment(last_git)
-                handler.add_comment(last_start)
-    if handler is not None:
-        handler.finalize()
+    # Lines before recent_start are not passed to a shutdown handler
+    # and lines before next_line were already handled
+    recent_start = next_line = 1
+    for line_num, event, text in index.get_events():
+        if event == 'git':
+            last_git = format_comment(line_num, text)
+        elif event == 'start':
+            last_start = format_comment(line_num, text)
+        elif event == 'config':
+            handler = GatherConfig(configs, line_num, [], logname)
+            handler.add_comment(last_git)
+            handler.add_comment(last_start)
+            for i, line in enumerate(text):
+                handler.add_line(line_num + i + 1, line)
+            end_line_num = line_num + len(text) + 1
+            handler.add_line(end_line_num, '=======================')
+            recent_start = end_line_num + 1
+        elif event == 'shutdown' and line_num >= next_line:
+            # Read the log around the shutdown
+            start = max(recent_start, line_num - 199)
+            lines = index.read_lines(min(start, line_num + 1))
+            recent_lines = []
+            if start <= line_num:
+                for info in lines:
+                    recent_lines.append(info)
+                    if info[0] >= line_num:
+                        break
+            handler = GatherShutdown(configs, line_num,
+                                     recent_lines, logname)
+            handler.add_comment(last_git)
+            handler.add_comment(last_start)
+            for next_line, line in lines:
+                if not handler.add_line(next_line, line):
+                    break
+            else:
+                handler.finalize()
+                break
+            recent_start = next_line + 1
     # Write found config files
     for cfg in configs.values():
         cfg.write_file()
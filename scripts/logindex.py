@@ -0,0 +1,214 @@
+# Streaming klippy.log parser that maintains an on-disk index of the log
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import os, re, json, gzip
+
+INDEX_VERSION = 1
+LINE_CHECKPOINT = 1000
+STATS_BLOCK = 1000
+STATS_RECORD = b'{"type":"stats",'
+
+def is_stats_line(line):
+    return line.startswith('Stats ') or line.startswith('INFO:root:Stats ')
+
+def is_shutdown_line(line):
+    return 'shutdown: ' in line or line.startswith('Dumping ')
+
+stats_value_r = re.compile(r"=(\S*)")
+
+# Split a "Stats" line into its sample time, its layout (the line with
+# the values removed), and its space separated values
+def parse_stats(line):
+    parts = line.split(None, 2)
+    stats = parts[2] if len(parts) > 2 else ""
+    values = " ".join(stats_value_r.findall(stats))
+    return float(parts[1][:-1]), stats_value_r.sub("=", stats), values
+
+# Convert a stats layout into a list of (prefix, name) keys
+def layout_keys(layout):
+    prefix = ""
+    keys = []
+    for p in layout.split():
+        if not p.endswith('='):
+            prefix = p
+            continue
+        keys.append((prefix, p[:-1]))
+    return keys
+
+# Index of a klippy.log file. The index is stored in a gzip file as a
+# series of json records and is extended as the log file grows.
+class LogIndex:
+    def __init__(self, logname, load_stats=True):
+        self.logname = logname
+        self.index_name = logname + ".index.gz"
+        self.load_stats = load_stats
+        self._reset()
+    def _reset(self):
+        self.first_line = None
+        # Parse position (next line number and its file offset)
+        self.line_num = 1
+        self.offset = 0
+        self.checkpoints = [(1, 0)]
+        # [(layout, [sampletime, ...], ["value value ...", ...]), ...]
+        self.stats = []
+        # [(line_num, event, line), ...] - event is one of 'git',
+        # 'start', 'config' (line is the list of config lines), or
+        # 'shutdown' (a possible start of shutdown information)
+        self.events = []
+    def _add_record(self, rec):
+        rtype = rec['type']
+        if rtype == 'stats':
+            if self.load_stats:
+                self.stats.append((rec['layout'], rec['times'],
+                                   rec['values']))
+        elif rtype == 'event':
+            self.events.append((rec['line'], rec['event'], rec['text']))
+        elif rtype == 'checkpoint':
+            self.checkpoints.append((rec['line'], rec['offset']))
+        elif rtype == 'position':
+            self.line_num = rec['line']
+            self.offset = rec['offset']
+        elif rtype == 'header':
+            self.first_line = rec['first_line']
+    # Index file handling
+    def _read_log_first_line(self):
+        with open(self.logname, 'rb') as f:
+            line = f.readline()
+        if not line.endswith(b'\n'):
+            return None
+        return line.decode('utf-8', 'replace').rstrip()
+    def _load_index(self):
+        try:
+            with gzip.open(self.index_name, 'rb') as f:
+                for line in f:
+                    if not self.load_stats and line.startswith(STATS_RECORD):
+                        continue
+                    rec = json.loads(line)
+                    if (rec['type'] == 'header'
+                        and rec.get('version') != INDEX_VERSION):
+                        break
+                    self._add_record(rec)
+        except (IOError, OSError, EOFError, ValueError, KeyError) as e:
+            self._reset()
+            return
+        # Check that the log file was not truncated or rotated
+        if (self.first_line is None
+            or os.path.getsize(self.logname) < self.offset
+            or self._read_log_first_line() != self.first_line):
+            self._reset()
+    def _save_index(self, records):
+        if not records:
+            return
+        mode = 'ab'
+        if records[0]['type'] == 'header':
+            mode = 'wb'
+        data = "".join([json.dumps(r, separators=(',', ':')) + "\n"
+                        for r in records])
+        try:
+            with gzip.open(self.index_name, mode, compresslevel=1) as f:
+                f.write(data.encode())
+        except (IOError, OSError) as e:
+            # The index is only an optimization - continue without it
+            pass
+    # Log parsing
+    def _parse_log(self):
+        records = []
+        if self.first_line is None:
+            first_line = self._read_log_first_line()
+            if first_line is None:
+                return records
+            records.append({'type': 'header', 'version': INDEX_VERSION,
+                            'first_line': first_line})
+        line_num = commit_line = self.line_num
+        offset = commit_offset = self.offset
+        commit_count = len(records)
+        config_lines = stats_rec = None
+        with open(self.logname, 'rb') as f:
+            f.seek(offset)
+            for raw_line in f:
+                if not raw_line.endswith(b'\n'):
+                    # Incomplete line - parse it on a later update
+                    break
+                line = raw_line.decode('utf-8', 'replace').rstrip()
+                if not line_num % LINE_CHECKPOINT:
+                    records.append({'type': 'checkpoint', 'line': line_num,
+                                    'offset': offset})
+                if config_lines is not None:
+                    if line != '=======================':
+                        config_lines.append(line)
+                    else:
+                        records.append({'type': 'event', 'line': config_line,
+                                        'event': 'config',
+                                        'text': config_lines})
+                        config_lines = None
+                elif is_stats_line(line):
+                    stats_rec = self._add_stats(records, stats_rec, line)
+                elif line.startswith('Git version'):
+                    records.append({'type': 'event', 'line': line_num,
+                                    'event': 'git', 'text': line})
+                elif line.startswith('Start printer at'):
+                    records.append({'type': 'event', 'line': line_num,
+                                    'event': 'start', 'text': line})
+                elif line == '===== Config file =====':
+                    config_line = line_num
+                    config_lines = []
+                elif is_shutdown_line(line):
+                    records.append({'type': 'event', 'line': line_num,
+                                    'event': 'shutdown', 'text': line})
+                line_num += 1
+                offset += len(raw_line)
+                if config_lines is None:
+                    # Don't stop parsing in the middle of a config dump
+                    commit_count = len(records)
+                    commit_line, commit_offset = line_num, offset
+        if commit_line == self.line_num:
+            return []
+        records = records[:commit_count]
+        records.append({'type': 'position', 'line': commit_line,
+                        'offset': commit_offset})
+        return records
+    def _add_stats(self, records, stats_rec, line):
+        try:
+            sampletime, layout, values = parse_stats(line)
+        except ValueError:
+            # Skip corrupted stats lines
+            return stats_rec
+        if (stats_rec is None or stats_rec['layout'] != layout
+            or len(stats_rec['times']) >= STATS_BLOCK):
+            # Start a new block of stats sharing the same layout
+            stats_rec = {'type': 'stats', 'layout': layout,
+                         'times': [], 'values': []}
+            records.append(stats_rec)
+        stats_rec['times'].append(sampletime)
+        stats_rec['values'].append(values)
+        return stats_rec
+    def update(self):
+        self._load_index()
+        records = self._parse_log()
+        for rec in records:
+            self._add_record(rec)
+        self._save_index(records)
+    # Query helpers
+    def get_stats(self):
+        # Generate ([(prefix, name), ...], sampletimes, [values, ...])
+        for layout, times, values in self.stats:
+            yield (layout_keys(layout), times,
+                   [v.split(' ') for v in values])
+    def get_events(self):
+        return self.events
+    def read_lines(self, line_num):
+        # Generate (line_num, line) for all log lines starting at line_num
+        cp_line, cp_offset = self.checkpoints[0]
+        for cp in self.checkpoints:
+            if cp[0] > line_num:
+                break
+            cp_line, cp_offset = cp
+        with open(self.logname, 'rb') as f:
+            f.seek(cp_offset)
+            for raw_line in f:
+                if cp_line >= line_num:
+                    line = raw_line.decode('utf-8', 'replace').rstrip()
+                    yield cp_line, line
+                cp_line += 1
@@ -4,6 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import math, collections
+import numpy as np
 import readlog
 
 
@@ -41,9 +42,8 @@ class GenDerivative:
     def generate_data(self):
         inv_seg_time = 1. / self.amanager.get_segment_time()
         data = self.amanager.get_datasets()[self.source]
-        deriv = [(data[i+1] - data[i]) * inv_seg_time
-                 for i in range(len(data)-1)]
-        return [deriv[0]] + deriv
+        deriv = np.diff(data) * inv_seg_time
+        return np.concatenate((deriv[:1], deriv))
 AHandlers["derivative"] = GenDerivative
 
 # Calculate an integral (accel to velocity, or velocity to position)
@@ -85,22 +85,20 @@ class GenIntegral:
     def generate_data(self):
         seg_time = self.amanager.get_segment_time()
         src = self.amanager.get_datasets()[self.source]
-        offset = sum(src) / len(src)
-        total = 0.
-        ref = None
-        if self.ref is not None:
-            ref = self.amanager.get_datasets()[self.ref]
-            offset -= (ref[-1] - ref[0]) / (len(src) * seg_time)
-            total = ref[0]
-            src_weight = 1.
-            if self.half_life:
-                src_weight = math.exp(math.log(.5) * seg_time / self.half_life)
-            ref_weight = 1. - src_weight
-        data = [0.] * len(src)
-        for i, v in enumerate(src):
+        offset = np.mean(src)
+        if self.ref is None:
+            return np.cumsum((src - offset) * seg_time)
+        ref = self.amanager.get_datasets()[self.ref]
+        offset -= (ref[-1] - ref[0]) / (len(src) * seg_time)
+        total = ref[0]
+        src_weight = 1.
+        if self.half_life:
+            src_weight = math.exp(math.log(.5) * seg_time / self.half_life)
+        ref_weight = 1. - src_weight
+        data = np.empty(len(src))
+        for i, (v, r) in enumerate(zip(src.tolist(), ref.tolist())):
             total += (v - offset) * seg_time
-            if ref is not None:
-                total = src_weight * total + ref_weight * ref[i]
+            total = src_weight * total + ref_weight * r
             data[i] = total
         return data
 AHandlers["integral"] = GenIntegral
@@ -145,17 +143,12 @@ class GenNorm2:
         lname += ' ' + data_name + ' norm2'
         return {'label': lname, 'units': units}
     def generate_data(self):
-        seg_time = self.amanager.get_segment_time()
-        data = []
+        datasets = self.amanager.get_datasets()
+        norm2 = 0.
         for dataset in self.datasets:
-            data.append(self.amanager.get_datasets()[dataset])
-        res = [0.] * len(data[0])
-        for i in range(len(data[0])):
-            norm2 = 0.
-            for dataset in data:
-                norm2 += dataset[i] * dataset[i]
-            res[i] = math.sqrt(norm2)
-        return res
+            data = datasets[dataset]
+            norm2 = norm2 + data * data
+        return np.sqrt(norm2)
 AHandlers["norm2"] = GenNorm2
 
 class GenSmoothed:
@@ -181,19 +174,24 @@ class GenSmoothed:
         seg_time = self.amanager.get_segment_time()
         src = self.amanager.get_datasets()[self.source]
         n = len(src)
-        data = [0.] * n
         hst = 0.5 * self.smooth_time
         seg_half_len = round(hst / seg_time)
-        inv_norm = 1. / sum([min(k + 1, seg_half_len + seg_half_len - k)
-                             for k in range(2 * seg_half_len)])
-        for i in range(n):
+        weights = np.minimum(np.arange(1, 2 * seg_half_len + 1),
+                             np.arange(2 * seg_half_len, 0, -1))
+        inv_norm = 1. / int(np.sum(weights))
+        data = np.empty(n)
+        # Samples with a full window
+        if n >= 2 * seg_half_len:
+            data[seg_half_len:n-seg_half_len+1] = np.correlate(
+                src, weights, 'valid')
+        # Samples near the start and end of the dataset
+        edges = (list(range(min(seg_half_len, n)))
+                 + list(range(max(seg_half_len, n - seg_half_len + 1), n)))
+        for i in edges:
             j = max(0, i - seg_half_len)
             je = min(n, i + seg_half_len)
-            avg_val = 0.
-            for k, v in enumerate(src[j:je]):
-                avg_val += v * min(k + 1, seg_half_len + seg_half_len - k)
-            data[i] = avg_val * inv_norm
-        return data
+            data[i] = np.dot(src[j:je], weights[:je-j])
+        return data * inv_norm
 AHandlers["smooth"] = GenSmoothed
 
 # Calculate a kinematic stepper position from the toolhead requested position
@@ -231,12 +229,12 @@ class GenKinematicPosition:
         datasets = self.amanager.get_datasets()
         data1 = datasets[self.source1]
         data2 = datasets[self.source2]
-        return [d1 + d2 for d1, d2 in zip(data1, data2)]
+        return data1 + data2
     def generate_data_corexy_minus(self):
         datasets = self.amanager.get_datasets()
         data1 = datasets[self.source1]
         data2 = datasets[self.source2]
-        return [d1 - d2 for d1, d2 in zip(data1, data2)]
+        return data1 - data2
     def generate_data_passthrough(self):
         return self.amanager.get_datasets()[self.source1]
 AHandlers["kin"] = GenKinematicPosition
@@ -265,8 +263,8 @@ class GenCorexyPosition:
         data1 = datasets[self.source1]
         data2 = datasets[self.source2]
         if self.is_plus:
-            return [.5 * (d1 + d2) for d1, d2 in zip(data1, data2)]
-        return [.5 * (d1 - d2) for d1, d2 in zip(data1, data2)]
+            return .5 * (data1 + data2)
+        return .5 * (data1 - data2)
 AHandlers["corexy"] = GenCorexyPosition
 
 # Calculate a position deviation
@@ -290,9 +288,7 @@ class GenDeviation:
         return {'label': label1['label'] + ' deviation', 'units': units}
     def generate_data(self):
         datasets = self.amanager.get_datasets()
-        data1 = datasets[self.source1]
-        data2 = datasets[self.source2]
-        return [d1 - d2 for d1, d2 in zip(data1, data2)]
+        return datasets[self.source1] - datasets[self.source2]
 AHandlers["deviation"] = GenDeviation
 
 
@@ -317,7 +313,7 @@ class AnalyzerManager:
         self.raw_datasets = collections.OrderedDict()
         self.gen_datasets = collections.OrderedDict()
         self.datasets = {}
-        self.dataset_times = []
+        self.dataset_times = np.zeros(0)
         self.duration = 5.
     def set_duration(self, duration):
         self.duration = duration
@@ -359,16 +355,18 @@ class AnalyzerManager:
         return hdl.get_label()
     def generate_datasets(self):
         # Generate raw data
-        list_hdls = [(self.datasets[name], hdl)
-                     for name, hdl in self.raw_datasets.items()]
         initial_start_time = self.lmanager.get_initial_start_time()
-        start_time = t = self.lmanager.get_start_time()
+        seg_time = self.segment_time
+        start_time = self.lmanager.get_start_time() + seg_time
         end_time = start_time + self.duration
-        while t < end_time:
-            t += self.segment_time
-            self.dataset_times.append(t - initial_start_time)
-            for dl, hdl in list_hdls:
-                dl.append(hdl.pull_data(t))
+        times = readlog.range_times(start_time, end_time, seg_time)
+        self.dataset_times = times - initial_start_time
+        for name, hdl in self.raw_datasets.items():
+            if hasattr(hdl, 'pull_range'):
+                data = hdl.pull_range(start_time, end_time, seg_time)
+            else:
+                data = [hdl.pull_data(t) for t in times]
+            self.datasets[name] = np.array(data)
         # Generate analyzer data
         for name, hdl in self.gen_datasets.items():
-            self.datasets[name] = hdl.generate_data()
+            self.datasets[name] = np.asarray(hdl.generate_data())
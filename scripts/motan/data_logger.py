@@ -5,8 +5,10 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import sys, os, optparse, socket, select, json, errno, time, zlib
+import collections
 
 INDEX_UPDATE_TIME = 5.0
+LIVE_SEND_TIMEOUT = 5.0
 ClientInfo = {'program': 'motan_data_logger', 'version': 'v0.1'}
 
 def webhook_socket_create(uds_filename):
@@ -52,22 +54,141 @@ class LogWriter:
         self.file = None
         self.comp = None
 
+# In-memory replacement for the data log LogWriter
+class LiveLogBuffer:
+    def __init__(self):
+        self.msgs = collections.deque()
+        self.start_pos = 0
+    def add_data(self, data):
+        self.msgs.append(data)
+    def flush(self, flag=None):
+        return self.start_pos + len(self.msgs)
+    def discard(self, pos):
+        msgs = self.msgs
+        while self.start_pos < pos:
+            msgs.popleft()
+            self.start_pos += 1
+    def close(self):
+        pass
+
+# In-memory replacement for the index LogWriter - discards index
+# entries (and their data log messages) older than the history time
+class LiveIndexBuffer:
+    def __init__(self, log_buffer, history_time):
+        self.log_buffer = log_buffer
+        self.history_time = history_time
+        self.entries = collections.deque()
+    def add_data(self, data):
+        entries = self.entries
+        entries.append(json.loads(data))
+        min_time = entries[-1]['print_time'] - self.history_time
+        while len(entries) > 1 and entries[1]['print_time'] <= min_time:
+            # Merge the oldest entry into the next so that the first
+            # entry always has the full status and subscription info
+            old = entries.popleft()
+            entry = entries[0]
+            status = old['status']
+            for k, v in entry['status'].items():
+                status.setdefault(k, {}).update(v)
+            old.update({k: v for k, v in entry.items() if k != 'status'})
+            entries[0] = old
+            self.log_buffer.discard(old['file_position'])
+    def close(self):
+        pass
+
+# Client connection to the live analysis socket
+class LiveClient:
+    def __init__(self, dlogger, sock):
+        self.dlogger = dlogger
+        self.sock = sock
+        self.sock.settimeout(LIVE_SEND_TIMEOUT)
+        self.socket_data = b""
+        dlogger.register_fd(sock.fileno(), self.process_socket)
+    def close(self):
+        self.dlogger.unregister_fd(self.sock.fileno())
+        self.sock.close()
+    def process_socket(self):
+        try:
+            data = self.sock.recv(4096)
+        except socket.error as e:
+            data = b""
+        if not data:
+            self.close()
+            return
+        parts = data.split(b"\x03")
+        parts[0] = self.socket_data + parts[0]
+        self.socket_data = parts.pop()
+        for part in parts:
+            try:
+                req = json.loads(part)
+                params = req.get("params", {})
+            except:
+                self.dlogger.error("ERROR: Unable to parse live request")
+                continue
+            msg = {"id": req.get("id")}
+            try:
+                if req.get("method") != "analyze":
+                    raise Exception("Invalid method")
+                msg["result"] = self.dlogger.analyze(
+                    params["datasets"], float(params.get("duration", 5.)),
+                    float(params.get("segment_time", .000100)))
+            except Exception as e:
+                msg["error"] = {"message": str(e)}
+            cm = json.dumps(msg, separators=(',', ':')).encode()
+            try:
+                self.sock.sendall(cm + b"\x03")
+            except socket.error as e:
+                self.close()
+                return
+
+# Listening socket for live analysis requests
+class LiveServer:
+    def __init__(self, dlogger, socket_filename):
+        self.dlogger = dlogger
+        self.socket_filename = socket_filename
+        self.remove_socket_file()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        self.sock.bind(socket_filename)
+        self.sock.listen(4)
+        dlogger.register_fd(self.sock.fileno(), self.process_accept)
+    def remove_socket_file(self):
+        try:
+            os.remove(self.socket_filename)
+        except os.error:
+            pass
+    def process_accept(self):
+        try:
+            sock, addr = self.sock.accept()
+        except socket.error as e:
+            return
+        LiveClient(self.dlogger, sock)
+
 class DataLogger:
-    def __init__(self, uds_filename, log_prefix):
+    def __init__(self, uds_filename, log_prefix, history_time=0.):
         # IO
-        self.webhook_socket = webhook_socket_create(uds_filename)
+        self.fd_handlers = {}
         self.poll = select.poll()
-        self.poll.register(self.webhook_socket, select.POLLIN | select.POLLHUP)
+        self.webhook_socket = webhook_socket_create(uds_filename)
+        self.register_fd(self.webhook_socket.fileno(), self.process_socket)
         self.socket_data = b""
         # Data log
-        self.logger = LogWriter(log_prefix + ".json.gz")
-        self.index = LogWriter(log_prefix + ".index.gz")
+        self.live_server = None
+        if history_time:
+            # Live mode - only keep recent messages in memory
+            self.logger = LiveLogBuffer()
+            self.index = LiveIndexBuffer(self.logger, history_time)
+            self.live_server = LiveServer(self, log_prefix)
+        else:
+            self.logger = LogWriter(log_prefix + ".json.gz")
+            self.index = LogWriter(log_prefix + ".index.gz")
         # Handlers
         self.query_handlers = {}
         self.async_handlers = {}
         # get_status databasing
         self.db = {}
         self.next_index_time = 0.
+        self.last_print_time = self.last_est_print_time = 0.
         # Start login process
         self.send_query("info", "info", {"client_info": ClientInfo},
                         self.handle_info)
@@ -77,8 +198,16 @@ class DataLogger:
         self.error(msg)
         self.logger.close()
         self.index.close()
+        if self.live_server is not None:
+            self.live_server.remove_socket_file()
         sys.exit(0)
     # Unix Domain Socket IO
+    def register_fd(self, fd, callback):
+        self.fd_handlers[fd] = callback
+        self.poll.register(fd, select.POLLIN | select.POLLHUP)
+    def unregister_fd(self, fd):
+        del self.fd_handlers[fd]
+        self.poll.unregister(fd)
     def send_query(self, msg_id, method, params, cb):
         self.query_handlers[msg_id] = cb
         msg = {"id": msg_id, "method": method, "params": params}
@@ -118,8 +247,9 @@ class DataLogger:
             while 1:
                 res = self.poll.poll(1000.)
                 for fd, event in res:
-                    if fd == self.webhook_socket.fileno():
-                        self.process_socket()
+                    hdl = self.fd_handlers.get(fd)
+                    if hdl is not None:
+                        hdl()
         except KeyboardInterrupt as e:
             self.finish("Keyboard Interrupt")
     # Query response handlers
@@ -142,6 +272,7 @@ class DataLogger:
         result = msg["result"]
         self.next_index_time = result["eventtime"] + INDEX_UPDATE_TIME
         self.db["status"] = status = result["status"]
+        self.note_print_time(status)
         # Subscribe to trapq and stepper queue updates
         motion_report = status.get("motion_report", {})
         for trapq in motion_report.get("trapq", []):
@@ -167,20 +298,62 @@ class DataLogger:
                        % (msg_id, msg.get("error", {}).get("message", "")))
             return
         self.db.setdefault("subscriptions", {})[msg_id] = msg["result"]
+    def note_print_time(self, status):
+        th = status.get("toolhead", {})
+        self.last_est_print_time = th.get("estimated_print_time",
+                                          self.last_est_print_time)
+        self.last_print_time = max(self.last_print_time,
+                                   th.get("estimated_print_time", 0.),
+                                   th.get("print_time", 0.))
     def flush_index(self):
+        # Each index entry notes the start of an independently
+        # decodable block of the data log and its print time
         self.db['file_position'] = self.logger.flush()
+        self.db['print_time'] = self.last_print_time
         self.index.add_data(json.dumps(self.db, separators=(',', ':')).encode())
         self.db = {"status": {}}
     def handle_async_db(self, msg, raw_msg):
         params = msg["params"]
         db_status = self.db['status']
-        for k, v in params.get("status", {}).items():
+        status = params.get("status", {})
+        for k, v in status.items():
             db_status.setdefault(k, {}).update(v)
+        self.note_print_time(status)
         eventtime = params['eventtime']
         if eventtime >= self.next_index_time:
             self.next_index_time = eventtime + INDEX_UPDATE_TIME
             self.flush_index()
 
+    # Live mode analysis
+    def analyze(self, datasets, duration, segment_time):
+        # The analysis code requires numpy, so only import it when used
+        import readlog, analyzers
+        entries = self.index.entries
+        if not entries:
+            raise Exception("No data available yet")
+        index_msgs = [json.dumps(e).encode() for e in entries]
+        lmanager = readlog.LogManager(None, (
+            readlog.MemoryLogReader(index_msgs),
+            readlog.MemoryLogReader(list(self.logger.msgs),
+                                    self.logger.start_pos)))
+        lmanager.setup_index()
+        # Motion data is logged ahead of its print time, so the first
+        # second of the buffer may be incomplete
+        end_time = self.last_est_print_time
+        start_time = max(end_time - duration,
+                         lmanager.get_initial_start_time() + 1.)
+        lmanager.seek_time(start_time - lmanager.get_initial_start_time())
+        amanager = analyzers.AnalyzerManager(lmanager, segment_time)
+        amanager.set_duration(end_time - start_time)
+        for dataset in datasets:
+            amanager.setup_dataset(dataset)
+        amanager.generate_datasets()
+        data = amanager.get_datasets()
+        times = amanager.get_dataset_times() + lmanager.get_initial_start_time()
+        return {'times': times.tolist(),
+                'datasets': {n: data[n].tolist() for n in datasets},
+                'labels': {n: amanager.get_label(n) for n in datasets}}
+
 def nice():
     try:
         # Try to re-nice writing process
@@ -191,12 +364,16 @@ def nice():
 def main():
     usage = "%prog [options] <socket filename> <log name>"
     opts = optparse.OptionParser(usage)
+    opts.add_option("-l", "--live", type="float", dest="history_time",
+                    default=0.,
+                    help="keep only this many seconds of data in memory"
+                    " and serve analysis requests on the <log name> socket")
     options, args = opts.parse_args()
     if len(args) != 2:
         opts.error("Incorrect number of arguments")
 
     nice()
-    dl = DataLogger(args[0], args[1])
+    dl = DataLogger(args[0], args[1], options.history_time)
     dl.run()
 
 if __name__ == '__main__':
@@ -3,7 +3,8 @@
 # Copyright (C) 2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import json, zlib
+import json, zlib, logging, math
+import numpy as np
 
 class error(Exception):
     pass
@@ -16,6 +17,22 @@ class error(Exception):
 # Log data handlers: {name: class, ...}
 LogHandlers = {}
 
+# Return the sample times from 'start' up to (but not including) 'end'
+def range_times(start, end, step):
+    count = max(0, int(math.ceil((end - start) / step)) + 1)
+    times = start + step * np.arange(count)
+    return times[times < end]
+
+# Linearly interpolate between the data samples surrounding each
+# requested time (data_times[data_pos-1] < req_times <= data_times[-1])
+def interpolate_samples(req_times, data_times, data_values, data_pos):
+    idx = np.maximum(np.searchsorted(data_times, req_times), data_pos)
+    last_time = data_times[idx - 1]
+    last_value = data_values[idx - 1]
+    vdiff = data_values[idx] - last_value
+    tdiff = data_times[idx] - last_time
+    return last_value + (req_times - last_time) * vdiff / tdiff, idx[-1]
+
 # Extract status fields from log
 class HandleStatusField:
     SubscriptionIdParts = 0
@@ -57,86 +74,102 @@ class HandleTrapQ:
     def __init__(self, lmanager, name, name_parts):
         self.name = name
         self.jdispatch = lmanager.get_jdispatch()
-        self.cur_data = [(0., 0., 0., 0., (0., 0., 0.), (0., 0., 0.))]
-        self.data_pos = 0
+        self._load_moves([(0., 0., 0., 0., (0., 0., 0.), (0., 0., 0.))])
         tq, trapq_name, datasel = name_parts
         ptypes = {}
         ptypes['velocity'] = {
             'label': '%s velocity' % (trapq_name,),
-            'units': 'Velocity\n(mm/s)', 'func': self._pull_velocity
+            'units': 'Velocity\n(mm/s)', 'func': self._calc_velocity
         }
         ptypes['accel'] = {
             'label': '%s acceleration' % (trapq_name,),
-            'units': 'Acceleration\n(mm/s^2)', 'func': self._pull_accel
+            'units': 'Acceleration\n(mm/s^2)', 'func': self._calc_accel
         }
         for axis, name in enumerate("xyz"):
             ptypes['%s' % (name,)] = {
                 'label': '%s %s position' % (trapq_name, name), 'axis': axis,
-                'units': 'Position\n(mm)', 'func': self._pull_axis_position
+                'units': 'Position\n(mm)', 'func': self._calc_axis_position
             }
             ptypes['%s_velocity' % (name,)] = {
                 'label': '%s %s velocity' % (trapq_name, name), 'axis': axis,
-                'units': 'Velocity\n(mm/s)', 'func': self._pull_axis_velocity
+                'units': 'Velocity\n(mm/s)', 'func': self._calc_axis_velocity
             }
             ptypes['%s_accel' % (name,)] = {
                 'label': '%s %s acceleration' % (trapq_name, name),
                 'axis': axis, 'units': 'Acceleration\n(mm/s^2)',
-                'func': self._pull_axis_accel
+                'func': self._calc_axis_accel
             }
         pinfo = ptypes.get(datasel)
         if pinfo is None:
             raise error("Unknown trapq data selection '%s'" % (datasel,))
         self.label = {'label': pinfo['label'], 'units': pinfo['units']}
         self.axis = pinfo.get('axis')
-        self.pull_data = pinfo['func']
+        self.calc_data = pinfo['func']
     def get_label(self):
         return self.label
-    def _find_move(self, req_time):
-        data_pos = self.data_pos
-        while 1:
-            move = self.cur_data[data_pos]
-            print_time, move_t, start_v, accel, start_pos, axes_r = move
-            if req_time <= print_time + move_t:
-                return move, req_time >= print_time
-            data_pos += 1
-            if data_pos < len(self.cur_data):
-                self.data_pos = data_pos
-                continue
-            jmsg = self.jdispatch.pull_msg(req_time, self.name)
-            if jmsg is None:
-                return move, False
-            self.cur_data = jmsg['data']
-            self.data_pos = data_pos = 0
-    def _pull_axis_position(self, req_time):
-        move, in_range = self._find_move(req_time)
-        print_time, move_t, start_v, accel, start_pos, axes_r = move
-        mtime = max(0., min(move_t, req_time - print_time))
-        dist = (start_v + .5 * accel * mtime) * mtime;
-        return start_pos[self.axis] + axes_r[self.axis] * dist
-    def _pull_axis_velocity(self, req_time):
-        move, in_range = self._find_move(req_time)
-        if not in_range:
-            return 0.
-        print_time, move_t, start_v, accel, start_pos, axes_r = move
-        return (start_v + accel * (req_time - print_time)) * axes_r[self.axis]
-    def _pull_axis_accel(self, req_time):
-        move, in_range = self._find_move(req_time)
-        if not in_range:
-            return 0.
-        print_time, move_t, start_v, accel, start_pos, axes_r = move
-        return accel * axes_r[self.axis]
-    def _pull_velocity(self, req_time):
-        move, in_range = self._find_move(req_time)
-        if not in_range:
-            return 0.
-        print_time, move_t, start_v, accel, start_pos, axes_r = move
-        return start_v + accel * (req_time - print_time)
-    def _pull_accel(self, req_time):
-        move, in_range = self._find_move(req_time)
-        if not in_range:
-            return 0.
-        print_time, move_t, start_v, accel, start_pos, axes_r = move
-        return accel
+    def _load_moves(self, data):
+        # Store moves as rows of (print_time, move_t, start_v, accel,
+        # start_x, start_y, start_z, axes_r_x, axes_r_y, axes_r_z)
+        self.moves = np.array([tuple(m[:4]) + tuple(m[4]) + tuple(m[5])
+                               for m in data]).reshape((-1, 10)).T
+        self.move_end = self.moves[0] + self.moves[1]
+        self.data_pos = 0
+    def _calc_axis_position(self, req_times, in_range, idx):
+        print_time, move_t, start_v, accel = self.moves[:4, idx]
+        start_pos = self.moves[4 + self.axis, idx]
+        axes_r = self.moves[7 + self.axis, idx]
+        mtime = np.clip(req_times - print_time, 0., move_t)
+        dist = (start_v + .5 * accel * mtime) * mtime
+        return start_pos + axes_r * dist
+    def _calc_axis_velocity(self, req_times, in_range, idx):
+        print_time, move_t, start_v, accel = self.moves[:4, idx]
+        axes_r = self.moves[7 + self.axis, idx]
+        velocity = (start_v + accel * (req_times - print_time)) * axes_r
+        return np.where(in_range, velocity, 0.)
+    def _calc_axis_accel(self, req_times, in_range, idx):
+        accel = self.moves[3, idx] * self.moves[7 + self.axis, idx]
+        return np.where(in_range, accel, 0.)
+    def _calc_velocity(self, req_times, in_range, idx):
+        print_time, move_t, start_v, accel = self.moves[:4, idx]
+        velocity = start_v + accel * (req_times - print_time)
+        return np.where(in_range, velocity, 0.)
+    def _calc_accel(self, req_times, in_range, idx):
+        return np.where(in_range, self.moves[3, idx], 0.)
+    def _pull_times(self, req_times):
+        out = np.empty(len(req_times))
+        pos = 0
+        while pos < len(req_times):
+            req_time = req_times[pos]
+            while not len(self.move_end) or req_time > self.move_end[-1]:
+                jmsg = self.jdispatch.pull_msg(req_time, self.name)
+                if jmsg is None:
+                    break
+                self._load_moves(jmsg['data'])
+            if not len(self.move_end):
+                # No moves available at all
+                out[pos:] = 0.
+                break
+            if req_time > self.move_end[-1]:
+                # No further moves available - report end of last move
+                limit = self.jdispatch.get_pull_limit()
+                count = max(1, np.searchsorted(req_times[pos:], limit))
+            else:
+                count = np.searchsorted(req_times[pos:], self.move_end[-1],
+                                        'right')
+            times = req_times[pos:pos+count]
+            idx = np.maximum(np.searchsorted(self.move_end, times),
+                             self.data_pos)
+            idx = np.minimum(idx, len(self.move_end) - 1)
+            in_range = (times >= self.moves[0, idx]) & (
+                times <= self.move_end[idx])
+            out[pos:pos+count] = self.calc_data(times, in_range, idx)
+            self.data_pos = idx[-1]
+            pos += count
+        return out
+    def pull_range(self, start, end, step):
+        return self._pull_times(range_times(start, end, step))
+    def pull_data(self, req_time):
+        return float(self._pull_times(np.array([req_time]))[0])
 LogHandlers["trapq"] = HandleTrapQ
 
 # Extract positions from queue_step log
@@ -152,7 +185,10 @@ class HandleStepQ:
         self.name = name
         self.stepper_name = name_parts[1]
         self.jdispatch = lmanager.get_jdispatch()
-        self.step_data = [(0., 0., 0.), (0., 0., 0.)] # [(time, half_pos, pos)]
+        # Arrays of step times, half step positions, and step positions
+        self.step_times = np.zeros(2)
+        self.step_halfpos = np.zeros(2)
+        self.step_pos = np.zeros(2)
         self.data_pos = 0
         self.smooth_time = 0.010
         if len(name_parts) == 3:
@@ -163,75 +199,91 @@ class HandleStepQ:
     def get_label(self):
         label = '%s position' % (self.stepper_name,)
         return {'label': label, 'units': 'Position\n(mm)'}
-    def pull_data(self, req_time):
+    def _pull_times(self, req_times):
         smooth_time = self.smooth_time
-        while 1:
-            data_pos = self.data_pos
-            step_data = self.step_data
-            # Find steps before and after req_time
-            next_time, next_halfpos, next_pos = step_data[data_pos + 1]
-            if req_time >= next_time:
-                if data_pos + 2 < len(step_data):
-                    self.data_pos = data_pos + 1
-                    continue
-                self._pull_block(req_time)
-                continue
-            last_time, last_halfpos, last_pos = step_data[data_pos]
+        out = np.empty(len(req_times))
+        pos = 0
+        while pos < len(req_times):
+            while req_times[pos] >= self.step_times[-1]:
+                self._pull_block(req_times[pos])
+            step_times = self.step_times
+            count = np.searchsorted(req_times[pos:], step_times[-1])
+            times = req_times[pos:pos+count]
+            # Find steps before and after each requested time
+            idx = np.maximum(np.searchsorted(step_times, times, 'right') - 1,
+                             self.data_pos)
+            last_time = step_times[idx]
+            last_halfpos = self.step_halfpos[idx]
+            last_pos = self.step_pos[idx]
+            next_time = step_times[idx + 1]
+            next_halfpos = self.step_halfpos[idx + 1]
             # Perform step smoothing
-            rtdiff = req_time - last_time
+            rtdiff = times - last_time
+            ntdiff = next_time - times
             stime = next_time - last_time
-            if stime <= smooth_time:
-                pdiff = next_halfpos - last_halfpos
-                return last_halfpos + rtdiff * pdiff / stime
-            stime = .5 * smooth_time
-            if rtdiff < stime:
-                pdiff = last_pos - last_halfpos
-                return last_halfpos + rtdiff * pdiff / stime
-            rtdiff = next_time - req_time
-            if rtdiff < stime:
-                pdiff = last_pos - next_halfpos
-                return next_halfpos + rtdiff * pdiff / stime
-            return last_pos
+            hstime = .5 * smooth_time
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[pos:pos+count] = np.select(
+                    [stime <= smooth_time, rtdiff < hstime, ntdiff < hstime],
+                    [last_halfpos + rtdiff * (next_halfpos - last_halfpos)
+                     / stime,
+                     last_halfpos + rtdiff * (last_pos - last_halfpos)
+                     / hstime,
+                     next_halfpos + ntdiff * (last_pos - next_halfpos)
+                     / hstime], last_pos)
+            self.data_pos = idx[-1]
+            pos += count
+        return out
+    def pull_range(self, start, end, step):
+        return self._pull_times(range_times(start, end, step))
+    def pull_data(self, req_time):
+        return float(self._pull_times(np.array([req_time]))[0])
     def _pull_block(self, req_time):
-        step_data = self.step_data
-        del step_data[:-1]
+        last_time = self.step_times[-1]
+        last_halfpos = self.step_halfpos[-1]
+        last_pos = self.step_pos[-1]
         self.data_pos = 0
         # Read data block containing requested time frame
         while 1:
             jmsg = self.jdispatch.pull_msg(req_time, self.name)
             if jmsg is None:
-                last_time, last_halfpos, last_pos = step_data[0]
-                self.step_data.append((req_time + .1, last_pos, last_pos))
+                self.step_times = np.array([last_time, req_time + .1])
+                self.step_halfpos = np.array([last_halfpos, last_pos])
+                self.step_pos = np.array([last_pos, last_pos])
                 return
-            last_time = jmsg['last_step_time']
-            if req_time <= last_time:
+            if req_time <= jmsg['last_step_time']:
                 break
-        # Process block into (time, half_position, position) 3-tuples
-        first_time = step_time = jmsg['first_step_time']
+        # Expand the queue_step (interval, count, add) entries into step times
+        first_time = jmsg['first_step_time']
         first_clock = jmsg['first_clock']
-        step_clock = first_clock - jmsg['data'][0][0]
         cdiff = jmsg['last_clock'] - first_clock
-        tdiff = last_time - first_time
+        tdiff = jmsg['last_step_time'] - first_time
         inv_freq = 0.
         if cdiff:
             inv_freq = tdiff / cdiff
+        data = np.array(jmsg['data'], dtype=np.int64).reshape((-1, 3))
+        interval, raw_count, add = data.T
+        count = np.abs(raw_count)
+        entry_clocks = count * interval + add * (count * (count - 1) // 2)
+        entry_start = first_clock - interval[0] + np.concatenate(
+            ([0], np.cumsum(entry_clocks)[:-1]))
+        entry = np.repeat(np.arange(len(count)), count)
+        step_num = np.arange(1, len(entry) + 1) - np.repeat(
+            np.cumsum(count) - count, count)
+        step_clock = (entry_start[entry] + step_num * interval[entry]
+                      + add[entry] * (step_num * (step_num - 1) // 2))
+        step_times = first_time + (step_clock - first_clock) * inv_freq
+        # Calculate the position after each step
         step_dist = jmsg['step_distance']
-        step_pos = jmsg['start_position']
-        if not step_data[0][0]:
-            step_data[0] = (0., step_pos, step_pos)
-        for interval, raw_count, add in jmsg['data']:
-            qs_dist = step_dist
-            count = raw_count
-            if count < 0:
-                qs_dist = -qs_dist
-                count = -count
-            for i in range(count):
-                step_clock += interval
-                interval += add
-                step_time = first_time + (step_clock - first_clock) * inv_freq
-                step_halfpos = step_pos + .5 * qs_dist
-                step_pos += qs_dist
-                step_data.append((step_time, step_halfpos, step_pos))
+        qs_dist = np.where(raw_count < 0, -step_dist, step_dist)[entry]
+        start_pos = jmsg['start_position']
+        positions = np.cumsum(np.concatenate(([start_pos], qs_dist)))
+        halfpos = positions[:-1] + .5 * qs_dist
+        if not last_time:
+            last_halfpos = last_pos = start_pos
+        self.step_times = np.concatenate(([last_time], step_times))
+        self.step_halfpos = np.concatenate(([last_halfpos], halfpos))
+        self.step_pos = np.concatenate(([last_pos], positions[1:]))
 LogHandlers["stepq"] = HandleStepQ
 
 # Extract stepper motor phase position
@@ -345,37 +397,46 @@ class HandleADXL345:
         self.name = name
         self.adxl_name = name_parts[1]
         self.jdispatch = lmanager.get_jdispatch()
-        self.next_accel_time = self.last_accel_time = 0.
-        self.next_accel = self.last_accel = (0., 0., 0.)
-        self.cur_data = []
-        self.data_pos = 0
+        self.data_times = self.data_accels = np.zeros(2)
+        self.data_pos = 1
         if name_parts[2] not in 'xyz':
             raise error("Unknown adxl345 data selection '%s'" % (name,))
         self.axis = 'xyz'.index(name_parts[2])
     def get_label(self):
         label = '%s %s acceleration' % (self.adxl_name, 'xyz'[self.axis])
         return {'label': label, 'units': 'Acceleration\n(mm/s^2)'}
-    def pull_data(self, req_time):
-        axis = self.axis
-        while 1:
-            if req_time <= self.next_accel_time:
-                adiff = self.next_accel[axis] - self.last_accel[axis]
-                tdiff = self.next_accel_time - self.last_accel_time
-                rtdiff = req_time - self.last_accel_time
-                return self.last_accel[axis] + rtdiff * adiff / tdiff
-            if self.data_pos >= len(self.cur_data):
+    def _pull_times(self, req_times):
+        out = np.empty(len(req_times))
+        pos = 0
+        while pos < len(req_times):
+            req_time = req_times[pos]
+            if req_time > self.data_times[-1]:
                 # Read next data block
                 jmsg = self.jdispatch.pull_msg(req_time, self.name)
                 if jmsg is None:
-                    return 0.
-                self.cur_data = jmsg['data']
-                self.data_pos = 0
+                    limit = self.jdispatch.get_pull_limit()
+                    count = max(1, np.searchsorted(req_times[pos:], limit))
+                    out[pos:pos+count] = 0.
+                    pos += count
+                    continue
+                data = np.array(jmsg['data']).reshape((-1, 4))
+                self.data_times = np.concatenate(
+                    (self.data_times[-1:], data[:,0]))
+                self.data_accels = np.concatenate(
+                    (self.data_accels[-1:], data[:,1 + self.axis]))
+                self.data_pos = 1
                 continue
-            self.last_accel = self.next_accel
-            self.last_accel_time = self.next_accel_time
-            self.next_accel_time, x, y, z = self.cur_data[self.data_pos]
-            self.next_accel = (x, y, z)
-            self.data_pos += 1
+            count = np.searchsorted(req_times[pos:], self.data_times[-1],
+                                    'right')
+            times = req_times[pos:pos+count]
+            out[pos:pos+count], self.data_pos = interpolate_samples(
+                times, self.data_times, self.data_accels, self.data_pos)
+            pos += count
+        return out
+    def pull_range(self, start, end, step):
+        return self._pull_times(range_times(start, end, step))
+    def pull_data(self, req_time):
+        return float(self._pull_times(np.array([req_time]))[0])
 LogHandlers["adxl345"] = HandleADXL345
 
 # Extract positions from magnetic angle sensor
@@ -389,10 +450,8 @@ class HandleAngle:
         self.name = name
         self.angle_name = name_parts[1]
         self.jdispatch = lmanager.get_jdispatch()
-        self.next_angle_time = self.last_angle_time = 0.
-        self.next_angle = self.last_angle = 0.
-        self.cur_data = []
-        self.data_pos = 0
+        self.data_times = self.data_angles = np.zeros(2)
+        self.data_pos = 1
         self.position_offset = 0.
         self.angle_dist = 1.
         # Determine angle distance from associated stepper's rotation_distance
@@ -412,31 +471,45 @@ class HandleAngle:
     def get_label(self):
         label = '%s position' % (self.angle_name,)
         return {'label': label, 'units': 'Position\n(mm)'}
-    def pull_data(self, req_time):
-        while 1:
-            if req_time <= self.next_angle_time:
-                pdiff = self.next_angle - self.last_angle
-                tdiff = self.next_angle_time - self.last_angle_time
-                rtdiff = req_time - self.last_angle_time
-                po = rtdiff * pdiff / tdiff
-                return ((self.last_angle + po) * self.angle_dist
-                        + self.position_offset)
-            if self.data_pos >= len(self.cur_data):
+    def _pull_times(self, req_times):
+        out = np.empty(len(req_times))
+        pos = 0
+        while pos < len(req_times):
+            req_time = req_times[pos]
+            if req_time > self.data_times[-1]:
                 # Read next data block
                 jmsg = self.jdispatch.pull_msg(req_time, self.name)
                 if jmsg is None:
-                    return (self.next_angle * self.angle_dist
-                            + self.position_offset)
-                self.cur_data = jmsg['data']
+                    limit = self.jdispatch.get_pull_limit()
+                    count = max(1, np.searchsorted(req_times[pos:], limit))
+                    out[pos:pos+count] = (self.data_angles[-1]
+                                          * self.angle_dist
+                                          + self.position_offset)
+                    pos += count
+                    continue
+                data = np.array(jmsg['data']).reshape((-1, 2))
+                self.data_times = np.concatenate(
+                    (self.data_times[-1:], data[:,0]))
+                self.data_angles = np.concatenate(
+                    (self.data_angles[-1:], data[:,1]))
+                self.data_pos = 1
                 position_offset = jmsg.get('position_offset')
                 if position_offset is not None:
                     self.position_offset = position_offset
-                self.data_pos = 0
                 continue
-            self.last_angle = self.next_angle
-            self.last_angle_time = self.next_angle_time
-            self.next_angle_time, self.next_angle = self.cur_data[self.data_pos]
-            self.data_pos += 1
+            count = np.searchsorted(req_times[pos:], self.data_times[-1],
+                                    'right')
+            times = req_times[pos:pos+count]
+            angles, self.data_pos = interpolate_samples(
+                times, self.data_times, self.data_angles, self.data_pos)
+            out[pos:pos+count] = (angles * self.angle_dist
+                                  + self.position_offset)
+            pos += count
+        return out
+    def pull_range(self, start, end, step):
+        return self._pull_times(range_times(start, end, step))
+    def pull_data(self, req_time):
+        return float(self._pull_times(np.array([req_time]))[0])
 LogHandlers["angle"] = HandleAngle
 
 
@@ -451,37 +524,75 @@ class JsonLogReader:
         self.comp = zlib.decompressobj(31)
         self.msgs = [b""]
     def seek(self, pos):
+        # The log writer does a full flush at each index point, so the
+        # data following an indexed file position can be decoded alone
         self.file.seek(pos)
         self.comp = zlib.decompressobj(-15)
-    def pull_msg(self):
+        self.msgs = [b""]
+    def pull_raw_msg(self):
         msgs = self.msgs
         while 1:
             if len(msgs) > 1:
-                msg = msgs.pop(0)
-                try:
-                    json_msg = json.loads(msg)
-                except:
-                    logging.exception("Unable to parse line")
-                    continue
-                return json_msg
-            raw_data = self.file.read(8192)
+                return msgs.pop()
+            raw_data = self.file.read(65536)
             if not raw_data:
                 return None
             data = self.comp.decompress(raw_data)
             parts = data.split(b'\x03')
             parts[0] = msgs[0] + parts[0]
+            parts.reverse()
             self.msgs = msgs = parts
+    def pull_msg(self):
+        while 1:
+            msg = self.pull_raw_msg()
+            if msg is None:
+                return None
+            try:
+                return json.loads(msg)
+            except:
+                logging.exception("Unable to parse line")
+
+# Read messages held in memory (as kept by a live data_logger.py)
+class MemoryLogReader:
+    def __init__(self, msgs, start_pos=0):
+        self.msgs = msgs
+        self.start_pos = start_pos
+        self.pos = 0
+    def seek(self, pos):
+        self.pos = pos - self.start_pos
+    def pull_raw_msg(self):
+        if self.pos >= len(self.msgs):
+            return None
+        self.pos += 1
+        return self.msgs[self.pos - 1]
+    def pull_msg(self):
+        while 1:
+            msg = self.pull_raw_msg()
+            if msg is None:
+                return None
+            try:
+                return json.loads(msg)
+            except:
+                logging.exception("Unable to parse line")
+
+# Subscription messages are logged as '{"q":"<subscription_id>",...}'
+SUBSCRIPTION_PREFIX = b'{"q":"'
 
 # Store messages in per-subscription queues until handlers are ready for them
 class JsonDispatcher:
-    def __init__(self, log_prefix):
+    def __init__(self, log_reader):
         self.names = {}
         self.queues = {}
         self.last_read_time = 0.
-        self.log_reader = JsonLogReader(log_prefix + ".json.gz")
+        self.log_reader = log_reader
         self.is_eof = False
     def check_end_of_data(self):
         return self.is_eof and not any(self.queues.values())
+    def get_pull_limit(self):
+        # Requests prior to this time can not obtain new messages
+        if self.is_eof:
+            return float('inf')
+        return self.last_read_time - 1.
     def add_handler(self, name, subscription_id):
         self.names[name] = q = []
         self.queues.setdefault(subscription_id, []).append(q)
@@ -492,17 +603,29 @@ class JsonDispatcher:
                 return q.pop(0)
             if req_time + 1. < self.last_read_time:
                 return None
-            json_msg = self.log_reader.pull_msg()
-            if json_msg is None:
+            raw_msg = self.log_reader.pull_raw_msg()
+            if raw_msg is None:
                 self.is_eof = True
                 return None
+            # Only decode subscription messages that have a handler
+            if raw_msg.startswith(SUBSCRIPTION_PREFIX):
+                qid = raw_msg[len(SUBSCRIPTION_PREFIX):raw_msg.find(
+                    b'"', len(SUBSCRIPTION_PREFIX))].decode()
+                if qid != 'status' and qid not in self.queues:
+                    continue
+            try:
+                json_msg = json.loads(raw_msg)
+            except:
+                logging.exception("Unable to parse line")
+                continue
             qid = json_msg.get('q')
             if qid == 'status':
-                pt = json_msg.get('toolhead', {}).get('estimated_print_time')
+                status = json_msg.get('params', {}).get('status', {})
+                pt = status.get('toolhead', {}).get('estimated_print_time')
                 if pt is not None:
                     self.last_read_time = pt
             for mq in self.queues.get(qid, []):
-                mq.append(json_msg['params'])
+                mq.append(json_msg.get('params', {}))
 
 
 ######################################################################
@@ -565,9 +688,12 @@ def list_datasets():
 # Main log access management
 class LogManager:
     error = error
-    def __init__(self, log_prefix):
-        self.index_reader = JsonLogReader(log_prefix + ".index.gz")
-        self.jdispatch = JsonDispatcher(log_prefix)
+    def __init__(self, log_prefix, log_readers=None):
+        if log_readers is None:
+            log_readers = (JsonLogReader(log_prefix + ".index.gz"),
+                           JsonLogReader(log_prefix + ".json.gz"))
+        self.index_reader, log_reader = log_readers
+        self.jdispatch = JsonDispatcher(log_reader)
         self.initial_start_time = self.start_time = 0.
         self.datasets = {}
         self.initial_status = {}
@@ -596,8 +722,12 @@ class LogManager:
             fmsg = self.index_reader.pull_msg()
             if fmsg is None:
                 break
-            th = fmsg['status']['toolhead']
-            ptime = max(th['estimated_print_time'], th.get('print_time', 0.))
+            ptime = fmsg.get('print_time')
+            if ptime is None:
+                # Older logs without a print_time in the index
+                th = fmsg['status']['toolhead']
+                ptime = max(th['estimated_print_time'],
+                            th.get('print_time', 0.))
             if ptime > seek_time:
                 break
             for k, v in fmsg["status"].items():
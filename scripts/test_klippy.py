@@ -3,11 +3,12 @@
 # Copyright (C) 2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import sys, os, optparse, logging, subprocess
+import sys, os, errno, time, optparse, logging, subprocess, threading
 
 TEMP_GCODE_FILE = "_test_.gcode"
 TEMP_LOG_FILE = "_test_.log"
 TEMP_OUTPUT_FILE = "_test_output"
+TEMP_CONFIG_FILE = "_test_config.cfg"
 
 
 ######################################################################
@@ -37,6 +38,7 @@ class TestCase:
         config_fname = gcode_fname = dict_fnames = None
         should_fail = multi_tests = False
         gcode = []
+        self.config_updates = []
         f = open(self.fname, 'r')
         for line in f:
             cpos = line.find('#')
@@ -64,6 +66,8 @@ class TestCase:
                         mcu.strip(), self.relpath(fname.strip(), 'dict')))
             elif parts[0] == "GCODE":
                 gcode_fname = self.relpath(parts[1])
+            elif parts[0] == "CONFIG_UPDATE":
+                self.config_updates.append(self.relpath(parts[1]))
             elif parts[0] == "SHOULD_FAIL":
                 should_fail = True
             else:
@@ -90,6 +94,11 @@ class TestCase:
         # Call klippy
         sys.stderr.write("    Starting %s (%s)\n" % (
             self.fname, os.path.basename(config_fname)))
+        config_server = None
+        if self.config_updates:
+            config_server = ConfigServer(self.relpath(TEMP_CONFIG_FILE, 'temp'),
+                                         [config_fname] + self.config_updates)
+            config_fname = config_server.fifo_fname
         args = [ sys.executable, './klippy/klippy.py', config_fname,
                  '-i', gcode_fname, '-o', TEMP_OUTPUT_FILE, '-v' ]
         for df in dict_fnames:
@@ -97,6 +106,8 @@ class TestCase:
         if not self.verbose:
             args += ['-l', TEMP_LOG_FILE]
         res = subprocess.call(args)
+        if config_server is not None:
+            config_server.stop()
         is_fail = (should_fail and not res) or (not should_fail and res)
         if is_fail:
             if not self.verbose:
@@ -132,6 +143,54 @@ class TestCase:
         sys.stdout.write(data)
 
 
+# Provide each config version in turn to the readers of a fifo (the
+# config is read at startup and again on each RELOAD_CONFIG command)
+class ConfigServer:
+    def __init__(self, fifo_fname, config_fnames):
+        self.fifo_fname = fifo_fname
+        self.config_fnames = config_fnames
+        self.is_stopped = False
+        if os.path.exists(fifo_fname):
+            os.unlink(fifo_fname)
+        os.mkfifo(fifo_fname)
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+    def _serve(self):
+        for fname in self.config_fnames:
+            f = open(fname, 'r')
+            data = f.read()
+            f.close()
+            try:
+                f = open(self.fifo_fname, 'w')
+                if self.is_stopped:
+                    f.close()
+                    return
+                f.write(data)
+                f.close()
+            except (IOError, OSError) as e:
+                return
+            self._wait_reader_close()
+    def _wait_reader_close(self):
+        # Don't start the next version until the reader closed the fifo
+        while not self.is_stopped:
+            try:
+                fd = os.open(self.fifo_fname, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    return
+                raise
+            os.close(fd)
+            time.sleep(.001)
+    def stop(self):
+        # Wake up a writer that is still waiting for a reader
+        self.is_stopped = True
+        fd = os.open(self.fifo_fname, os.O_RDONLY | os.O_NONBLOCK)
+        self.thread.join()
+        os.close(fd)
+        os.unlink(self.fifo_fname)
+
+
 ######################################################################
 # Startup
 ######################################################################
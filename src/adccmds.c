@@ -93,16 +93,39 @@ DECL_COMMAND(command_query_analog_in,
              "query_analog_in oid=%c clock=%u sample_ticks=%u sample_count=%c"
              " rest_ticks=%u min_value=%hu max_value=%hu range_check_count=%c");
 
+// Check if an adc started at the same time as a finished one is still busy
+static int
+analog_in_batch_busy(uint32_t next_begin_time)
+{
+    uint8_t oid;
+    struct analog_in *a;
+    foreach_oid(oid, a, command_config_analog_in) {
+        if (a->state < a->sample_count
+            && a->next_begin_time + a->rest_time == next_begin_time)
+            return 1;
+    }
+    return 0;
+}
+
+// Maximum number of adc values in a single analog_in_states message
+#define ANALOG_IN_BATCH_MAX 16
+
 void
 analog_in_task(void)
 {
     if (!sched_check_wake(&analog_wake))
         return;
-    uint8_t oid;
+    // Report all finished adcs started at the same time in one message
+    uint8_t oid, count = 0, data[ANALOG_IN_BATCH_MAX * 3];
+    uint32_t batch_time = 0;
     struct analog_in *a;
     foreach_oid(oid, a, command_config_analog_in) {
         if (a->state != a->sample_count)
             continue;
+        if (count && a->next_begin_time != batch_time)
+            continue;
+        if (!count && analog_in_batch_busy(a->next_begin_time))
+            continue;
         irq_disable();
         if (a->state != a->sample_count) {
             irq_enable();
@@ -112,9 +135,19 @@ analog_in_task(void)
         uint32_t next_begin_time = a->next_begin_time;
         a->state++;
         irq_enable();
-        sendf("analog_in_state oid=%c next_clock=%u value=%hu"
-              , oid, next_begin_time, value);
+        batch_time = next_begin_time;
+        data[count*3] = oid;
+        data[count*3 + 1] = value;
+        data[count*3 + 2] = value >> 8;
+        if (++count >= ANALOG_IN_BATCH_MAX)
+            break;
     }
+    if (!count)
+        return;
+    sendf("analog_in_states next_clock=%u values=%*s"
+          , batch_time, count * 3, data);
+    // Check for other finished adcs
+    sched_wake_task(&analog_wake);
 }
 DECL_TASK(analog_in_task);
 